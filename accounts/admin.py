@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from . import models as accounts_models
+from videos import services as videos_services
 
 
 @admin.register(accounts_models.User)
@@ -11,8 +12,17 @@ class UserAdmin(BaseUserAdmin):
         ('Permissions', {'fields': ('is_staff', 'is_superuser')}),
     )
 
-    list_display = ['id', 'username', 'is_staff']
+    list_display = ['id', 'username', 'is_staff', 'deleted_at']
     list_display_links = ['id']
     list_filter = ['is_staff']
     search_fields = ['id', 'username']
     readonly_fields = ('id', 'is_superuser')
+
+    def delete_model(self, request, obj):
+        # Зависимые строки удаляются в фоне командой purge_deleted
+        videos_services.CascadeDeletion.mark_users(
+            accounts_models.User.objects.filter(pk=obj.pk)
+        )
+
+    def delete_queryset(self, request, queryset):
+        videos_services.CascadeDeletion.mark_users(queryset)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 hasher with the iteration count taken from the
+    ``PASSWORD_HASH_ITERATIONS`` setting.
+
+    The algorithm name is unchanged, so existing hashes stay valid. On a
+    successful login Django compares the stored iteration count with this
+    one and transparently rehashes the password when they differ.
+    """
+
+    @property
+    def iterations(self) -> int:
+        return (
+            settings.PASSWORD_HASH_ITERATIONS
+            or hashers.PBKDF2PasswordHasher.iterations
+        )
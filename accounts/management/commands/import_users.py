@@ -0,0 +1,212 @@
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts import models as accounts_models
+
+
+USERNAME_MAX_LENGTH = accounts_models.User._meta.get_field(
+    "username"
+).max_length
+
+
+def read_records(stream, fmt: str):
+    """
+    Stream user records from a CSV or NDJSON file.
+
+    CSV files need a header with ``username`` and ``password`` columns,
+    NDJSON files contain one object with the same keys per line.
+
+    Args:
+        stream: Text stream to read from.
+        fmt (str): ``csv`` or ``ndjson``.
+
+    Raises:
+        CommandError: If a line cannot be parsed.
+
+    Yields:
+        tuple[int, str, str]: Line number, username and password.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = {"username", "password"} - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(
+                f"В CSV нет колонок: {', '.join(sorted(missing))}"
+            )
+        for row in reader:
+            yield reader.line_num, row["username"] or "", row["password"] or ""
+        return
+
+    for line_num, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise CommandError(f"Строка {line_num}: некорректный JSON")
+        yield line_num, row.get("username") or "", row.get("password") or ""
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует пользователей из CSV или NDJSON (username, password). "
+        "Пароли хешируются в пуле процессов, пользователи создаются пачками; "
+        "повторяющиеся и уже существующие имена пропускаются и попадают "
+        "в отчёт"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="Файл с пользователями, '-' для stdin",
+        )
+        parser.add_argument(
+            "--format",
+            choices=("csv", "ndjson"),
+            default=None,
+            help="По умолчанию определяется по расширению файла",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Число процессов для хеширования паролей",
+        )
+        parser.add_argument(
+            "--report",
+            default=None,
+            help="CSV-файл для пропущенных строк: line, username, reason",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "csv" if path.endswith(".csv") else "ndjson"
+
+        self.created = 0
+        self.skipped = 0
+        # Имена, записанные этим запуском: их повторы дальше по файлу —
+        # дубликаты в файле, а не существующие пользователи
+        self.imported = set()
+        self.report = None
+        report_file = None
+        if options["report"]:
+            report_file = open(options["report"], "w", newline="")
+            self.report = csv.writer(report_file)
+            self.report.writerow(("line", "username", "reason"))
+
+        stream = sys.stdin if path == "-" else open(path, newline="")
+        try:
+            with ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=django.setup
+            ) as pool:
+                self.run(
+                    read_records(stream, fmt), pool,
+                    options["chunk_size"], options["workers"],
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if report_file is not None:
+                report_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано пользователей: {self.created}, "
+            f"пропущено строк: {self.skipped}"
+        ))
+
+    def run(self, records, pool, chunk_size: int, workers: int) -> None:
+        """
+        Hash the next chunk while the previous one is being written, so at
+        most two chunks are held in memory.
+        """
+        pending = None
+        while chunk := list(islice(records, chunk_size)):
+            exclude = set(pending[0]) if pending else set()
+            chunk = self.deduplicate(chunk, exclude)
+            hashes = pool.map(
+                make_password,
+                [password for _, password in chunk.values()],
+                chunksize=max(1, len(chunk) // workers),
+            )
+            if pending:
+                self.write(*pending)
+            pending = (chunk, hashes)
+        if pending:
+            self.write(*pending)
+
+    def deduplicate(self, chunk: list, exclude: set[str]) -> dict:
+        """
+        Drop invalid rows and usernames that repeat within the chunk, are
+        still being written, were written by this run or already exist.
+
+        Returns:
+            dict[str, tuple[int, str]]: Line number and password per username.
+        """
+        rows = {}
+        for line_num, username, password in chunk:
+            if not username or not password:
+                self.skip(line_num, username, "empty")
+            elif len(username) > USERNAME_MAX_LENGTH:
+                self.skip(line_num, username, "too long")
+            elif (
+                username in rows or username in exclude
+                or username in self.imported
+            ):
+                self.skip(line_num, username, "duplicate in file")
+            else:
+                rows[username] = (line_num, password)
+
+        existing = accounts_models.User.objects.filter(
+            username__in=list(rows)
+        ).values_list("username", flat=True)
+        for username in existing:
+            self.skip(rows.pop(username)[0], username, "already exists")
+        return rows
+
+    def write(self, chunk: dict, hashes) -> None:
+        users = [
+            accounts_models.User(username=username, password=password)
+            for username, password in zip(chunk, hashes)
+        ]
+        with transaction.atomic():
+            # Имя могли занять параллельно, такие строки пропускает
+            # уникальный индекс
+            accounts_models.User.objects.bulk_create(
+                users, batch_size=1000, ignore_conflicts=True
+            )
+            stored = dict(
+                accounts_models.User.objects.filter(
+                    username__in=list(chunk)
+                ).values_list("username", "password")
+            )
+        for user in users:
+            if stored.get(user.username) == user.password:
+                self.created += 1
+                self.imported.add(user.username)
+            else:
+                line_num = chunk[user.username][0]
+                self.skip(line_num, user.username, "already exists")
+        self.stdout.write(
+            f"Создано: {self.created}, пропущено: {self.skipped}"
+        )
+
+    def skip(self, line_num: int, username: str, reason: str) -> None:
+        self.skipped += 1
+        if self.report is not None:
+            self.report.writerow((line_num, username, reason))
@@ -13,6 +13,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         username: Unique username for the user.
         is_active: Designates whether this user account is active.
         is_staff: Designates whether the user can access the admin site.
+        deleted_at: Set when the user is scheduled for deletion; videos and
+            likes are purged in the background.
 
     Class Attributes:
         USERNAME_FIELD: Field used for authentication.
@@ -24,6 +26,7 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     USERNAME_FIELD = "username"
     REQUIRED_FIELDS = []
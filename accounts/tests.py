@@ -1,3 +1,117 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts import models as accounts_models
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class PasswordHashingTests(TestCase):
+    """
+    Passwords are hashed with the configured PBKDF2 iterations and stored
+    hashes follow a changed count on the next login.
+    """
+
+    def test_iterations_from_settings(self):
+        self.assertTrue(
+            make_password("secret").startswith("pbkdf2_sha256$1000$")
+        )
+        with override_settings(PASSWORD_HASH_ITERATIONS=0):
+            self.assertFalse(
+                make_password("secret").startswith("pbkdf2_sha256$1000$")
+            )
+
+    def test_login_rehashes_password(self):
+        user = accounts_models.User.objects.create_user(
+            username="viewer", password="secret"
+        )
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$1000$"))
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            response = APIClient().post(
+                "/v1/accounts/auth/token/",
+                {"username": "viewer", "password": "secret"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$2000$"))
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class ImportUsersTests(TestCase):
+    """
+    Users are imported in chunks, and every skipped line is reported with
+    its reason.
+    """
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        accounts_models.User.objects.create_user(
+            username="existing", password="secret"
+        )
+
+    def import_users(self, name: str, content: str) -> list[list[str]]:
+        path = os.path.join(self.directory, name)
+        report = os.path.join(self.directory, "report.csv")
+        with open(path, "w") as users_file:
+            users_file.write(content)
+        call_command(
+            "import_users", path, "--chunk-size", "2", "--workers", "1",
+            "--report", report, stdout=io.StringIO(),
+        )
+        with open(report, newline="") as report_file:
+            return list(csv.reader(report_file))
+
+    def test_csv_duplicates_are_reported(self):
+        report = self.import_users("users.csv", "\n".join([
+            "username,password",
+            "alice,pw1",
+            "alice,pw2",
+            "bob,pw3",
+            "existing,pw4",
+            "bob,pw5",
+            ",pw6",
+            f"{'x' * 200},pw7",
+            "carol,pw8",
+            "alice,pw9",
+        ]) + "\n")
+
+        # По две строки в пачке: bob в строке 6 ещё записывается вместе с
+        # предыдущей пачкой, alice в строке 10 записана этим же импортом
+        self.assertEqual(report, [
+            ["line", "username", "reason"],
+            ["3", "alice", "duplicate in file"],
+            ["5", "existing", "already exists"],
+            ["6", "bob", "duplicate in file"],
+            ["7", "", "empty"],
+            ["8", "x" * 200, "too long"],
+            ["10", "alice", "duplicate in file"],
+        ])
+        alice = accounts_models.User.objects.get(username="alice")
+        self.assertTrue(alice.check_password("pw1"))
+        self.assertEqual(
+            sorted(
+                accounts_models.User.objects.values_list(
+                    "username", flat=True
+                )
+            ),
+            ["alice", "bob", "carol", "existing"],
+        )
+
+    def test_ndjson(self):
+        report = self.import_users("users.ndjson", "\n".join([
+            '{"username": "dave", "password": "pw1"}',
+            "",
+            '{"username": "dave", "password": "pw2"}',
+        ]))
+        self.assertEqual(report[1:], [["3", "dave", "duplicate in file"]])
+        self.assertTrue(
+            accounts_models.User.objects.filter(username="dave").exists()
+        )
@@ -6,6 +6,8 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 
+from videos import views as videos_views
+
 
 urlpatterns = [
     path(
@@ -23,4 +25,9 @@ urlpatterns = [
         UserViewSet.as_view({'post': 'create'}),
         name='user-register'
     ),
+    path(
+        'me/likes/',
+        videos_views.MyLikesView.as_view(),
+        name='my-likes'
+    ),
 ]
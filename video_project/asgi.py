@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'video_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Live like counts are streamed without Django's per-request machinery
+from videos import live as videos_live  # noqa: E402
+
+application = videos_live.LikeCountStreamApp(django_application)
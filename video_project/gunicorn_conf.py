@@ -0,0 +1,98 @@
+"""
+Gunicorn settings shared by every server of the project::
+
+    gunicorn -c python:video_project.gunicorn_conf \
+        video_project.wsgi:application
+
+Environment variables:
+
+``GUNICORN_WORKER_CLASS``
+    ``sync`` (default), ``gthread`` or ``uvicorn``; ``uvicorn`` serves
+    ``video_project.asgi:application``.
+``GUNICORN_WORKERS``
+    Number of workers, by default derived from the CPU count and the
+    worker class.
+``GUNICORN_THREADS``
+    Threads per ``gthread`` worker, 4 by default.
+``GUNICORN_PRELOAD``
+    ``True`` (default) loads and warms up the application in the master, so
+    workers share its memory copy-on-write.
+``GUNICORN_MAX_REQUESTS``
+    Restart a worker after this many requests, 0 (never) by default.
+
+Code changes need a full restart with preload: ``HUP`` forks new workers
+from the already loaded master.
+"""
+
+import gc
+import multiprocessing
+import os
+
+
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "uvicorn": "uvicorn.workers.UvicornWorker",
+}
+
+_worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+if _worker_class not in WORKER_CLASSES:
+    raise RuntimeError(
+        f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}"
+    )
+_cpus = multiprocessing.cpu_count()
+# sync: воркер простаивает на запросах к БД, поэтому процессов больше ядер;
+# gthread: простои закрывают потоки; uvicorn: один цикл событий на ядро
+_default_workers = {
+    "sync": 2 * _cpus + 1,
+    "gthread": _cpus + 1,
+    "uvicorn": _cpus,
+}[_worker_class]
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = WORKER_CLASSES[_worker_class]
+workers = int(os.environ.get("GUNICORN_WORKERS", _default_workers))
+threads = (
+    int(os.environ.get("GUNICORN_THREADS", 4))
+    if _worker_class == "gthread" else 1
+)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "True") == "True"
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = timeout
+# Heartbeat-файлы воркеров в памяти, а не на overlayfs контейнера
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def _warm_up() -> None:
+    from video_project import warmup
+
+    warmup.warm_up()
+    # Объекты, созданные до этого момента, сборщик мусора больше не
+    # обходит и не трогает их заголовки, так что страницы памяти мастера
+    # остаются общими с воркерами
+    gc.collect()
+    gc.freeze()
+
+
+def when_ready(server):
+    # С preload приложение уже загружено в мастере, воркеры ещё не созданы
+    if server.cfg.preload_app:
+        _warm_up()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        _warm_up()
+
+
+def child_exit(server, worker):
+    # Снимок метрик вышедшего воркера больше не обновится, а с
+    # max_requests воркеры перезапускаются постоянно
+    directory = os.environ.get("METRICS_DIR")
+    if directory:
+        from video_project import metrics
+
+        metrics.remove_snapshot(directory, worker.pid)
@@ -0,0 +1,307 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+QUERIES_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    "total_seconds": SECONDS_BUCKETS,
+    "db_seconds": SECONDS_BUCKETS,
+    "serialize_seconds": SECONDS_BUCKETS,
+    "render_seconds": SECONDS_BUCKETS,
+    "queries": QUERIES_BUCKETS,
+}
+
+
+class RequestStats:
+    """
+    Timings collected while a single request is being handled.
+
+    Attributes:
+        queries (int): Number of executed SQL statements.
+        db (float): Seconds spent executing SQL.
+        serialize (float): Seconds spent in serializer to_representation.
+        render (float): Seconds spent rendering the response body.
+    """
+    __slots__ = ("queries", "db", "serialize", "render", "_depth")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self._depth = 0
+
+
+_current: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def current() -> RequestStats | None:
+    """
+    Return the stats of the request being handled, if any.
+    """
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """
+    Collect stats for the enclosed block as the current request.
+
+    Yields:
+        RequestStats: Stats filled in while the block runs.
+    """
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Add the time of the enclosed block to the current serializer time.
+
+    Nested blocks (for example nested serializers) are counted once.
+    """
+    stats = _current.get()
+    if stats is None or stats._depth:
+        yield
+        return
+    stats._depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize += time.perf_counter() - started
+        stats._depth -= 1
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting statements and their duration.
+    """
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db += time.perf_counter() - started
+        stats.queries += 1
+
+
+class TimedSerializerMixin:
+    """
+    Serializer mixin that records representation time of the current
+    request.
+    """
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed upper bounds.
+
+    Attributes:
+        buckets (tuple): Upper bounds of the buckets.
+        counts (list[int]): Observations per bucket, the last one is +Inf.
+        total (float): Sum of observed values.
+        count (int): Number of observations.
+    """
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, counts: list[int], total: float, count: int) -> None:
+        for index, value in enumerate(counts):
+            self.counts[index] += value
+        self.total += total
+        self.count += count
+
+
+class Registry:
+    """
+    Process-wide histograms per view and metric.
+
+    When ``METRICS_DIR`` is set, every process periodically writes a
+    snapshot there and :meth:`render` merges the snapshots of all workers,
+    so a scrape that lands on any worker sees the whole server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+        self._dumped_at = 0.0
+
+    def record(self, view: str, stats: RequestStats, total: float) -> None:
+        """
+        Add one request to the histograms of its view.
+
+        Args:
+            view (str): Resolved URL name of the request.
+            stats (RequestStats): Stats collected for the request.
+            total (float): Total handling time in seconds.
+        """
+        values = {
+            "total_seconds": total,
+            "db_seconds": stats.db,
+            "serialize_seconds": stats.serialize,
+            "render_seconds": stats.render,
+            "queries": stats.queries,
+        }
+        with self._lock:
+            for metric, value in values.items():
+                key = (view, metric)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(
+                        METRICS[metric]
+                    )
+                histogram.observe(value)
+        directory = settings.METRICS_DIR
+        if directory and time.monotonic() - self._dumped_at > 5:
+            self.dump(directory)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                f"{view}|{metric}": [h.counts, h.total, h.count]
+                for (view, metric), h in self._histograms.items()
+            }
+
+    def dump(self, directory: str) -> None:
+        """
+        Atomically write this process' histograms into a directory.
+
+        Args:
+            directory (str): Directory shared by all workers.
+        """
+        self._dumped_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(f"{path}.tmp", path)
+
+    def collect_all(self) -> dict[tuple[str, str], Histogram]:
+        """
+        Merge histograms of this process and of other workers' snapshots.
+
+        Returns:
+            dict[tuple[str, str], Histogram]: Histograms per view and metric.
+        """
+        snapshots = [self.snapshot()]
+        directory = settings.METRICS_DIR
+        if directory and os.path.isdir(directory):
+            own = f"{os.getpid()}.json"
+            for entry in os.scandir(directory):
+                if entry.name == own or not entry.name.endswith(".json"):
+                    continue
+                # Снимок воркера, убитого без child_exit, не обновится
+                pid = entry.name[:-5]
+                if pid.isdigit() and not _is_alive(int(pid)):
+                    remove_snapshot(directory, int(pid))
+                    continue
+                try:
+                    with open(entry.path) as snapshot_file:
+                        snapshots.append(json.load(snapshot_file))
+                except (OSError, ValueError):
+                    continue
+
+        merged = {}
+        for snapshot in snapshots:
+            for key, (counts, total, count) in snapshot.items():
+                view, metric = key.split("|", 1)
+                histogram = merged.get((view, metric))
+                if histogram is None:
+                    histogram = merged[(view, metric)] = Histogram(
+                        METRICS[metric]
+                    )
+                histogram.merge(counts, total, count)
+        return merged
+
+    def render(self) -> str:
+        """
+        Render all histograms in the Prometheus text exposition format.
+
+        Returns:
+            str: Metrics text.
+        """
+        histograms = self.collect_all()
+        lines = []
+        for metric in METRICS:
+            name = f"http_request_{metric}"
+            lines.append(f"# TYPE {name} histogram")
+            for (view, key), histogram in sorted(histograms.items()):
+                if key != metric:
+                    continue
+                cumulative = 0
+                bounds = [*map(str, histogram.buckets), "+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                        f"{cumulative}"
+                    )
+                lines.append(f'{name}_sum{{view="{view}"}} {histogram.total}')
+                lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_snapshot(directory: str, pid: int) -> None:
+    """
+    Delete the snapshot of a process that has exited.
+
+    Called from the gunicorn ``child_exit`` hook, so requests of a restarted
+    worker are not counted forever. Snapshots of processes that died
+    without the hook are skipped and removed by :meth:`Registry.collect_all`.
+
+    Args:
+        directory (str): Directory shared by all workers.
+        pid (int): Id of the exited process.
+    """
+    try:
+        os.remove(os.path.join(directory, f"{pid}.json"))
+    except FileNotFoundError:
+        pass
+
+
+registry = Registry()
@@ -0,0 +1,120 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from video_project import metrics
+from video_project import profiling
+
+
+class PerformanceMetricsMiddleware:
+    """
+    Records query count, DB time, serializer time and total time per
+    resolved URL name.
+
+    Staff users additionally receive the timings of their own request in a
+    ``Server-Timing`` header. Aggregated histograms are exposed by the
+    metrics endpoint.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with metrics.collect() as stats, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.db_execute_wrapper)
+                )
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unresolved"
+        metrics.registry.record(view, stats, total)
+
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            response["Server-Timing"] = (
+                f"db;dur={stats.db * 1000:.2f};"
+                f'desc="{stats.queries} queries", '
+                f"serialize;dur={stats.serialize * 1000:.2f}, "
+                f"render;dur={stats.render * 1000:.2f}, "
+                f"total;dur={total * 1000:.2f}"
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns
+        stats = metrics.current()
+        if stats is not None:
+            render_started = time.perf_counter()
+
+            def finish_render(rendered):
+                stats.render += time.perf_counter() - render_started
+
+            response.add_post_render_callback(finish_render)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests carrying a staff profiling token, and a
+    ``PROFILING_SAMPLE_RATE`` share of all requests.
+
+    A profiled response carries the id of its stored profile in the
+    ``X-Profile-Id`` header. Requests with an invalid or expired token are
+    handled as usual, without profiling.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def get_profile(self, request) -> profiling.RequestProfile | None:
+        token = request.headers.get("X-Profile") or request.GET.get("profile")
+        if token:
+            payload = profiling.read_token(token)
+            if (
+                payload is None
+                or payload.get("mode") not in profiling.MODES
+                # Токен перестаёт действовать вместе с правами staff
+                or not get_user_model().objects.filter(
+                    id=payload.get("user"), is_staff=True, is_active=True
+                ).exists()
+            ):
+                return None
+            return profiling.RequestProfile(
+                payload["mode"], "token", payload["user"]
+            )
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate and random.random() < rate:
+            return profiling.RequestProfile(settings.PROFILING_MODE, "sampled")
+        return None
+
+    def __call__(self, request):
+        profile = self.get_profile(request)
+        if profile is None:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(
+                    profile.execute_wrapper(connection.alias)
+                ))
+            with profile.run() as result:
+                response = self.get_response(request)
+        total = time.perf_counter() - started
+        response["X-Profile-Id"] = profile.save(
+            result["body"], request, response, total
+        )
+        return response
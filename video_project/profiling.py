@@ -0,0 +1,297 @@
+"""
+On-demand profiling of single requests.
+
+A staff user gets a signed token from the profiles endpoint and sends it in
+the ``X-Profile`` header or the ``profile`` query parameter of any request.
+:class:`~video_project.middleware.ProfilingMiddleware` then runs the request
+under a profiler and records every SQL statement with its duration. Without
+a token nothing is done beyond a header lookup; ``PROFILING_SAMPLE_RATE``
+additionally profiles that share of all requests.
+
+Two profilers are available:
+
+- ``sample``: a thread reads the stack of the request thread every
+  ``PROFILING_INTERVAL`` seconds. The profile is in the folded stack format
+  read by speedscope, flamegraph.pl and inferno. Overhead does not depend on
+  the number of calls.
+- ``cprofile``: cProfile traces every call. The profile is a pstats dump for
+  snakeviz or ``python -m pstats``; exact call counts cost more overhead.
+  One request per process is traced at a time; requests arriving meanwhile
+  are sampled instead.
+
+Profiles are files in ``PROFILING_DIR``, shared by all workers like the
+metrics snapshots; the newest ``PROFILING_MAX_PROFILES`` are kept.
+"""
+
+import cProfile
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+
+MODES = ("sample", "cprofile")
+TOKEN_SALT = "video_project.profiling"
+FORMATS = {
+    "sample": ("folded", "text/plain; charset=utf-8"),
+    "cprofile": ("prof", "application/octet-stream"),
+}
+
+# С Python 3.12 cProfile использует sys.monitoring, где профилировщик один
+# на процесс, и второй профиль в другом потоке не запустится
+_cprofile_lock = threading.Lock()
+
+
+def make_token(user_id: int, mode: str = "sample") -> str:
+    """
+    Return a signed profiling token of a staff user.
+
+    Args:
+        user_id (int): Staff user requesting profiles.
+        mode (str): One of :data:`MODES`.
+    """
+    return signing.dumps({"user": user_id, "mode": mode}, salt=TOKEN_SALT)
+
+
+def read_token(token: str) -> dict | None:
+    """
+    Return the payload of a valid, unexpired token, or None.
+    """
+    try:
+        return signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.PROFILING_TOKEN_SECONDS
+        )
+    except signing.BadSignature:
+        return None
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the stacks of one thread, sampled at a fixed interval.
+
+    The sampler needs the GIL to read a stack, so a request thread running
+    pure Python is sampled at most every ``sys.getswitchinterval()``
+    seconds; waits on the database and other I/O are sampled at the
+    interval.
+
+    Attributes:
+        stacks (Counter): Samples per folded stack, root first.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = (
+                        f"{frame.f_globals.get('__name__', '?')}."
+                        f"{code.co_qualname}"
+                    )
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> bytes:
+        """
+        Stop sampling and return the profile in the folded stack format.
+        """
+        self._stop_event.set()
+        self.join()
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.items()
+        ).encode()
+
+
+class RequestProfile:
+    """
+    Profile of one request being handled.
+
+    Attributes:
+        mode (str): One of :data:`MODES`; ``cprofile`` turns into ``sample``
+            when another request of the process is being traced.
+        reason (str): ``token`` or ``sampled``.
+        user_id (int | None): Staff user of the token.
+        queries (list[dict]): SQL statements with alias and milliseconds,
+            at most ``PROFILING_MAX_QUERIES``.
+        query_count (int): Number of executed statements.
+        db (float): Seconds spent executing SQL.
+    """
+
+    def __init__(self, mode: str, reason: str, user_id: int | None = None):
+        self.mode = mode
+        self.reason = reason
+        self.user_id = user_id
+        self.queries = []
+        self.query_count = 0
+        self.db = 0.0
+
+    def execute_wrapper(self, alias: str):
+        """
+        Return a database execute wrapper recording statements of an alias.
+        """
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.db += elapsed
+                self.query_count += 1
+                # Параметры не сохраняем: в них бывают персональные данные
+                if len(self.queries) < settings.PROFILING_MAX_QUERIES:
+                    self.queries.append({
+                        "alias": alias,
+                        "sql": sql,
+                        "many": many,
+                        "ms": round(elapsed * 1000, 3),
+                    })
+        return wrapper
+
+    @contextmanager
+    def run(self):
+        """
+        Profile the enclosed block.
+
+        Yields:
+            dict: Filled with the profile body once the block has run.
+        """
+        result = {}
+        if self.mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+            try:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    yield result
+                finally:
+                    profiler.disable()
+                    profiler.create_stats()
+                    result["body"] = marshal.dumps(profiler.stats)
+            finally:
+                _cprofile_lock.release()
+        else:
+            # Расширение и формат сохранённого профиля следуют режиму
+            self.mode = "sample"
+            sampler = StackSampler(
+                threading.get_ident(), settings.PROFILING_INTERVAL
+            )
+            sampler.start()
+            try:
+                yield result
+            finally:
+                result["body"] = sampler.stop()
+
+    def save(self, body: bytes, request, response, total: float) -> str:
+        """
+        Store the profile and return its id.
+        """
+        profile_id = (
+            f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        )
+        extension, _ = FORMATS[self.mode]
+        # Токен из адреса не должен попасть в список профилей
+        query = request.GET.copy()
+        query.pop("profile", None)
+        metadata = {
+            "id": profile_id,
+            "created_at": timezone.now().isoformat(),
+            "method": request.method,
+            "path": request.path + (f"?{query.urlencode()}" if query else ""),
+            "status": response.status_code,
+            "mode": self.mode,
+            "reason": self.reason,
+            "user": self.user_id,
+            "total_ms": round(total * 1000, 3),
+            "db_ms": round(self.db * 1000, 3),
+            "query_count": self.query_count,
+            "queries": self.queries,
+        }
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, profile_id)
+        with open(f"{path}.{extension}", "wb") as profile_file:
+            profile_file.write(body)
+        # Метаданные пишутся последними: профиль виден только целиком
+        with open(f"{path}.tmp", "w") as metadata_file:
+            json.dump(metadata, metadata_file)
+        os.replace(f"{path}.tmp", f"{path}.json")
+        prune(directory, settings.PROFILING_MAX_PROFILES)
+        return profile_id
+
+
+def prune(directory: str, keep: int) -> None:
+    """
+    Delete all but the newest ``keep`` profiles of a directory.
+    """
+    ids = sorted(
+        entry.name[:-5] for entry in os.scandir(directory)
+        if entry.name.endswith(".json")
+    )
+    for profile_id in ids[:max(len(ids) - keep, 0)]:
+        for extension in ("json", *(ext for ext, _ in FORMATS.values())):
+            try:
+                os.remove(os.path.join(directory, f"{profile_id}.{extension}"))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> list[dict]:
+    """
+    Return the metadata of stored profiles, newest first, without queries.
+    """
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(
+        (entry.name for entry in os.scandir(directory)
+         if entry.name.endswith(".json")),
+        reverse=True,
+    ):
+        metadata = load(name[:-5])
+        if metadata is not None:
+            metadata.pop("queries")
+            profiles.append(metadata)
+    return profiles
+
+
+def load(profile_id: str) -> dict | None:
+    """
+    Return the metadata of a stored profile, or None.
+    """
+    path = os.path.join(settings.PROFILING_DIR, f"{profile_id}.json")
+    try:
+        with open(path) as metadata_file:
+            return json.load(metadata_file)
+    except (OSError, ValueError):
+        return None
+
+
+def body_path(metadata: dict) -> str:
+    """
+    Return the path of the profile body described by metadata.
+    """
+    extension, _ = FORMATS[metadata["mode"]]
+    return os.path.join(
+        settings.PROFILING_DIR, f"{metadata['id']}.{extension}"
+    )
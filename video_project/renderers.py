@@ -0,0 +1,171 @@
+"""
+Fast renderers and cached, precompressed response bodies.
+
+:class:`FastJSONRenderer` encodes with orjson when it is installed and falls
+back to the standard ``JSONRenderer`` otherwise; :class:`MessagePackRenderer`
+answers ``Accept: application/msgpack`` when msgpack is installed. Both are
+in the ``fast`` extra.
+
+:func:`cached_response` keeps the rendered body of a large response in the
+cache for ``PAYLOAD_CACHE_SECONDS``, per path, query and media type,
+together with its gzip and, with the brotli package, brotli encodings. A
+repeated request costs one cache read: nothing is queried, serialized,
+encoded or compressed. Neither nginx nor Django compress responses here,
+so the encoding is picked from ``Accept-Encoding`` by the view itself.
+"""
+
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import renderers
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer encoding with orjson.
+
+    Output matches the standard renderer with ``COMPACT_JSON`` and
+    ``UNICODE_JSON``; requests asking for an ``indent`` and processes
+    without orjson use the standard renderer.
+    """
+
+    OPTIONS = (
+        (orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z) if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        if data is None:
+            return b''
+        ret = orjson.dumps(
+            data, default=self.encoder_class().default, option=self.OPTIONS
+        )
+        # Как и стандартный рендерер, экранируем разделители строк для JS
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return ret
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    Renderer for MessagePack, negotiated with ``Accept:
+    application/msgpack`` or ``?format=msgpack``.
+
+    Values msgpack cannot pack are converted like the JSON renderer does,
+    so datetimes and decimals become strings.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(
+            data, default=renderers.JSONRenderer.encoder_class().default
+        )
+
+
+def _encodings(body: bytes) -> dict[str, bytes]:
+    encodings = {'identity': body}
+    if len(body) >= settings.PAYLOAD_COMPRESS_MIN_BYTES:
+        encodings['gzip'] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            encodings['br'] = brotli.compress(body, quality=5)
+    return encodings
+
+
+def _accepted_encoding(request: Request, encodings: dict) -> str:
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    for encoding in ('br', 'gzip'):
+        if encoding in encodings and encoding in accepted:
+            return encoding
+    return 'identity'
+
+
+def cached_response(view, request: Request, build):
+    """
+    Return the response of a GET request from the cache of rendered
+    bodies, calling ``build()`` for the data on a miss.
+
+    Call it from the handler, after authentication and permissions have
+    run: cached bodies are shared by every user allowed to see the view,
+    so use it only for views whose data does not depend on the user.
+
+    Args:
+        view (APIView): View handling the request.
+        request (Request): DRF request with its negotiated renderer.
+        build (Callable[[], Any]): Returns the response data.
+
+    Returns:
+        HttpResponse | Response: Cached body in the best accepted
+        encoding, or a plain Response for the browsable API and when
+        caching is disabled.
+    """
+    renderer = request.accepted_renderer
+    timeout = settings.PAYLOAD_CACHE_SECONDS
+    if not timeout or isinstance(renderer, renderers.BrowsableAPIRenderer):
+        return Response(build())
+
+    key = 'payload:' + hashlib.sha256(
+        f'{request.accepted_media_type}|{request.get_full_path()}'.encode()
+    ).hexdigest()
+    payload = cache.get(key)
+    if payload is None:
+        body = renderer.render(
+            build(), request.accepted_media_type,
+            view.get_renderer_context(),
+        )
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        payload = (content_type, _encodings(body))
+        cache.set(key, payload, timeout)
+
+    content_type, encodings = payload
+    encoding = _accepted_encoding(request, encodings)
+    response = HttpResponse(encodings[encoding], content_type=content_type)
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    if len(encodings) > 1:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,86 @@
+"""
+OpenAPI documentation views.
+
+drf_yasg is imported only when documentation is requested, and the schema
+is generated at most once per process. In production the schema is
+generated at deploy time by ``manage.py generate_openapi`` and served as a
+static file.
+"""
+
+import functools
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from rest_framework import permissions
+
+
+API_INFO = {
+    "title": "Barter API",
+    "default_version": "v1",
+    "description": "Документация API",
+}
+
+
+def generate_schema(fmt: str = "json") -> bytes:
+    """
+    Generate the public OpenAPI document.
+
+    The document is built without a request, so it does not depend on the
+    caller and can be cached or stored as a file.
+
+    Args:
+        fmt (str): Output format, ``json`` or ``yaml``.
+
+    Returns:
+        bytes: Encoded OpenAPI document.
+    """
+    from drf_yasg import openapi
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    generator = OpenAPISchemaGenerator(openapi.Info(**API_INFO))
+    schema = generator.get_schema(request=None, public=True)
+    codec = OpenAPICodecYaml if fmt == "yaml" else OpenAPICodecJson
+    return codec(validators=[]).encode(schema)
+
+
+@functools.cache
+def _cached_schema() -> bytes:
+    return generate_schema()
+
+
+@functools.cache
+def _docs_view():
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
+    schema_view = get_schema_view(
+        openapi.Info(**API_INFO),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+    return schema_view.with_ui('swagger', cache_timeout=0)
+
+
+def schema_json_view(request):
+    """
+    Serve the OpenAPI document.
+
+    The pre-generated file is used when present, otherwise the schema is
+    generated on the first request and memoized for the process lifetime.
+    """
+    path = settings.OPENAPI_SCHEMA_PATH
+    if os.path.exists(path):
+        return FileResponse(open(path, 'rb'), content_type='application/json')
+    return HttpResponse(_cached_schema(), content_type='application/json')
+
+
+def docs_view(request, *args, **kwargs):
+    """
+    Serve the Swagger UI page, which loads the schema from
+    :func:`schema_json_view`.
+    """
+    if request.GET.get('format') == 'openapi':
+        return schema_json_view(request)
+    return _docs_view()(request, *args, **kwargs)
@@ -1,3 +1,4 @@
+import importlib.util
 import os
 from datetime import timedelta
 from os.path import dirname, join
@@ -40,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'video_project.middleware.ProfilingMiddleware',
+    'video_project.middleware.PerformanceMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +90,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHERS = [
+    'accounts.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# PBKDF2 iterations for new and rehashed passwords, 0 keeps Django's default.
+# Stored hashes with a different count are rehashed on the next login.
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 0))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -109,6 +124,110 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Large uploads are hashed while they are written to the temporary file
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'videos.storage.HashingUploadHandler',
+]
+
+# Unreferenced media files younger than this are not deleted, a concurrent
+# upload of identical content may be about to reference them
+MEDIA_GC_GRACE_SECONDS = int(os.environ.get('MEDIA_GC_GRACE_SECONDS', 3600))
+
+# How long clients and proxies may reuse a streaming manifest without
+# revalidating its ETag
+MANIFEST_CACHE_SECONDS = int(os.environ.get('MANIFEST_CACHE_SECONDS', 60))
+
+# Maximum number of ids in a video multi-get or like-count request
+VIDEO_MULTI_GET_MAX_IDS = int(os.environ.get('VIDEO_MULTI_GET_MAX_IDS', 100))
+
+# Maximum number of ids in a bulk publish request; an owner's whole catalogue
+# may be changed at once and is processed in batches
+VIDEO_PUBLICATION_MAX_IDS = int(
+    os.environ.get('VIDEO_PUBLICATION_MAX_IDS', 10_000)
+)
+
+# How long like counts may be served from the cache; 0 disables caching
+LIKE_COUNTS_CACHE_SECONDS = int(
+    os.environ.get('LIKE_COUNTS_CACHE_SECONDS', 2)
+)
+
+# Rendered bodies of large staff responses (video ids, statistics) are
+# cached for this long with their gzip/brotli encodings; 0 disables it.
+# Bodies shorter than PAYLOAD_COMPRESS_MIN_BYTES are sent uncompressed.
+PAYLOAD_CACHE_SECONDS = int(os.environ.get('PAYLOAD_CACHE_SECONDS', 10))
+PAYLOAD_COMPRESS_MIN_BYTES = int(
+    os.environ.get('PAYLOAD_COMPRESS_MIN_BYTES', 1024)
+)
+
+# Shared bitmap of published video ids (videos.bitmap) letting the like and
+# visibility paths reject unpublished ids without a query. Point every
+# process of a host at the same file on tmpfs; unset disables it.
+PUBLISHED_BITMAP_PATH = os.environ.get('PUBLISHED_BITMAP_PATH')
+PUBLISHED_BITMAP_SYNC_SECONDS = float(
+    os.environ.get('PUBLISHED_BITMAP_SYNC_SECONDS', 5)
+)
+PUBLISHED_BITMAP_OVERLAP_SECONDS = float(
+    os.environ.get('PUBLISHED_BITMAP_OVERLAP_SECONDS', 30)
+)
+PUBLISHED_BITMAP_REBUILD_SECONDS = float(
+    os.environ.get('PUBLISHED_BITMAP_REBUILD_SECONDS', 3600)
+)
+
+# In-process NumPy snapshot for owner statistics (videos.analytics); needs
+# the optional numpy dependency. Each process refreshes it from videos
+# updated since its watermark at most every OWNER_STATS_REFRESH_SECONDS.
+OWNER_STATS_ENGINE = os.environ.get('OWNER_STATS_ENGINE', 'False') == 'True'
+OWNER_STATS_REFRESH_SECONDS = float(
+    os.environ.get('OWNER_STATS_REFRESH_SECONDS', 5)
+)
+OWNER_STATS_OVERLAP_SECONDS = float(
+    os.environ.get('OWNER_STATS_OVERLAP_SECONDS', 30)
+)
+OWNER_STATS_FULL_REFRESH_SECONDS = float(
+    os.environ.get('OWNER_STATS_FULL_REFRESH_SECONDS', 3600)
+)
+
+# Related videos by co-likes (videos.recommendations); needs the optional
+# numpy dependency. Users with more likes than RELATED_VIDEOS_MAX_USER_LIKES
+# are left out of the similarity, and one computation step expands at most
+# RELATED_VIDEOS_CHUNK_PAIRS (video, video) pairs in memory.
+RELATED_VIDEOS_TOP_K = int(os.environ.get('RELATED_VIDEOS_TOP_K', 20))
+RELATED_VIDEOS_MIN_CO_LIKES = int(
+    os.environ.get('RELATED_VIDEOS_MIN_CO_LIKES', 2)
+)
+RELATED_VIDEOS_MAX_USER_LIKES = int(
+    os.environ.get('RELATED_VIDEOS_MAX_USER_LIKES', 1000)
+)
+RELATED_VIDEOS_CHUNK_PAIRS = int(
+    os.environ.get('RELATED_VIDEOS_CHUNK_PAIRS', 5_000_000)
+)
+
+# Live like counts (videos.live): broker between the outbox consumer and
+# ASGI workers, coalescing window and keep-alive interval of SSE streams
+LIVE_LIKES_BROKER = os.environ.get(
+    'LIVE_LIKES_BROKER', 'videos.live.InMemoryBroker'
+)
+LIVE_LIKES_WINDOW_SECONDS = float(
+    os.environ.get('LIVE_LIKES_WINDOW_SECONDS', 1.0)
+)
+LIVE_LIKES_KEEPALIVE_SECONDS = float(
+    os.environ.get('LIVE_LIKES_KEEPALIVE_SECONDS', 25.0)
+)
+
+# Outbox consumers: name -> dotted path of a handler receiving event batches
+OUTBOX_CONSUMERS = {
+    'like_counts': 'videos.services.handle_like_count_events',
+    'like_rollups': 'videos.services.handle_like_rollup_events',
+    'live_likes': 'videos.live.publish_like_events',
+    'related_videos': 'videos.recommendations.queue_refresh',
+}
+
+# An id gap younger than this is waited for: the transaction holding the
+# missing id may still commit. On PostgreSQL older gaps are also waited for
+# while a transaction older than the event after the gap is running.
+OUTBOX_SETTLE_SECONDS = int(os.environ.get('OUTBOX_SETTLE_SECONDS', 10))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -119,11 +238,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'accounts.User'
 
 
+# JSON is encoded with orjson when it is installed; MessagePack is offered
+# when msgpack is installed (the `fast` extra) and the browsable API only
+# under DEBUG
+RENDERER_CLASSES = ['video_project.renderers.FastJSONRenderer']
+if importlib.util.find_spec('msgpack'):
+    RENDERER_CLASSES.append('video_project.renderers.MessagePackRenderer')
+if DEBUG:
+    RENDERER_CLASSES.append('rest_framework.renderers.BrowsableAPIRenderer')
+
 REST_FRAMEWORK = {
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+    'DEFAULT_RENDERER_CLASSES': RENDERER_CLASSES,
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -137,6 +262,58 @@ REST_FRAMEWORK = {
 }
 
 
+# Per-request query/DB/serializer timings, exposed at /metrics/ for staff.
+# With several workers set METRICS_DIR to a directory shared by them, so
+# every scrape returns histograms merged across all workers.
+PERFORMANCE_METRICS = os.environ.get('PERFORMANCE_METRICS', 'True') == 'True'
+METRICS_DIR = os.environ.get('METRICS_DIR')
+
+# On-demand profiling (video_project.profiling): staff get a signed token at
+# /profiles/ and send it in the X-Profile header or ?profile= of any request.
+# PROFILING_SAMPLE_RATE profiles that share of all requests with
+# PROFILING_MODE ('sample' or 'cprofile'); 0 keeps the overhead at a header
+# lookup. With several workers PROFILING_DIR must be shared by them.
+PROFILING = os.environ.get('PROFILING', 'True') == 'True'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MODE = os.environ.get('PROFILING_MODE', 'sample')
+PROFILING_INTERVAL = float(os.environ.get('PROFILING_INTERVAL', 0.001))
+PROFILING_TOKEN_SECONDS = int(os.environ.get('PROFILING_TOKEN_SECONDS', 3600))
+PROFILING_MAX_QUERIES = int(os.environ.get('PROFILING_MAX_QUERIES', 1000))
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', 100))
+PROFILING_DIR = os.environ.get(
+    'PROFILING_DIR', os.path.join(BASE_DIR, 'profiles')
+)
+
+
+# Number of hash partitions (by video_id) for the Like table on PostgreSQL.
+# When set, migrations partition an empty Like table right away; populated
+# tables are converted online with `manage.py partition_likes`.
+LIKE_PARTITIONS = int(os.environ.get('LIKE_PARTITIONS', 0))
+
+# Like shards (videos.sharding): database aliases that may hold Like rows,
+# e.g. LIKE_SHARDS=default,likes_1. Buckets (video_id % LIKE_SHARD_BUCKETS)
+# start on default and are moved with `manage.py rebalance_likes`; every
+# process re-reads the bucket map every LIKE_SHARD_MAP_SECONDS. Aliases
+# missing from DATABASES are configured like default, on the host from
+# DATABASE_HOST_<ALIAS> and with the alias appended to the database name.
+LIKE_SHARDS = [
+    alias for alias in os.environ.get('LIKE_SHARDS', '').split(',') if alias
+]
+LIKE_SHARD_BUCKETS = int(os.environ.get('LIKE_SHARD_BUCKETS', 256))
+LIKE_SHARD_MAP_SECONDS = float(os.environ.get('LIKE_SHARD_MAP_SECONDS', 5))
+DATABASE_ROUTERS = ['videos.sharding.LikeShardRouter']
+
+# Pre-generated OpenAPI document (`manage.py generate_openapi`), served by
+# nginx; without it the schema is generated once per process.
+OPENAPI_SCHEMA_PATH = os.environ.get(
+    'OPENAPI_SCHEMA_PATH', os.path.join(STATIC_ROOT, 'openapi.json')
+)
+
+SWAGGER_SETTINGS = {
+    'SPEC_URL': 'schema-json',
+}
+
+
 DJOSER = {
     'SERIALIZERS': {
         'user_create': 'accounts.serializers.CustomUserCreateSerializer',
@@ -177,16 +354,14 @@ if DEBUG:
     MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
 
 
-    SWAGGER_SETTINGS = {
-       'SECURITY_DEFINITIONS': {
-          'Basic': {
-                'type': 'basic'
-          },
-          'Bearer': {
-                'type': 'apiKey',
-                'name': 'Authorization',
-                'in': 'header'
-          }
+    SWAGGER_SETTINGS['SECURITY_DEFINITIONS'] = {
+       'Basic': {
+             'type': 'basic'
+       },
+       'Bearer': {
+             'type': 'apiKey',
+             'name': 'Authorization',
+             'in': 'header'
        }
     }
 
@@ -218,3 +393,31 @@ else:
             'PORT': os.environ.get('DATABASE_PORT'),
         }
     }
+
+    # ASGI workers and the outbox consumer are connected by LISTEN/NOTIFY
+    LIVE_LIKES_BROKER = os.environ.get(
+        'LIVE_LIKES_BROKER', 'videos.live.PostgresBroker'
+    )
+
+
+def like_shard_database(alias):
+    """
+    Return the DATABASES entry of a like shard alias, configured like
+    default.
+    """
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        return dict(
+            DATABASES['default'], NAME=BASE_DIR / f'db_{alias}.sqlite3'
+        )
+    return dict(
+        DATABASES['default'],
+        NAME=f"{DATABASES['default']['NAME']}_{alias}",
+        HOST=os.environ.get(
+            f'DATABASE_HOST_{alias.upper()}', DATABASES['default']['HOST']
+        ),
+    )
+
+
+for alias in LIKE_SHARDS:
+    if alias not in DATABASES:
+        DATABASES[alias] = like_shard_database(alias)
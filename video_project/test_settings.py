@@ -0,0 +1,15 @@
+"""
+Settings of the test suite; ``manage.py test`` uses them unless
+``DJANGO_SETTINGS_MODULE`` or ``--settings`` names others.
+"""
+
+from video_project.settings import *  # noqa: F401,F403
+from video_project.settings import DATABASES, like_shard_database
+
+
+# Запасные шарды лайков: тесты шардирования идут и без LIKE_SHARDS, а
+# очистке нужны два шарда кроме default
+TEST_LIKE_SHARDS = ['likes_test_1', 'likes_test_2']
+
+for alias in TEST_LIKE_SHARDS:
+    DATABASES.setdefault(alias, like_shard_database(alias))
@@ -2,30 +2,33 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
 
+from video_project import schema as project_schema
+from video_project import views as project_views
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Barter API",
-        default_version='v1',
-        description="Документация API",
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('docs/', project_schema.docs_view, name='schema-swagger-ui'),
     path(
-        'docs/',
-        schema_view.with_ui('swagger', cache_timeout=0),
-        name='schema-swagger-ui'
+        'docs/openapi.json',
+        project_schema.schema_json_view,
+        name='schema-json'
     ),
     path("v1/videos/", include("videos.urls")),
     path("v1/accounts/", include("accounts.urls")),
+    path("metrics/", project_views.MetricsView.as_view(), name="metrics"),
+    path("profiles/", project_views.ProfilesView.as_view(), name="profiles"),
+    path(
+        "profiles/<slug:profile_id>/",
+        project_views.ProfileView.as_view(),
+        name="profile-detail",
+    ),
+    path(
+        "profiles/<slug:profile_id>/download/",
+        project_views.ProfileDownloadView.as_view(),
+        name="profile-download",
+    ),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
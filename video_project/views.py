@@ -0,0 +1,152 @@
+import os
+
+from django.conf import settings
+from django.http import FileResponse, Http404
+from rest_framework import renderers, serializers
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from video_project import metrics
+from video_project import profiling
+from videos import permissions as videos_permissions
+
+
+class PrometheusTextRenderer(renderers.BaseRenderer):
+    """
+    Renderer for the Prometheus text exposition format.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return renderers.JSONRenderer().render(data)
+
+
+class MetricsView(APIView):
+    """
+    API view exposing per-view request histograms for Prometheus.
+
+    Permissions:
+        - Only staff users can access this view.
+    """
+    permission_classes = [videos_permissions.IsStaff]
+    renderer_classes = [PrometheusTextRenderer]
+
+    def get(self, request: Request) -> Response:
+        """
+        Handle GET request to return aggregated request metrics.
+
+        Args:
+            request (Request): DRF request object.
+
+        Returns:
+            Response: Metrics in the Prometheus text format.
+        """
+        return Response(
+            metrics.registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
+
+
+class ProfileTokenSerializer(serializers.Serializer):
+    """
+    Serializer of a profiling token request.
+    """
+    mode = serializers.ChoiceField(
+        choices=profiling.MODES, default="sample"
+    )
+
+
+class ProfilesView(APIView):
+    """
+    API view listing stored request profiles and issuing profiling tokens.
+
+    Permissions:
+        - Only staff users can access this view.
+    """
+    permission_classes = [videos_permissions.IsStaff]
+
+    def get(self, request: Request) -> Response:
+        """
+        Handle GET request to list stored profiles, newest first.
+
+        Returns:
+            Response: Profile metadata without the SQL statements.
+        """
+        return Response(profiling.list_profiles())
+
+    def post(self, request: Request) -> Response:
+        """
+        Handle POST request to issue a token that profiles the requests
+        carrying it.
+
+        Returns:
+            Response: Token, its lifetime in seconds and the profiler mode.
+        """
+        serializer = ProfileTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        mode = serializer.validated_data["mode"]
+        return Response({
+            "token": profiling.make_token(request.user.id, mode),
+            "expires_in": settings.PROFILING_TOKEN_SECONDS,
+            "mode": mode,
+        })
+
+
+class ProfileView(APIView):
+    """
+    API view returning a stored profile with its SQL statements.
+
+    Permissions:
+        - Only staff users can access this view.
+    """
+    permission_classes = [videos_permissions.IsStaff]
+
+    def get(self, request: Request, profile_id: str) -> Response:
+        """
+        Handle GET request for the metadata and SQL of one profile.
+
+        Raises:
+            Http404: If the profile does not exist.
+        """
+        metadata = profiling.load(profile_id)
+        if metadata is None:
+            raise Http404
+        return Response(metadata)
+
+
+class ProfileDownloadView(APIView):
+    """
+    API view downloading the body of a stored profile: folded stacks for
+    ``sample`` profiles, a pstats dump for ``cprofile`` profiles.
+
+    Permissions:
+        - Only staff users can access this view.
+    """
+    permission_classes = [videos_permissions.IsStaff]
+
+    def get(self, request: Request, profile_id: str) -> FileResponse:
+        """
+        Handle GET request to download a profile body.
+
+        Raises:
+            Http404: If the profile does not exist.
+        """
+        metadata = profiling.load(profile_id)
+        if metadata is None:
+            raise Http404
+        try:
+            body = open(profiling.body_path(metadata), "rb")
+        except FileNotFoundError:
+            raise Http404
+        _, content_type = profiling.FORMATS[metadata["mode"]]
+        return FileResponse(
+            body,
+            as_attachment=True,
+            filename=os.path.basename(body.name),
+            content_type=content_type,
+        )
@@ -0,0 +1,83 @@
+"""
+Warm-up of a server process before it handles requests.
+
+With ``preload_app`` the gunicorn master runs :func:`warm_up` once before
+forking, so URL resolvers, serializer fields, templates and translation
+catalogs are built once and shared copy-on-write by every worker; without
+preload each worker runs it after boot. Either way the first request of a
+worker does no lazy initialisation.
+
+The database is not touched: a connection opened before fork would be
+shared by all workers.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.urls import Resolver404, get_resolver
+from django.utils import translation
+from rest_framework import serializers
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.settings import api_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Сериализаторы этих пакетов собираются заранее
+SERIALIZER_MODULES = ("accounts.", "videos.", "djoser.")
+
+
+def warm_up() -> None:
+    """
+    Build everything a request would otherwise build lazily.
+    """
+    resolver = get_resolver()
+    # Заполняет таблицы reverse() и компилирует регулярные выражения всех
+    # маршрутов: несуществующий путь проверяется против каждого из них
+    resolver.reverse_dict
+    try:
+        resolver.resolve("/__warm_up__/")
+    except Resolver404:
+        pass
+
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext("This field is required.")
+
+    if BrowsableAPIRenderer in api_settings.DEFAULT_RENDERER_CLASSES:
+        try:
+            get_template(BrowsableAPIRenderer.template)
+        except TemplateDoesNotExist:
+            pass
+
+    for serializer_class in _serializer_classes():
+        try:
+            serializer_class().fields
+        except Exception:
+            # Сериализаторам с обязательными аргументами хватит ленивой
+            # сборки при первом запросе
+            logger.debug("Не удалось прогреть %s", serializer_class)
+
+    connections.close_all()
+
+
+def _serializer_classes() -> list[type[serializers.BaseSerializer]]:
+    """
+    Return the imported serializer classes of the project and of djoser.
+    """
+    # Сериализаторы djoser импортируются лениво, по настройке SERIALIZERS
+    from djoser.conf import settings as djoser_settings
+
+    for name in djoser_settings.SERIALIZERS.keys():
+        getattr(djoser_settings.SERIALIZERS, name)
+
+    found = {}
+    pending = [serializers.Serializer]
+    while pending:
+        serializer_class = pending.pop()
+        pending.extend(serializer_class.__subclasses__())
+        if serializer_class.__module__.startswith(SERIALIZER_MODULES):
+            found[serializer_class] = None
+    return list(found)
@@ -1,10 +1,12 @@
 from django.contrib import admin
 from videos import models as videos_models
+from videos import services as videos_services
 
 
 @admin.register(videos_models.VideoFile)
 class VideoFileAdmin(admin.ModelAdmin):
-    list_display = ["id", "video", "quality", "file", "created_at"]
+    list_display = ["id", "video", "quality", "file", "size", "created_at"]
+    readonly_fields = ["size", "sha256"]
     list_filter = ["quality"]
     search_fields = ["video__name"]
     autocomplete_fields = ["video"]
@@ -18,11 +20,35 @@ class VideoFileInline(admin.TabularInline):
 @admin.register(videos_models.Video)
 class VideoAdmin(admin.ModelAdmin):
     list_display = ["id", "name", "owner",
-                    "is_published", "total_likes", "created_at"]
+                    "is_published", "total_likes", "created_at", "deleted_at"]
     list_filter = ["is_published", "created_at"]
     search_fields = ["name", "owner__username"]
     autocomplete_fields = ["owner"]
     inlines = [VideoFileInline]
+    actions = ["publish_videos", "unpublish_videos"]
+
+    @admin.action(description="Publish selected videos")
+    def publish_videos(self, request, queryset):
+        updated = videos_services.VideoPublication().set_published(
+            queryset, True
+        )
+        self.message_user(request, f"Published {updated} videos.")
+
+    @admin.action(description="Unpublish selected videos")
+    def unpublish_videos(self, request, queryset):
+        updated = videos_services.VideoPublication().set_published(
+            queryset, False
+        )
+        self.message_user(request, f"Unpublished {updated} videos.")
+
+    def delete_model(self, request, obj):
+        # Лайки и файлы удаляются в фоне командой purge_deleted
+        videos_services.CascadeDeletion.mark_videos(
+            videos_models.Video.objects.filter(pk=obj.pk)
+        )
+
+    def delete_queryset(self, request, queryset):
+        videos_services.CascadeDeletion.mark_videos(queryset)
 
 
 @admin.register(videos_models.Like)
@@ -0,0 +1,309 @@
+"""
+In-process columnar snapshot of videos for owner statistics.
+
+Optional: needs NumPy and ``OWNER_STATS_ENGINE = True``. Every process keeps
+``(video_id, owner_id, visible, total_likes)`` of all videos in NumPy arrays
+sorted by video id, where visible means published and not scheduled for
+deletion. The snapshot is refreshed at most every
+``OWNER_STATS_REFRESH_SECONDS`` by reading only the videos whose
+``updated_at`` passed the watermark, so statistics requests cost the
+database one small indexed range scan and everything else is computed
+in memory.
+
+``updated_at`` is assigned before the writing transaction commits, so rows
+are re-read ``OWNER_STATS_OVERLAP_SECONDS`` behind the watermark; values
+are assigned rather than added, which makes re-reading harmless. Videos
+removed without a deletion mark are dropped by a full reload every
+``OWNER_STATS_FULL_REFRESH_SECONDS``.
+"""
+
+import functools
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+
+from accounts import models as accounts_models
+from videos import models as videos_models
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+COLUMNS = (
+    "id", "owner_id", "is_published", "deleted_at", "total_likes",
+    "updated_at",
+)
+# Сколько id владельцев передаётся в одном запросе имён
+USERNAMES_CHUNK_SIZE = 10_000
+
+
+class Snapshot:
+    """
+    Immutable columns of all videos with statistics over their owners.
+
+    Per-owner statistics count visible videos only; owners without visible
+    videos are left out, as in :class:`videos.services.StatisticsGroupBy`.
+
+    Attributes:
+        ids: Video ids in ascending order.
+        owners: Owner id of every video.
+        visible: Whether the video is published and not deleted.
+        likes: ``total_likes`` of every video.
+    """
+
+    def __init__(self, ids, owners, visible, likes):
+        self.ids = ids
+        self.owners = owners
+        self.visible = visible
+        self.likes = likes
+
+    @classmethod
+    def empty(cls) -> "Snapshot":
+        return cls(
+            np.empty(0, np.int64),
+            np.empty(0, np.int64),
+            np.empty(0, np.bool_),
+            np.empty(0, np.int64),
+        )
+
+    def merge(self, changed: "Snapshot") -> "Snapshot":
+        """
+        Return a snapshot with the rows of ``changed`` replacing or added to
+        these rows.
+        """
+        positions = np.searchsorted(self.ids, changed.ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == changed.ids[found]
+
+        columns = []
+        for name in ("ids", "owners", "visible", "likes"):
+            column = getattr(self, name).copy()
+            values = getattr(changed, name)
+            column[positions[found]] = values[found]
+            columns.append(np.concatenate((column, values[~found])))
+        merged = Snapshot(*columns)
+        if not found.all():
+            # Новые видео могут закоммититься не в порядке id
+            order = np.argsort(merged.ids, kind="stable")
+            merged = Snapshot(*(column[order] for column in columns))
+        return merged
+
+    @functools.cached_property
+    def owner_sums(self) -> tuple:
+        """
+        Owners with visible videos in owner id order.
+
+        Returns:
+            tuple: Arrays of owner ids, likes sums and visible video counts.
+        """
+        owners = self.owners[self.visible]
+        if not len(owners):
+            return (np.empty(0, np.int64),) * 3
+        sums = np.bincount(owners, weights=self.likes[self.visible])
+        counts = np.bincount(owners)
+        owner_ids = np.flatnonzero(counts)
+        return owner_ids, sums[owner_ids].astype(np.int64), counts[owner_ids]
+
+    @functools.cached_property
+    def per_owner(self) -> tuple:
+        """
+        :attr:`owner_sums` ordered by likes sum descending, then by owner
+        id.
+        """
+        owner_ids, sums, counts = self.owner_sums
+        order = np.lexsort((owner_ids, -sums))
+        return owner_ids[order], sums[order], counts[order]
+
+    @functools.cached_property
+    def sorted_sums(self):
+        return np.sort(self.owner_sums[1])
+
+    def top(self, k: int) -> tuple:
+        """
+        Return the ``k`` owners with most likes, ordered like
+        :attr:`per_owner`.
+        """
+        owner_ids, sums, counts = self.owner_sums
+        if k < len(sums):
+            # Частичный отбор за O(n), сортируются только k владельцев
+            selected = np.argpartition(-sums, k)[:k]
+            owner_ids = owner_ids[selected]
+            sums = sums[selected]
+            counts = counts[selected]
+        order = np.lexsort((owner_ids, -sums))
+        return owner_ids[order], sums[order], counts[order]
+
+    def percentiles(self, q: list[float]) -> list[float]:
+        """
+        Return percentiles of per-owner likes sums.
+        """
+        if not len(self.sorted_sums):
+            return [0.0] * len(q)
+        return np.percentile(self.sorted_sums, q).tolist()
+
+    def percentile_ranks(self, sums) -> list[float]:
+        """
+        Return the share of owners, in percent, whose likes sum is at most
+        each of ``sums``.
+        """
+        if not len(self.sorted_sums):
+            return [0.0] * len(sums)
+        ranks = np.searchsorted(self.sorted_sums, sums, side="right")
+        return (ranks * 100 / len(self.sorted_sums)).tolist()
+
+    def histogram(self, bins: int) -> tuple[list[int], list[float]]:
+        """
+        Return counts and bin edges of per-owner likes sums.
+        """
+        counts, edges = np.histogram(self.sorted_sums, bins=bins)
+        return counts.tolist(), edges.tolist()
+
+
+class OwnerStatsEngine:
+    """
+    Keeps the snapshot of this process up to date.
+
+    Refreshes are serialised by a lock; readers get the current snapshot
+    and are never blocked by a refresh in progress for longer than one
+    refresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = Snapshot.empty()
+        self._watermark = None
+        self._refreshed_at = None
+        self._loaded_at = None
+
+    def snapshot(self) -> Snapshot:
+        """
+        Return the snapshot, refreshing it first when it is older than
+        ``OWNER_STATS_REFRESH_SECONDS``.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._refreshed_at is None
+                or now - self._refreshed_at
+                >= settings.OWNER_STATS_REFRESH_SECONDS
+            ):
+                self.refresh(
+                    full=self._loaded_at is None
+                    or now - self._loaded_at
+                    >= settings.OWNER_STATS_FULL_REFRESH_SECONDS
+                )
+            return self._snapshot
+
+    def refresh_now(self) -> int:
+        """
+        Read videos changed since the watermark right away, for example
+        after this process changed them.
+
+        Returns:
+            int: Number of rows read.
+        """
+        with self._lock:
+            return self.refresh()
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Read videos changed since the watermark, or all videos; the caller
+        holds the lock.
+
+        Returns:
+            int: Number of rows read.
+        """
+        videos = videos_models.Video.objects.all()
+        if not full and self._watermark is not None:
+            videos = videos.filter(
+                updated_at__gte=self._watermark - timedelta(
+                    seconds=settings.OWNER_STATS_OVERLAP_SECONDS
+                )
+            )
+        rows = list(videos.order_by("id").values_list(*COLUMNS))
+
+        changed = Snapshot.empty()
+        if rows:
+            ids, owners, published, deleted, likes, updated = zip(*rows)
+            changed = Snapshot(
+                np.array(ids, np.int64),
+                np.array(owners, np.int64),
+                np.array(published, np.bool_)
+                & np.array([moment is None for moment in deleted], np.bool_),
+                np.array(likes, np.int64),
+            )
+            watermark = max(updated)
+            if self._watermark is None or watermark > self._watermark:
+                self._watermark = watermark
+
+        now = time.monotonic()
+        if full:
+            self._snapshot = changed
+            self._loaded_at = now
+        elif rows:
+            self._snapshot = self._snapshot.merge(changed)
+        self._refreshed_at = now
+        return len(rows)
+
+    @staticmethod
+    def usernames(owner_ids) -> dict[int, str]:
+        owner_ids = [int(owner_id) for owner_id in owner_ids]
+        usernames = {}
+        for start in range(0, len(owner_ids), USERNAMES_CHUNK_SIZE):
+            usernames.update(
+                accounts_models.User.objects.filter(
+                    id__in=owner_ids[start:start + USERNAMES_CHUNK_SIZE]
+                ).values_list("id", "username")
+            )
+        return usernames
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> OwnerStatsEngine | None:
+    """
+    Return the engine of this process, or None when it is disabled or
+    NumPy is not installed.
+    """
+    global _engine
+    if np is None or not settings.OWNER_STATS_ENGINE:
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = OwnerStatsEngine()
+    return _engine
+
+
+class EngineStatisticsGroupBy:
+    """
+    Computes the statistics of :class:`videos.services.StatisticsGroupBy`
+    from the snapshot.
+
+    Attributes:
+        engine (OwnerStatsEngine): Engine of this process.
+    """
+
+    def __init__(self, engine: OwnerStatsEngine):
+        self.engine = engine
+
+    def get_stats(self) -> list[dict]:
+        """
+        Get total likes of published videos grouped by video owners.
+
+        Returns:
+            list[dict]: Usernames with their likes sum, ordered by likes_sum
+            descending.
+        """
+        owner_ids, sums, _ = self.engine.snapshot().per_owner
+        usernames = self.engine.usernames(owner_ids)
+        return [
+            {"username": usernames[owner_id], "likes_sum": likes_sum}
+            for owner_id, likes_sum in zip(owner_ids.tolist(), sums.tolist())
+            if owner_id in usernames
+        ]
@@ -0,0 +1,282 @@
+"""
+Bitmap of published video ids in a memory-mapped file shared by all
+processes of a host.
+
+Bit ``id`` is set when the video is published and not scheduled for
+deletion. A clear bit lets the like and visibility paths answer 404 without
+a query. A set bit only sends the request to the database, so a bit left
+set for an unpublished or deleted video is harmless, while a missing bit
+would hide a published video. Hence:
+
+- ids above the built range are unknown and always go to the database;
+- saves of videos set or clear their bit when the transaction commits
+  (``videos.signals``);
+- every ``PUBLISHED_BITMAP_SYNC_SECONDS`` one process re-reads videos whose
+  ``updated_at`` passed the watermark, which catches changes made on other
+  hosts and by queryset updates;
+- ``manage.py build_published_bitmap --loop`` rebuilds the bitmap every
+  ``PUBLISHED_BITMAP_REBUILD_SECONDS``. Requests never rebuild it: a
+  rebuild reads every published id, and until the first one all ids go to
+  the database.
+
+Writers hold an exclusive ``flock`` on the file together with a lock
+between the threads of their process, which share the locked descriptor;
+readers take no lock: a bit is read with one byte access. Disabled unless
+``PUBLISHED_BITMAP_PATH`` is set; the path should be on tmpfs and belongs to
+one database.
+"""
+
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Max
+
+from videos import models as videos_models
+
+
+class PublishedBitmap:
+    """
+    Published video ids of one database in a shared file.
+
+    Attributes:
+        path (str): Path of the bitmap file.
+    """
+
+    MAGIC = b"VIDBMP01"
+    # magic, max_id, watermark, synced_at, built_at
+    HEADER = struct.Struct("<8sqddd")
+    DATA_OFFSET = 64
+    # Файл растёт шагами по 1 МиБ, то есть по 8 млн id
+    GROWTH = 1 << 20
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._map = None
+        # flock не разделяет потоки: у них общий дескриптор файла
+        self._thread_lock = threading.Lock()
+        self._remap()
+
+    def _remap(self) -> None:
+        size = os.fstat(self._fd).st_size
+        if size < self.DATA_OFFSET + self.GROWTH:
+            with self._locked():
+                size = os.fstat(self._fd).st_size
+                if size < self.DATA_OFFSET + self.GROWTH:
+                    size = self.DATA_OFFSET + self.GROWTH
+                    os.ftruncate(self._fd, size)
+        if self._map is None or len(self._map) != size:
+            self._map = mmap.mmap(self._fd, size)
+
+    def _ensure_capacity(self, max_id: int) -> None:
+        needed = self.DATA_OFFSET + (max_id >> 3) + 1
+        if needed > len(self._map):
+            size = self.DATA_OFFSET + (
+                -(-(needed - self.DATA_OFFSET) // self.GROWTH) * self.GROWTH
+            )
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._remap()
+
+    @contextlib.contextmanager
+    def _locked(self, blocking: bool = True):
+        if not self._thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(self._fd, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+    def header(self) -> tuple[bool, int, float, float, float]:
+        """
+        Returns:
+            tuple: Whether the bitmap is built, the highest covered id, the
+            ``updated_at`` watermark and the sync and build times, as Unix
+            timestamps.
+        """
+        magic, *rest = self.HEADER.unpack_from(self._map, 0)
+        return (magic == self.MAGIC, *rest)
+
+    def _write_header(self, max_id, watermark, synced_at, built_at) -> None:
+        self.HEADER.pack_into(
+            self._map, 0, self.MAGIC, max_id, watermark, synced_at, built_at
+        )
+
+    def get(self, video_id: int) -> bool | None:
+        """
+        Tell whether a video is published.
+
+        Returns:
+            bool | None: False when it is certainly not published, True when
+            it probably is, None when the id is not covered yet.
+        """
+        built, max_id, *_ = self.header()
+        if not built or not 0 < video_id <= max_id:
+            return None
+        offset = self.DATA_OFFSET + (video_id >> 3)
+        if offset >= len(self._map):
+            # Файл увеличил другой процесс
+            self._remap()
+        return bool(self._map[offset] >> (video_id & 7) & 1)
+
+    def mark(self, video_id: int, published: bool) -> None:
+        """
+        Set or clear the bit of a covered video.
+        """
+        with self._locked():
+            built, max_id, *_ = self.header()
+            if built and 0 < video_id <= max_id:
+                self._set(video_id, published)
+
+    def mark_many(self, video_ids: list[int], published: bool) -> None:
+        """
+        Set or clear the bits of the covered videos under one lock.
+        """
+        with self._locked():
+            built, max_id, *_ = self.header()
+            if not built:
+                return
+            for video_id in video_ids:
+                if 0 < video_id <= max_id:
+                    self._set(video_id, published)
+
+    def _set(self, video_id: int, published: bool) -> None:
+        offset = self.DATA_OFFSET + (video_id >> 3)
+        mask = 1 << (video_id & 7)
+        if published:
+            self._map[offset] |= mask
+        else:
+            self._map[offset] &= ~mask & 0xFF
+
+    def refresh(self) -> None:
+        """
+        Sync a built bitmap when it is due and no other process is already
+        doing it.
+        """
+        built, _, _, synced_at, _ = self.header()
+        now = time.time()
+        if not built or (
+            now - synced_at < settings.PUBLISHED_BITMAP_SYNC_SECONDS
+        ):
+            return
+        with self._locked(blocking=False) as locked:
+            if not locked:
+                return
+            _, _, _, synced_at, _ = self.header()
+            if now - synced_at >= settings.PUBLISHED_BITMAP_SYNC_SECONDS:
+                self._sync()
+
+    def rebuild(self) -> int:
+        """
+        Rebuild the bitmap from the database.
+
+        Returns:
+            int: Number of published videos.
+        """
+        with self._locked():
+            return self._rebuild()
+
+    def _rebuild(self) -> int:
+        started = time.time()
+        max_id = videos_models.Video.objects.aggregate(
+            max_id=Max("id")
+        )["max_id"] or 0
+        bits = bytearray((max_id >> 3) + 1)
+        published = 0
+        for video_id in (
+            videos_models.Video.objects.published()
+            .values_list("id", flat=True).iterator(chunk_size=10_000)
+        ):
+            max_id = max(max_id, video_id)
+            if video_id >> 3 >= len(bits):
+                bits.extend(bytes((video_id >> 3) + 1 - len(bits)))
+            bits[video_id >> 3] |= 1 << (video_id & 7)
+            published += 1
+
+        built, old_max_id, *_ = self.header()
+        old_max_id = old_max_id if built else 0
+        self._ensure_capacity(max(max_id, old_max_id))
+        start = self.DATA_OFFSET
+        self._map[start:start + len(bits)] = bits
+        stale = (old_max_id >> 3) + 1 - len(bits)
+        if stale > 0:
+            self._map[start + len(bits):start + len(bits) + stale] = (
+                bytes(stale)
+            )
+        now = time.time()
+        self._write_header(max_id, started, now, now)
+        return published
+
+    def _sync(self) -> int:
+        _, max_id, watermark, _, built_at = self.header()
+        since = datetime.fromtimestamp(
+            watermark - settings.PUBLISHED_BITMAP_OVERLAP_SECONDS,
+            tz=dt_timezone.utc,
+        )
+        rows = list(
+            videos_models.Video.objects.filter(updated_at__gte=since)
+            .values_list("id", "is_published", "deleted_at", "updated_at")
+        )
+        if rows:
+            self._ensure_capacity(max(row[0] for row in rows))
+        for video_id, is_published, deleted_at, updated_at in rows:
+            self._set(video_id, is_published and deleted_at is None)
+            max_id = max(max_id, video_id)
+            watermark = max(watermark, updated_at.timestamp())
+        self._write_header(max_id, watermark, time.time(), built_at)
+        return len(rows)
+
+
+_bitmaps = {}
+_bitmaps_lock = threading.Lock()
+
+
+def get_bitmap() -> PublishedBitmap | None:
+    """
+    Return the bitmap of this process, or None when it is disabled.
+
+    The file is opened once per process: ``flock`` locks are shared by
+    descriptors inherited over ``fork``.
+    """
+    path = settings.PUBLISHED_BITMAP_PATH
+    if not path:
+        return None
+    key = (os.getpid(), path)
+    with _bitmaps_lock:
+        bitmap = _bitmaps.get(key)
+        if bitmap is None:
+            bitmap = _bitmaps[key] = PublishedBitmap(path)
+    return bitmap
+
+
+def is_published(video_id: int) -> bool | None:
+    """
+    Tell whether a video is published without a query, when possible.
+
+    Returns:
+        bool | None: False when the video is certainly not published and
+        visible only to its owner and staff, if at all; True or None when
+        the database has to be asked.
+    """
+    bitmap = get_bitmap()
+    if bitmap is None:
+        return None
+    bitmap.refresh()
+    return bitmap.get(video_id)
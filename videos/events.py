@@ -0,0 +1,230 @@
+"""
+Transactional outbox for like and publish events.
+
+Changes append :class:`~videos.models.OutboxEvent` rows in their own
+transaction, so an event exists if and only if its change was committed.
+Consumers registered in ``OUTBOX_CONSUMERS`` read the events in id order
+and in batches, off the request path.
+
+Like shards (``videos.sharding``) have an outbox each, appended in the
+transaction of the like. Every consumer reads every outbox; all checkpoints
+and the handlers' writes are on the default database.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from videos import models as videos_models
+from videos import sharding as videos_sharding
+
+
+EventHandler = Callable[[list[videos_models.OutboxEvent]], None]
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """
+    Appends events; must be called inside the transaction of the change.
+    """
+
+    @staticmethod
+    def append(
+        kind: int,
+        video_id: int,
+        owner_id: int,
+        occurred_at: datetime,
+        user_id: int | None = None,
+        using: str = "default",
+    ) -> None:
+        videos_models.OutboxEvent.objects.using(using).create(
+            kind=kind,
+            video_id=video_id,
+            owner_id=owner_id,
+            user_id=user_id,
+            occurred_at=occurred_at,
+        )
+
+    @staticmethod
+    def append_many(
+        events: Iterable[videos_models.OutboxEvent], using: str = "default"
+    ) -> None:
+        videos_models.OutboxEvent.objects.using(using).bulk_create(
+            events, batch_size=1000
+        )
+
+
+class Consumer:
+    """
+    Delivers the events of one outbox to a handler in batches.
+
+    The handler runs in the transaction that advances the consumer's
+    checkpoint on the default database. Database changes made by the handler
+    there are therefore applied exactly once, and any other side effects at
+    least once: a failed batch is rolled back and delivered again. Events
+    carry the alias of their outbox in ``_state.db``.
+
+    Ids are taken from a sequence before commit, so a transaction may commit
+    after a later id is already visible. A gap in the ids is waited for
+    until the event after it is ``OUTBOX_SETTLE_SECONDS`` old. On
+    PostgreSQL it is also waited for while any transaction older than the
+    one of that event is running, since it may hold the missing ids. After
+    that the gap is treated as a rolled back transaction, logged and
+    counted in ``skipped``.
+
+    Attributes:
+        name (str): Consumer name in ``OUTBOX_CONSUMERS``.
+        handler (EventHandler): Callable receiving a list of events.
+        batch_size (int): Maximum events per batch.
+        using (str): Database alias of the outbox.
+        checkpoint (str): Key of the consumer's checkpoint.
+        skipped (int): Number of ids skipped as rolled back.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: EventHandler,
+        batch_size: int = 500,
+        using: str = "default",
+    ):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.using = using
+        self.checkpoint = videos_sharding.checkpoint_name(name, using)
+        self.skipped = 0
+
+    @classmethod
+    def configured(cls, batch_size: int = 500) -> list["Consumer"]:
+        """
+        Build the consumers registered in ``OUTBOX_CONSUMERS`` for every
+        outbox.
+        """
+        return [
+            cls(name, import_string(path), batch_size, using)
+            for using in videos_sharding.outbox_aliases()
+            for name, path in settings.OUTBOX_CONSUMERS.items()
+        ]
+
+    def process_batch(self) -> int:
+        """
+        Deliver the next batch of events to the handler.
+
+        Returns:
+            int: Number of delivered events, 0 when there is nothing to do
+                or another process holds this consumer.
+        """
+        videos_models.OutboxCheckpoint.objects.get_or_create(
+            consumer=self.checkpoint
+        )
+        with transaction.atomic():
+            checkpoint = (
+                videos_models.OutboxCheckpoint.objects
+                .select_for_update(skip_locked=True)
+                .filter(consumer=self.checkpoint)
+                .first()
+            )
+            if checkpoint is None:
+                return 0
+
+            events = list(
+                videos_models.OutboxEvent.objects.using(self.using)
+                .filter(id__gt=checkpoint.position)
+                .order_by("id")[:self.batch_size]
+            )
+            settled = timezone.now() - timedelta(
+                seconds=settings.OUTBOX_SETTLE_SECONDS
+            )
+            ready = []
+            expected = checkpoint.position + 1
+            skipped = 0
+            for event in events:
+                if event.id != expected:
+                    if (
+                        event.created_at > settled
+                        or self._older_transaction_running(event)
+                    ):
+                        break
+                    logger.warning(
+                        "Потребитель %s пропускает id %s-%s перед событием %s",
+                        self.checkpoint, expected, event.id - 1, event.id,
+                    )
+                    skipped += event.id - expected
+                ready.append(event)
+                expected = event.id + 1
+            if not ready:
+                return 0
+
+            self.handler(ready)
+            checkpoint.position = ready[-1].id
+            checkpoint.save(update_fields=["position", "updated_at"])
+        self.skipped += skipped
+        return len(ready)
+
+    def _older_transaction_running(
+        self, event: videos_models.OutboxEvent
+    ) -> bool:
+        """
+        Check whether a transaction on the outbox database whose xid is
+        older than the xid of the transaction that appended ``event`` is
+        still running on PostgreSQL.
+
+        Missing ids below the event were taken by such transactions, so
+        they may still commit. Unrelated long transactions delay skipping
+        the gap as well, which is safe. Other databases cannot tell, and
+        only the settle time applies to them.
+        """
+        connection = connections[self.using]
+        if connection.vendor != "postgresql":
+            return False
+        table = connection.ops.quote_name(
+            videos_models.OutboxEvent._meta.db_table
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_stat_activity AS activity "
+                f"JOIN {table} AS event ON event.id = %s "
+                "WHERE activity.datname = current_database() "
+                "AND activity.pid <> pg_backend_pid() "
+                "AND activity.backend_xid IS NOT NULL "
+                "AND age(activity.backend_xid) > age(event.xmin))",
+                [event.id],
+            )
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def prune(batch_size: int = 10_000, using: str = "default") -> int:
+        """
+        Delete one batch of events of an outbox that every configured
+        consumer has handled.
+
+        Returns:
+            int: Number of deleted events.
+        """
+        names = {
+            videos_sharding.checkpoint_name(name, using)
+            for name in settings.OUTBOX_CONSUMERS
+        }
+        positions = dict(
+            videos_models.OutboxCheckpoint.objects
+            .filter(consumer__in=names)
+            .values_list("consumer", "position")
+        )
+        if not positions or set(positions) != names:
+            return 0
+        events = videos_models.OutboxEvent.objects.using(using)
+        ids = list(
+            events.filter(id__lte=min(positions.values()))
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if ids:
+            events.filter(id__in=ids).delete()
+        return len(ids)
@@ -0,0 +1,61 @@
+import django_filters
+from rest_framework.filters import OrderingFilter
+
+from videos import (
+    models as videos_models,
+    serializers as videos_serializers,
+)
+
+
+class VideoFilter(django_filters.FilterSet):
+    """
+    Filters accepted by the video list.
+
+    Every filter is served by one of the Video indexes together with any
+    ordering allowed by :class:`VideoOrderingFilter`; ``ids`` is served by
+    the primary key and sorts at most ``VIDEO_MULTI_GET_MAX_IDS`` rows.
+
+    Attributes:
+        ids: Comma-separated video ids to fetch at once.
+        owner: Id of the video owner.
+        created_after: Inclusive lower bound of ``created_at``.
+        created_before: Exclusive upper bound of ``created_at``.
+        min_likes: Minimum ``total_likes``.
+    """
+    ids = django_filters.CharFilter(method='filter_ids')
+    owner = django_filters.NumberFilter(field_name='owner_id')
+    created_after = django_filters.IsoDateTimeFilter(
+        field_name='created_at', lookup_expr='gte'
+    )
+    created_before = django_filters.IsoDateTimeFilter(
+        field_name='created_at', lookup_expr='lt'
+    )
+    min_likes = django_filters.NumberFilter(
+        field_name='total_likes', lookup_expr='gte'
+    )
+
+    class Meta:
+        model = videos_models.Video
+        fields = []
+
+    def filter_ids(self, queryset, name, value):
+        serializer = videos_serializers.VideoIdsSerializer(data={'ids': value})
+        serializer.is_valid(raise_exception=True)
+        return queryset.filter(id__in=serializer.validated_data['ids'])
+
+
+class VideoOrderingFilter(OrderingFilter):
+    """
+    Ordering by a single whitelisted field with ``id`` as tie-breaker.
+
+    Only the first valid field is used and the tie-breaker follows its
+    direction, so every ordering matches an index scanned forward or
+    backward and pages are stable.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        field = ordering[0]
+        return [field, '-id' if field.startswith('-') else 'id']
@@ -0,0 +1,457 @@
+"""
+Live like counts pushed to subscribers as Server-Sent Events.
+
+The stream is served by :class:`LikeCountStreamApp`, a plain ASGI
+application in front of Django: a Django view would keep a thread per open
+stream. Like events reach the ``live_likes`` outbox consumer, which
+publishes the new ``total_likes`` of every changed video to a broker. Every
+ASGI worker listens to the broker with one :class:`LikeCountHub`, coalesces
+changes over ``LIVE_LIKES_WINDOW_SECONDS`` and fans them out to its
+subscribers, so an idle subscriber costs one small object and no database
+connection or thread.
+
+Changes carry totals rather than increments: coalescing keeps the last
+value, a redelivered batch is harmless and a subscriber's initial snapshot
+cannot be counted twice.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from videos import (
+    models as videos_models,
+    serializers as videos_serializers,
+    services as videos_services,
+    sharding as videos_sharding,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# video_id -> total_likes after the change
+Changes = dict[int, int]
+
+
+class Broker(ABC):
+    """
+    Delivers like-count changes from publishers to every listening worker.
+    """
+
+    @abstractmethod
+    def publish(self, changes: Changes) -> None:
+        """
+        Publish changes; called synchronously, inside the transaction of
+        the outbox consumer.
+        """
+
+    @abstractmethod
+    async def listen(self, callback: Callable[[Changes], None]) -> None:
+        """
+        Call ``callback`` with every published batch until cancelled.
+        """
+
+
+class InMemoryBroker(Broker):
+    """
+    Broker for a single process, for tests and development.
+
+    Publishing from any thread hands the changes to the listeners' event
+    loops.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def publish(self, changes: Changes) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for loop, callback in listeners:
+            loop.call_soon_threadsafe(callback, dict(changes))
+
+    async def listen(self, callback: Callable[[Changes], None]) -> None:
+        listener = (asyncio.get_running_loop(), callback)
+        with self._lock:
+            self._listeners.append(listener)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            with self._lock:
+                self._listeners.remove(listener)
+
+
+class PostgresBroker(Broker):
+    """
+    Broker on PostgreSQL LISTEN/NOTIFY.
+
+    Notifications are sent when the publishing transaction commits, so a
+    rolled back outbox batch publishes nothing. Each worker holds one
+    listening connection.
+    """
+
+    CHANNEL = "video_likes"
+    # NOTIFY payloads are limited to 8000 bytes
+    CHUNK_SIZE = 400
+
+    def publish(self, changes: Changes) -> None:
+        items = list(changes.items())
+        with connection.cursor() as cursor:
+            for start in range(0, len(items), self.CHUNK_SIZE):
+                chunk = dict(items[start:start + self.CHUNK_SIZE])
+                payload = json.dumps(chunk)
+                cursor.execute(
+                    "SELECT pg_notify(%s, %s)", [self.CHANNEL, payload]
+                )
+
+    async def listen(self, callback: Callable[[Changes], None]) -> None:
+        import psycopg
+
+        params = connection.get_connection_params()
+        params.pop("cursor_factory", None)
+        params.pop("context", None)
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    autocommit=True, **params
+                ) as listener:
+                    await listener.execute(f"LISTEN {self.CHANNEL}")
+                    async for notify in listener.notifies():
+                        callback({
+                            int(video_id): total_likes
+                            for video_id, total_likes
+                            in json.loads(notify.payload).items()
+                        })
+            except psycopg.Error:
+                # Изменения, пришедшие во время переподключения, теряются
+                # до следующего лайка этих видео
+                logger.exception("Соединение LISTEN потеряно")
+                await asyncio.sleep(1)
+
+
+@functools.cache
+def _load_broker(path: str) -> Broker:
+    return import_string(path)()
+
+
+def get_broker() -> Broker:
+    """
+    Return the broker configured by ``LIVE_LIKES_BROKER``.
+    """
+    return _load_broker(settings.LIVE_LIKES_BROKER)
+
+
+class Subscription:
+    """
+    Video ids of one subscriber and the changes not yet sent to it.
+    """
+    __slots__ = ("video_ids", "changes", "ready", "closed")
+
+    def __init__(self, video_ids: list[int]):
+        self.video_ids = video_ids
+        self.changes = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def close(self) -> None:
+        """
+        Wake up the subscriber for good, for example on disconnect.
+        """
+        self.closed = True
+        self.ready.set()
+
+    async def get(self, timeout: float) -> Changes | None:
+        """
+        Wait for the next batch of changes.
+
+        Returns:
+            Changes | None: Coalesced changes, or None after ``timeout``.
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except TimeoutError:
+            return None
+        self.ready.clear()
+        changes, self.changes = self.changes, {}
+        return changes
+
+
+class LikeCountHub:
+    """
+    Per-worker fan-out of like-count changes to subscriptions.
+
+    Changes from the broker are kept per video and flushed once per
+    window, so a hot video produces one message per subscriber per window
+    however many likes it gets.
+    """
+
+    def __init__(self, broker: Broker, window: float):
+        self.broker = broker
+        self.window = window
+        self.pending = {}
+        self.subscriptions = defaultdict(set)
+        self._tasks = []
+
+    def subscribe(self, video_ids: list[int]) -> Subscription:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self.broker.listen(self.receive)),
+                asyncio.create_task(self._flush_loop()),
+            ]
+        subscription = Subscription(video_ids)
+        for video_id in video_ids:
+            self.subscriptions[video_id].add(subscription)
+        return subscription
+
+    def unsubscribe(
+        self, subscription: Subscription, video_ids=None
+    ) -> None:
+        """
+        Stop sending changes of some or, by default, all videos of a
+        subscription.
+        """
+        video_ids = set(
+            subscription.video_ids if video_ids is None else video_ids
+        )
+        for video_id in video_ids:
+            subscription.changes.pop(video_id, None)
+            subscribers = self.subscriptions.get(video_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscriptions[video_id]
+        subscription.video_ids = [
+            video_id for video_id in subscription.video_ids
+            if video_id not in video_ids
+        ]
+
+    def receive(self, changes: Changes) -> None:
+        for video_id, total_likes in changes.items():
+            if video_id in self.subscriptions:
+                self.pending[video_id] = total_likes
+
+    def flush(self) -> None:
+        pending, self.pending = self.pending, {}
+        for video_id, total_likes in pending.items():
+            for subscription in self.subscriptions.get(video_id, ()):
+                subscription.changes[video_id] = total_likes
+                subscription.ready.set()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.window)
+            self.flush()
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub() -> LikeCountHub:
+    """
+    Return the hub of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = LikeCountHub(
+            get_broker(), settings.LIVE_LIKES_WINDOW_SECONDS
+        )
+    return hub
+
+
+def publish_like_events(events: list[videos_models.OutboxEvent]) -> None:
+    """
+    Outbox handler publishing the like counts of videos changed by a batch
+    of like events.
+
+    Args:
+        events (list[videos_models.OutboxEvent]): Batch of events in id order.
+    """
+    video_ids = {
+        event.video_id for event in events
+        if event.kind in (
+            videos_models.OutboxEvent.LIKE_CREATED,
+            videos_models.OutboxEvent.LIKE_DELETED,
+        )
+    }
+    if not video_ids:
+        return
+    changes = dict(
+        videos_models.Video.objects.alive()
+        .filter(id__in=video_ids)
+        .values_list("id", "total_likes")
+    )
+    if videos_sharding.is_enabled():
+        # Счётчики на шардах новее total_likes, который догоняет их через
+        # потребителя like_counts
+        changes.update(
+            (video_id, total_likes)
+            for video_id, total_likes
+            in videos_sharding.LikeCounters.get(changes).items()
+            if video_id in changes
+        )
+    if changes:
+        get_broker().publish(changes)
+
+
+class LikeCountStreamApp:
+    """
+    ASGI application serving ``GET STREAM_PATH?ids=1,2,3`` as Server-Sent
+    Events and passing every other request to Django.
+
+    The first ``counts`` event holds the current counts of the visible
+    requested videos, every ``likes`` event the new counts of those that
+    changed, at most once per ``LIVE_LIKES_WINDOW_SECONDS``. A comment is
+    sent every ``LIVE_LIKES_KEEPALIVE_SECONDS`` to keep idle connections
+    open. Visibility rules are those of the video list; a JWT may be passed
+    in the Authorization header, and an invalid one is answered with 401 as
+    by the API.
+    """
+
+    STREAM_PATH = "/v1/videos/like-counts/stream/"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.STREAM_PATH:
+            return await self.app(scope, receive, send)
+        if scope["method"] != "GET":
+            return await self.respond(
+                send, 405, {"detail": "Method not allowed."}
+            )
+
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        serializer = videos_serializers.VideoIdsSerializer(
+            data={"ids": query.get("ids", [""])[-1]}
+        )
+        if not serializer.is_valid():
+            return await self.respond(send, 400, serializer.errors)
+        ids = serializer.validated_data["ids"]
+        authorization = dict(scope["headers"]).get(b"authorization")
+
+        hub = get_hub()
+        # Подписка раньше чтения счётчиков: изменения между ними не теряются
+        subscription = hub.subscribe(ids)
+        watcher = asyncio.create_task(
+            self.watch_disconnect(receive, subscription)
+        )
+        try:
+            try:
+                counts = await sync_to_async(
+                    self.snapshot, thread_sensitive=False
+                )(ids, authorization)
+            except (InvalidToken, AuthenticationFailed) as error:
+                # Как DRF: 401 с заголовком WWW-Authenticate
+                detail = error.detail
+                return await self.respond(
+                    send, error.status_code,
+                    detail if isinstance(detail, dict)
+                    else {"detail": detail},
+                    [(
+                        b"www-authenticate",
+                        JWTAuthentication().authenticate_header(None).encode(),
+                    )],
+                )
+            hub.unsubscribe(subscription, set(ids) - counts.keys())
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            })
+            await self.send_event(send, "counts", counts)
+
+            while not subscription.closed:
+                changes = await subscription.get(
+                    settings.LIVE_LIKES_KEEPALIVE_SECONDS
+                )
+                if subscription.closed:
+                    break
+                if changes is None:
+                    await self.send_body(send, b": keepalive\n\n")
+                else:
+                    await self.send_event(send, "likes", changes)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+            hub.unsubscribe(subscription)
+
+    @staticmethod
+    def snapshot(ids: list[int], authorization: bytes | None) -> Changes:
+        """
+        Authenticate the subscriber and read the current counts of the
+        visible videos.
+
+        The connection is closed right away: open streams hold no database
+        connection.
+
+        Raises:
+            AuthenticationFailed: The Authorization header holds an invalid
+                or expired token, or one of an unknown or inactive user.
+        """
+        try:
+            user = AnonymousUser()
+            if authorization:
+                authentication = JWTAuthentication()
+                raw_token = authentication.get_raw_token(authorization)
+                if raw_token is not None:
+                    user = authentication.get_user(
+                        authentication.get_validated_token(raw_token)
+                    )
+            return videos_services.LikeCounts.for_user(ids, user, cached=False)
+        finally:
+            connection.close()
+
+    @staticmethod
+    async def watch_disconnect(receive, subscription: Subscription) -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        subscription.close()
+
+    @classmethod
+    async def send_event(cls, send, name: str, counts: Changes) -> None:
+        await cls.send_body(
+            send, f"event: {name}\ndata: {json.dumps(counts)}\n\n".encode()
+        )
+
+    @staticmethod
+    async def send_body(send, body: bytes) -> None:
+        await send({
+            "type": "http.response.body", "body": body, "more_body": True,
+        })
+
+    @staticmethod
+    async def respond(
+        send, status: int, data: dict, headers: list | None = None
+    ) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"), *(headers or []),
+            ],
+        })
+        await send({
+            "type": "http.response.body", "body": json.dumps(data).encode(),
+        })
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from videos import services as videos_services
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит файлы видео, загруженные до адресации по содержимому, "
+        "и заполняет размер и sha256. Файлы хешируются параллельно"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Число потоков для хеширования",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        missing = []
+        for updated, batch_missing in videos_services.VideoFileMedia.backfill(
+            batch_size=options["batch_size"], workers=options["workers"]
+        ):
+            total += updated
+            missing += batch_missing
+            self.stdout.write(f"Обработано файлов: {total}")
+
+        for name in missing:
+            self.stdout.write(self.style.WARNING(f"Файл не найден: {name}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {total} файлов, не найдено: {len(missing)}"
+        ))
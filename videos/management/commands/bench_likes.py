@@ -0,0 +1,105 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import models as accounts_models
+from videos import models as videos_models
+from videos import services as videos_services
+from videos import sharding as videos_sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет задержку лайка/анлайка и выборок лайков по видео. "
+        "Запускайте до и после изменений схемы лайков для сравнения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ops",
+            type=int,
+            default=2000,
+        )
+        parser.add_argument(
+            "--videos",
+            type=int,
+            default=1000,
+            help="Сколько опубликованных видео участвует в замере",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=1000,
+            help="Сколько пользователей участвует в замере",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        videos = list(
+            videos_models.Video.objects.published()
+            .only("id", "owner_id", "is_published", "deleted_at")
+            .order_by("id")[:options["videos"]]
+        )
+        users = list(
+            accounts_models.User.objects.filter(is_active=True)
+            .order_by("id")[:options["users"]]
+        )
+        if not videos or not users:
+            raise CommandError(
+                "Нет опубликованных видео или пользователей, "
+                "запустите seed_data"
+            )
+
+        timings = {
+            "like": [], "unlike": [], "video_count": [], "video_user": []
+        }
+        started = time.perf_counter()
+        for _ in range(options["ops"]):
+            video, user = rng.choice(videos), rng.choice(users)
+            manager = videos_services.VideoLikeManager(user=user, video=video)
+
+            moment = time.perf_counter()
+            result = manager.like()
+            timings["like"].append(time.perf_counter() - moment)
+
+            # Лайк, поставленный замером, сразу снимается, данные не меняются
+            if result["created"]:
+                moment = time.perf_counter()
+                manager.unlike()
+                timings["unlike"].append(time.perf_counter() - moment)
+
+            likes = videos_models.Like.objects.using(
+                videos_sharding.shard_for(video.id)
+            ).filter(video_id=video.id)
+            moment = time.perf_counter()
+            likes.count()
+            timings["video_count"].append(time.perf_counter() - moment)
+
+            moment = time.perf_counter()
+            likes.filter(user_id=user.id).exists()
+            timings["video_user"].append(time.perf_counter() - moment)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{'operation':<12} {'count':>7} {'ops/s':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for name, samples in timings.items():
+            if len(samples) < 2:
+                continue
+            quantiles = statistics.quantiles(samples, n=100)
+            self.stdout.write(
+                f"{name:<12} {len(samples):>7} "
+                f"{len(samples) / sum(samples):>9.0f} "
+                f"{quantiles[49] * 1000:>8.2f} "
+                f"{quantiles[94] * 1000:>8.2f} "
+                f"{quantiles[98] * 1000:>8.2f}"
+            )
+        self.stdout.write(f"Всего: {elapsed:.1f} с")
@@ -0,0 +1,196 @@
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+APPLICATIONS = {
+    "sync": "video_project.wsgi:application",
+    "gthread": "video_project.wsgi:application",
+    "uvicorn": "video_project.asgi:application",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает gunicorn с настройками video_project.gunicorn_conf "
+        "с preload и без и замеряет время запуска, память воркеров и "
+        "задержку первых запросов. Только Linux: память читается из /proc"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--worker-class",
+            action="append",
+            choices=sorted(APPLICATIONS),
+            default=None,
+            help="Класс воркеров, можно несколько; по умолчанию sync",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+        )
+        parser.add_argument(
+            "--path",
+            default="/v1/videos/",
+            help="Путь, на котором замеряются запросы",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Сколько запросов отправить после первых",
+        )
+        parser.add_argument(
+            "--port",
+            type=int,
+            default=8765,
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists("/proc/self/smaps_rollup"):
+            raise CommandError("Нужен Linux с /proc/<pid>/smaps_rollup")
+
+        self.stdout.write(
+            f"{'variant':<18}{'boot s':>8}{'first ms':>10}{'warm ms':>9}"
+            f"{'RSS MB':>8}{'PSS MB':>8}{'USS MB':>8}{'master':>8}"
+        )
+        for worker_class in options["worker_class"] or ["sync"]:
+            for preload in (True, False):
+                result = self.measure(worker_class, preload, options)
+                variant = f"{worker_class}{'+preload' if preload else ''}"
+                self.stdout.write(
+                    f"{variant:<18}{result['boot']:>8.2f}"
+                    f"{result['first']:>10.1f}{result['warm']:>9.1f}"
+                    f"{result['rss']:>8.1f}{result['pss']:>8.1f}"
+                    f"{result['uss']:>8.1f}{result['master']:>8.1f}"
+                )
+
+    def measure(self, worker_class: str, preload: bool, options) -> dict:
+        """
+        Start one server, measure it and stop it.
+
+        Boot time lasts until the server listens and the whole process
+        tree is idle, i.e. every worker has loaded the application. Memory
+        is the per-worker average after the requests.
+        """
+        port = options["port"]
+        env = dict(
+            os.environ,
+            GUNICORN_WORKER_CLASS=worker_class,
+            GUNICORN_WORKERS=str(options["workers"]),
+            GUNICORN_PRELOAD=str(preload),
+            GUNICORN_BIND=f"127.0.0.1:{port}",
+        )
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn",
+                "-c", "python:video_project.gunicorn_conf",
+                APPLICATIONS[worker_class],
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_until_ready(server, port, options["workers"])
+            boot = time.perf_counter() - started
+
+            # По соединению на воркер: каждый получает свой первый запрос
+            with ThreadPoolExecutor(options["workers"]) as executor:
+                first = list(executor.map(
+                    lambda _: self.request(port, options["path"]),
+                    range(options["workers"]),
+                ))
+            warm = [
+                self.request(port, options["path"])
+                for _ in range(options["requests"])
+            ]
+
+            workers = [
+                self.memory(pid) for pid in self.children(server.pid)
+            ]
+            return {
+                "boot": boot,
+                "first": statistics.median(first) * 1000,
+                "warm": statistics.median(warm) * 1000,
+                "rss": statistics.mean(m["Rss"] for m in workers),
+                "pss": statistics.mean(m["Pss"] for m in workers),
+                "uss": statistics.mean(m["Uss"] for m in workers),
+                "master": self.memory(server.pid)["Pss"],
+            }
+        finally:
+            server.terminate()
+            server.wait(30)
+
+    def wait_until_ready(self, server, port: int, workers: int) -> None:
+        deadline = time.monotonic() + 120
+        while True:
+            if server.poll() is not None:
+                raise CommandError("gunicorn завершился при запуске")
+            if time.monotonic() > deadline:
+                raise CommandError("gunicorn не запустился за 120 секунд")
+            try:
+                socket.create_connection(("127.0.0.1", port), 1).close()
+            except OSError:
+                time.sleep(0.01)
+                continue
+            pids = [server.pid, *self.children(server.pid)]
+            if len(pids) <= workers:
+                time.sleep(0.01)
+                continue
+            before = sum(self.cpu_ticks(pid) for pid in pids)
+            time.sleep(0.2)
+            if sum(self.cpu_ticks(pid) for pid in pids) == before:
+                return
+
+    @staticmethod
+    def request(port: int, path: str) -> float:
+        client = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        started = time.perf_counter()
+        try:
+            client.request("GET", path)
+            response = client.getresponse()
+            response.read()
+        finally:
+            client.close()
+        if response.status >= 500:
+            raise CommandError(f"{path} ответил {response.status}")
+        return time.perf_counter() - started
+
+    @staticmethod
+    def children(pid: int) -> list[int]:
+        with open(f"/proc/{pid}/task/{pid}/children") as children_file:
+            return [int(child) for child in children_file.read().split()]
+
+    @staticmethod
+    def cpu_ticks(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/stat") as stat_file:
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+        except FileNotFoundError:
+            return 0
+        # utime и stime, поля 14 и 15 из proc(5)
+        return int(fields[11]) + int(fields[12])
+
+    @staticmethod
+    def memory(pid: int) -> dict[str, float]:
+        """
+        Return Rss, Pss and Uss (private pages) of a process in MB.
+        """
+        values = {}
+        with open(f"/proc/{pid}/smaps_rollup") as smaps_file:
+            for line in smaps_file:
+                name, _, rest = line.partition(":")
+                if rest.strip().endswith("kB"):
+                    values[name] = int(rest.split()[0]) / 1024
+        values["Uss"] = values["Private_Clean"] + values["Private_Dirty"]
+        return values
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from videos import bitmap as videos_bitmap
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестраивает битовую карту опубликованных видео из БД. "
+        "Запросы карту не строят: до первой сборки все id проверяются в БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help=(
+                "Не завершаться, а перестраивать карту каждые "
+                "PUBLISHED_BITMAP_REBUILD_SECONDS"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        bitmap = videos_bitmap.get_bitmap()
+        if bitmap is None:
+            raise CommandError("PUBLISHED_BITMAP_PATH не задан")
+        while True:
+            published = bitmap.rebuild()
+            _, max_id, *_ = bitmap.header()
+            self.stdout.write(
+                f"Опубликованных видео: {published}, максимальный id: {max_id}"
+            )
+            if not options["loop"]:
+                break
+            time.sleep(settings.PUBLISHED_BITMAP_REBUILD_SECONDS)
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from videos import recommendations as videos_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает похожие видео по общим лайкам. С --incremental "
+        "пересчитывает только видео из очереди консьюмера related_videos"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Пересчитать только видео, лайки которых изменились",
+        )
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=None,
+            help="Сколько похожих видео хранить (RELATED_VIDEOS_TOP_K)",
+        )
+        parser.add_argument(
+            "--min-co-likes",
+            type=int,
+            default=None,
+            help="Минимум общих пользователей (RELATED_VIDEOS_MIN_CO_LIKES)",
+        )
+        parser.add_argument(
+            "--max-user-likes",
+            type=int,
+            default=None,
+            help=(
+                "Пользователи с большим числом лайков не учитываются "
+                "(RELATED_VIDEOS_MAX_USER_LIKES)"
+            ),
+        )
+        parser.add_argument(
+            "--chunk-pairs",
+            type=int,
+            default=None,
+            help="Сколько пар видео держать в памяти за шаг",
+        )
+
+    def handle(self, *args, **options):
+        if videos_recommendations.np is None:
+            raise CommandError("Нужен numpy из extra analytics")
+        builder = videos_recommendations.RelatedVideoBuilder(
+            top_k=options["top_k"],
+            min_co_likes=options["min_co_likes"],
+            max_user_likes=options["max_user_likes"],
+            chunk_pairs=options["chunk_pairs"],
+            log=self.stdout.write,
+        )
+        started = time.perf_counter()
+        if options["incremental"]:
+            written = builder.compute_queued()
+        else:
+            written = builder.compute_all()
+        self.stdout.write(
+            f"Сохранено похожих видео: {written} "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
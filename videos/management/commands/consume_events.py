@@ -0,0 +1,88 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from videos import events as videos_events
+from videos import sharding as videos_sharding
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Доставляет события из outbox зарегистрированным обработчикам "
+        "пачками, сохраняя позицию каждого потребителя"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--consumer",
+            action="append",
+            default=None,
+            help="Имя потребителя из OUTBOX_CONSUMERS, по умолчанию все",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Не завершаться, а ждать новых событий",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Интервал опроса в режиме --loop, в секундах",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Удалять события, обработанные всеми потребителями",
+        )
+
+    def handle(self, *args, **options):
+        consumers = videos_events.Consumer.configured(options["batch_size"])
+        if options["consumer"]:
+            unknown = set(options["consumer"]) - {
+                consumer.name for consumer in consumers
+            }
+            if unknown:
+                raise CommandError(
+                    f"Неизвестные потребители: {', '.join(sorted(unknown))}"
+                )
+            consumers = [
+                consumer for consumer in consumers
+                if consumer.name in options["consumer"]
+            ]
+
+        while True:
+            try:
+                delivered = self.drain(consumers)
+                if options["prune"]:
+                    for using in videos_sharding.outbox_aliases():
+                        while videos_events.Consumer.prune(using=using):
+                            pass
+            except Exception:
+                if not options["loop"]:
+                    raise
+                # Пачка откатилась и будет доставлена повторно
+                logger.exception("Ошибка при обработке событий outbox")
+                delivered = 0
+            if delivered:
+                self.stdout.write(f"Обработано событий: {delivered}")
+            if not options["loop"]:
+                break
+            if not delivered:
+                time.sleep(options["poll_interval"])
+
+    def drain(self, consumers) -> int:
+        total = 0
+        for consumer in consumers:
+            while delivered := consumer.process_batch():
+                total += delivered
+        return total
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from videos import services as videos_services
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет из MEDIA_ROOT файлы видео, на которые не ссылается "
+        "ни одна строка VideoFile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            default="videos",
+            help="Каталог относительно MEDIA_ROOT",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            "--grace-period",
+            type=int,
+            default=None,
+            help="Не трогать файлы моложе стольких секунд, "
+                 "по умолчанию MEDIA_GC_GRACE_SECONDS",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0.0,
+            help="Не больше стольких удалений в секунду, 0 — без ограничения",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать файлы, которые будут удалены",
+        )
+
+    def handle(self, *args, **options):
+        collector = videos_services.OrphanedMediaCollector(
+            directory=options["directory"],
+            batch_size=options["batch_size"],
+            grace_seconds=options["grace_period"],
+            rate=options["rate"],
+            dry_run=options["dry_run"],
+        )
+        count = freed = 0
+        for name, size in collector.run():
+            count += 1
+            freed += size
+            if options["dry_run"] or options["verbosity"] > 1:
+                self.stdout.write(name)
+
+        action = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"Просмотрено файлов: {collector.scanned}. {action}: {count} "
+            f"({freed / 1024 / 1024:.1f} МБ)"
+        ))
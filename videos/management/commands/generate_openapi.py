@@ -0,0 +1,48 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from video_project import schema as project_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует OpenAPI-схему в статический файл, который отдаёт nginx. "
+        "Запускайте при каждом деплое"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Путь к файлу, по умолчанию OPENAPI_SCHEMA_PATH",
+        )
+        parser.add_argument(
+            "--format",
+            choices=("json", "yaml"),
+            default="json",
+            help="yaml только вместе с --output",
+        )
+
+    def handle(self, *args, **options):
+        # OPENAPI_SCHEMA_PATH отдаётся как application/json
+        if options["format"] != "json" and not options["output"]:
+            raise CommandError(
+                "Для --format yaml укажите --output: по умолчанию схема "
+                "пишется в OPENAPI_SCHEMA_PATH, который отдаётся как JSON"
+            )
+        path = options["output"] or settings.OPENAPI_SCHEMA_PATH
+        content = project_schema.generate_schema(options["format"])
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Файл заменяется атомарно, nginx не увидит его наполовину записанным
+        with open(f"{path}.tmp", "wb") as schema_file:
+            schema_file.write(content)
+        os.replace(f"{path}.tmp", path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Схема записана в {path} ({len(content)} байт)"
+        ))
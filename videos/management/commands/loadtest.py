@@ -0,0 +1,468 @@
+import asyncio
+import bisect
+import itertools
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import models as accounts_models
+from videos import models as videos_models
+from videos import sharding as videos_sharding
+
+
+DEFAULT_MIX = "list=40,detail=30,like=20,ids=2,stats=8"
+OPERATIONS = ("list", "detail", "like", "ids", "stats", "login")
+
+
+class HTTPClient:
+    """
+    Minimal HTTP/1.1 client over asyncio streams with keep-alive.
+
+    Servers that close the connection after each response (gunicorn sync
+    workers) are handled by reconnecting on the next request.
+    """
+
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = parts.scheme == "https"
+        self.host_header = parts.netloc
+        self.reader = None
+        self.writer = None
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        headers: dict | None = None,
+        body: bytes | None = None,
+    ) -> tuple[int, bytes]:
+        """
+        Send a request and read the whole response.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Request path with query string.
+            headers (dict | None): Extra request headers.
+            body (bytes | None): Request body.
+
+        Returns:
+            tuple[int, bytes]: Status code and response body.
+        """
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=self.ssl
+                )
+            try:
+                return await self._roundtrip(method, path, headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+            except ValueError:
+                # Непонятный ответ: где начинается следующий, неизвестно
+                await self.close()
+                raise
+
+    async def _roundtrip(self, method, path, headers, body):
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host_header}",
+            "Connection: keep-alive",
+        ]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(
+            ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if status in (204, 304) or method == "HEAD":
+            payload = b""
+        elif response_headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while size := int((await self.reader.readline()).split(b";")[0], 16):
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            while await self.reader.readline() not in (b"\r\n", b""):
+                pass
+            payload = b"".join(chunks)
+        elif "content-length" in response_headers:
+            payload = await self.reader.readexactly(
+                int(response_headers["content-length"])
+            )
+        else:
+            payload = await self.reader.read()
+            await self.close()
+            return status, payload
+
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, payload
+
+
+class ZipfSampler:
+    """
+    Picks items with Zipf-distributed popularity: the k-th hottest item is
+    chosen with probability proportional to 1 / k**exponent.
+    """
+
+    def __init__(self, items: list, exponent: float, rng: random.Random):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cumulative = list(itertools.accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+        self.rng = rng
+
+    def sample(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.items[bisect.bisect(self.cumulative, point)]
+
+
+class LoadTest:
+    """
+    Mixed API workload run by concurrent virtual users.
+
+    Attributes:
+        client_factory: Callable creating an HTTPClient per virtual user.
+        samples (dict): Latencies in seconds per endpoint.
+        errors (dict): Unexpected responses per endpoint.
+        touched (set): Ids of videos that were liked or unliked.
+    """
+
+    def __init__(self, options: dict, video_ids: list[int], pages: int):
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.videos = ZipfSampler(video_ids, options["zipf"], self.rng)
+        self.pages = pages
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.touched = set()
+        self.usernames = []
+
+        weights = parse_mix(options["mix"])
+        self.operations = [name for name in OPERATIONS if weights[name]]
+        self.weights = [weights[name] for name in self.operations]
+
+    def client(self) -> HTTPClient:
+        return HTTPClient(self.options["url"])
+
+    def auth_client(self) -> HTTPClient:
+        return HTTPClient(self.options["auth_url"] or self.options["url"])
+
+    async def timed(
+        self, client, name, method, path, token, expected, body=None
+    ):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(body).encode()
+        started = time.perf_counter()
+        try:
+            status, _ = await client.request(method, path, headers, body)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            # Оборванный или искажённый ответ считается ошибкой, а не
+            # прерывает виртуального пользователя
+            status = 0
+        self.samples[name].append(time.perf_counter() - started)
+        if status not in expected:
+            self.errors[name] += 1
+        return status
+
+    async def obtain_token(self, username: str, password: str) -> str:
+        client = self.auth_client()
+        body = json.dumps({"username": username, "password": password})
+        try:
+            status, payload = await client.request(
+                "POST", "/v1/accounts/auth/token/",
+                {"Content-Type": "application/json"}, body.encode(),
+            )
+        finally:
+            await client.close()
+        if status != 200:
+            raise CommandError(f"Не удалось получить токен для {username}")
+        return json.loads(payload)["access"]
+
+    async def virtual_user(self, token: str, staff_token: str | None, deadline):
+        client, auth_client = self.client(), self.auth_client()
+        rng = random.Random(self.rng.random())
+        try:
+            while time.monotonic() < deadline:
+                operation = rng.choices(self.operations, self.weights)[0]
+                if operation == "login":
+                    await self.timed(
+                        auth_client, "login", "POST",
+                        "/v1/accounts/auth/token/", None, (200,),
+                        body={
+                            "username": rng.choice(self.usernames),
+                            "password": self.options["password"],
+                        },
+                    )
+                    continue
+                await self.run_operation(
+                    client, rng, operation, token, staff_token
+                )
+        finally:
+            await client.close()
+            await auth_client.close()
+
+    async def run_operation(self, client, rng, operation, token, staff_token):
+        if operation == "list":
+            page = rng.randint(1, self.pages)
+            await self.timed(
+                client, "list", "GET", f"/v1/videos/?page={page}",
+                token, (200,),
+            )
+        elif operation == "detail":
+            video_id = self.videos.sample()
+            await self.timed(
+                client, "detail", "GET", f"/v1/videos/{video_id}/",
+                token, (200,),
+            )
+        elif operation == "like":
+            video_id = self.videos.sample()
+            self.touched.add(video_id)
+            path = f"/v1/videos/{video_id}/likes/"
+            status = await self.timed(
+                client, "like", "POST", path, token, (201, 400)
+            )
+            if status == 400:
+                await self.timed(
+                    client, "unlike", "DELETE", path, token, (204,)
+                )
+        elif operation == "ids":
+            await self.timed(
+                client, "ids", "GET", "/v1/videos/ids/", staff_token, (200,)
+            )
+        elif operation == "stats":
+            kind = rng.choice(("group-by", "subquery"))
+            await self.timed(
+                client, f"stats-{kind}", "GET",
+                f"/v1/videos/statistics-{kind}/", staff_token, (200,),
+            )
+
+    async def run(self, usernames: list[str]) -> float:
+        """
+        Log the virtual users in and drive the workload until the deadline.
+
+        Args:
+            usernames (list[str]): Usernames of the virtual users.
+
+        Returns:
+            float: Duration of the workload phase in seconds.
+        """
+        self.usernames = usernames
+        password = self.options["password"]
+        tokens = await asyncio.gather(*(
+            self.obtain_token(username, password) for username in usernames
+        ))
+        staff_token = None
+        if self.options["staff_username"]:
+            staff_token = await self.obtain_token(
+                self.options["staff_username"], self.options["staff_password"]
+            )
+
+        started = time.monotonic()
+        deadline = started + self.options["duration"]
+        await asyncio.gather(*(
+            self.virtual_user(token, staff_token, deadline) for token in tokens
+        ))
+        return time.monotonic() - started
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """
+    Parse a workload mix such as ``list=40,detail=30,like=20``.
+
+    Args:
+        mix (str): Comma separated operation weights.
+
+    Raises:
+        CommandError: If an operation is unknown or a weight is invalid.
+
+    Returns:
+        dict[str, float]: Weight per operation, missing ones are 0.
+    """
+    weights = dict.fromkeys(OPERATIONS, 0.0)
+    for item in filter(None, mix.split(",")):
+        name, _, weight = item.partition("=")
+        if name not in weights:
+            raise CommandError(f"Неизвестная операция: {name}")
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise CommandError(f"Некорректный вес операции: {item}")
+    return weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест запущенного сервиса: смесь списков, деталей, "
+        "лайков с горячими видео по Ципфу, выгрузки id и статистики"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://127.0.0.1:8000",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=20,
+            help="Число виртуальных пользователей",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=30.0,
+            help="Длительность нагрузки в секундах",
+        )
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help="Веса операций: list, detail, like, ids, stats, login",
+        )
+        parser.add_argument(
+            "--auth-url",
+            default=None,
+            help="Адрес отдельного пула авторизации, по умолчанию --url",
+        )
+        parser.add_argument(
+            "--password",
+            required=True,
+            help="Пароль пользователей, заданный в seed_data --password",
+        )
+        parser.add_argument(
+            "--staff-username",
+            default=None,
+            help="Сотрудник для ids и статистики",
+        )
+        parser.add_argument(
+            "--staff-password",
+            default=None,
+        )
+        parser.add_argument(
+            "--videos",
+            type=int,
+            default=10_000,
+            help="Сколько опубликованных видео участвует в нагрузке",
+        )
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Показатель распределения Ципфа для горячих видео",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+        )
+
+    def handle(self, *args, **options):
+        if not options["staff_username"]:
+            weights = parse_mix(options["mix"])
+            weights["ids"] = weights["stats"] = 0
+            options["mix"] = ",".join(
+                f"{name}={weight}" for name, weight in weights.items()
+            )
+            self.stdout.write(
+                "Без --staff-username операции ids и stats пропускаются"
+            )
+
+        usernames = list(
+            accounts_models.User.objects
+            .filter(is_active=True, is_staff=False, deleted_at__isnull=True)
+            .order_by("id")
+            .values_list("username", flat=True)[:options["concurrency"]]
+        )
+        published = videos_models.Video.objects.published()
+        video_ids = list(
+            published.order_by("id")
+            .values_list("id", flat=True)[:options["videos"]]
+        )
+        if not usernames or not video_ids:
+            raise CommandError(
+                "Нет пользователей или опубликованных видео, "
+                "запустите seed_data --password ..."
+            )
+        pages = max(1, min(published.count() // 25, 100))
+
+        load_test = LoadTest(options, video_ids, pages)
+        elapsed = asyncio.run(load_test.run(usernames))
+        self.report(load_test, elapsed)
+        self.check_counters(load_test.touched)
+
+    def report(self, load_test: LoadTest, elapsed: float) -> None:
+        self.stdout.write(
+            f"{'endpoint':<20} {'count':>7} {'errors':>7} {'rps':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        total = 0
+        for name, samples in sorted(load_test.samples.items()):
+            total += len(samples)
+            if len(samples) > 1:
+                quantiles = statistics.quantiles(samples, n=100)
+                p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+            else:
+                p50 = p95 = p99 = samples[0]
+            self.stdout.write(
+                f"{name:<20} {len(samples):>7} {load_test.errors[name]:>7} "
+                f"{len(samples) / elapsed:>8.1f} {p50 * 1000:>8.1f} "
+                f"{p95 * 1000:>8.1f} {p99 * 1000:>8.1f}"
+            )
+        self.stdout.write(
+            f"Всего запросов: {total} за {elapsed:.1f} с, "
+            f"{total / elapsed:.1f} rps"
+        )
+
+    def check_counters(self, video_ids: set[int]) -> None:
+        # Счётчики и строки лайков читаются с шардов, на которых они лежат
+        ids = sorted(video_ids)
+        counters = videos_sharding.LikeCounters.get(ids)
+        likes = videos_sharding.count_likes(ids)
+        mismatched = [
+            (video_id, counters.get(video_id, 0), likes[video_id])
+            for video_id in ids
+            if counters.get(video_id, 0) != likes[video_id]
+        ]
+        if mismatched:
+            for video_id, total_likes, likes_count in mismatched[:20]:
+                self.stdout.write(
+                    f"Видео {video_id}: total_likes={total_likes}, "
+                    f"лайков={likes_count}"
+                )
+            raise CommandError(
+                f"Счётчики лайков расходятся у {len(mismatched)} видео"
+            )
+        self.stdout.write(
+            f"Счётчики лайков совпадают у всех {len(ids)} затронутых видео"
+        )
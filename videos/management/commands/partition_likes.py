@@ -0,0 +1,87 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from videos import partitioning as videos_partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит таблицу лайков в секционированную по video_id "
+        "без остановки сервиса: prepare -> copy -> swap -> drop-old"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "step",
+            choices=["prepare", "copy", "swap", "drop-old", "abort", "status"],
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=None,
+            help="Число секций, по умолчанию LIKE_PARTITIONS или 16",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.05,
+            help="Пауза между пачками копирования в секундах",
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+        )
+
+    def handle(self, *args, **options):
+        if connections[options["database"]].vendor != "postgresql":
+            raise CommandError(
+                "Секционирование поддерживается только в PostgreSQL"
+            )
+        partitioning = videos_partitioning.LikePartitioning(
+            partitions=options["partitions"], using=options["database"]
+        )
+        step = options["step"]
+
+        if step == "prepare":
+            if partitioning.is_partitioned():
+                raise CommandError("Таблица лайков уже секционирована")
+            partitioning.prepare()
+            self.stdout.write(
+                f"Создана таблица {partitioning.shadow} "
+                f"из {partitioning.partitions} секций"
+            )
+        elif step == "copy":
+            for last_id, high in partitioning.copy(options["batch_size"]):
+                self.stdout.write(f"Скопировано до id {last_id} из {high}")
+                time.sleep(options["pause"])
+        elif step == "swap":
+            counts = partitioning.row_counts()
+            copied = counts.get(partitioning.shadow)
+            if copied != counts.get(partitioning.table):
+                raise CommandError(
+                    f"Число строк не совпадает: {counts}. "
+                    "Сначала завершите шаг copy"
+                )
+            partitioning.swap()
+            self.stdout.write(
+                f"Таблицы переключены, старая сохранена как {partitioning.old}"
+            )
+        elif step == "drop-old":
+            partitioning.drop_old()
+            self.stdout.write(f"Таблица {partitioning.old} удалена")
+        elif step == "abort":
+            partitioning.abort()
+            self.stdout.write(f"Таблица {partitioning.shadow} удалена")
+        else:
+            self.stdout.write(
+                f"Секционирована: {partitioning.is_partitioned()}"
+            )
+            for name, count in partitioning.row_counts().items():
+                self.stdout.write(f"{name}: {count}")
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from videos import services as videos_services
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет помеченных на удаление пользователей и видео "
+        "вместе с зависимыми строками небольшими пачками"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="Пауза между пачками в секундах",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Не завершаться, а ждать новых удалений",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=30.0,
+            help="Интервал опроса в режиме --loop, в секундах",
+        )
+
+    def handle(self, *args, **options):
+        deletion = videos_services.CascadeDeletion(
+            batch_size=options["batch_size"]
+        )
+        while True:
+            total = 0
+            while removed := deletion.purge_batch():
+                total += removed
+                time.sleep(options["pause"])
+            if total:
+                self.stdout.write(f"Удалено строк: {total}")
+            if not options["loop"]:
+                break
+            time.sleep(options["poll_interval"])
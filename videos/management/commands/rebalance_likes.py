@@ -0,0 +1,85 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from videos import sharding as videos_sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит корзины лайков между шардами. Без аргументов "
+        "распределяет корзины поровну по LIKE_SHARDS. Лайки переносимой "
+        "корзины на время переноса отвечают 503"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bucket",
+            type=int,
+            action="append",
+            default=None,
+            help="Перенести только эти корзины, вместе с --to",
+        )
+        parser.add_argument(
+            "--to",
+            help="Алиас БД, на который переносятся корзины --bucket",
+        )
+        parser.add_argument(
+            "--recount",
+            action="store_true",
+            help="Пересчитать счётчики всех корзин на их текущих шардах",
+        )
+        parser.add_argument(
+            "--group",
+            type=int,
+            default=16,
+            help="Сколько корзин переносится за одно ожидание карты",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать распределение и план переноса",
+        )
+
+    def handle(self, *args, **options):
+        if not videos_sharding.is_enabled():
+            raise CommandError("LIKE_SHARDS не задан")
+        current = videos_sharding.ShardMap.read()
+
+        if options["bucket"]:
+            if not options["to"]:
+                raise CommandError("Для --bucket нужен --to")
+            unknown = [
+                bucket for bucket in options["bucket"]
+                if bucket not in current
+            ]
+            if unknown:
+                raise CommandError(
+                    f"Нет корзин: {', '.join(map(str, unknown))}"
+                )
+            plan = [(bucket, options["to"]) for bucket in options["bucket"]]
+        elif options["recount"]:
+            plan = [
+                (bucket, alias)
+                for bucket, (alias, _) in sorted(current.items())
+            ]
+        else:
+            plan = videos_sharding.LikeShardRebalancer.plan()
+
+        distribution = Counter(alias for alias, _ in current.values())
+        for alias in sorted(set(settings.LIKE_SHARDS) | set(distribution)):
+            self.stdout.write(f"{alias}: корзин {distribution[alias]}")
+        self.stdout.write(f"Переносов в плане: {len(plan)}")
+        if options["dry_run"]:
+            for bucket, target in plan:
+                self.stdout.write(
+                    f"  {bucket}: {current[bucket][0]} -> {target}"
+                )
+            return
+
+        rebalancer = videos_sharding.LikeShardRebalancer(
+            log=self.stdout.write
+        )
+        total = rebalancer.move(plan, options["group"])
+        self.stdout.write(f"Перенесено лайков: {total}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from videos import services as videos_services
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает почасовые и посуточные агрегаты лайков "
+        "по существующим лайкам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10_000,
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Пересчитываем агрегаты лайков...")
+        total = videos_services.LikeRollups.backfill(
+            chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(f"Учтено лайков: {total}")
@@ -1,3 +1,4 @@
+from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from faker import Faker
@@ -21,6 +22,11 @@ class Command(BaseCommand):
             type=int,
             default=100_000,
         )
+        parser.add_argument(
+            "--password",
+            default=None,
+            help="Общий пароль пользователей, например для нагрузочных тестов",
+        )
 
     @transaction.atomic
     def handle(self, *args, **options):
@@ -28,9 +34,14 @@ class Command(BaseCommand):
         num_users = options["users"]
         num_videos = options["videos"]
 
+        # Хэш считается один раз, иначе PBKDF2 на каждого пользователя
+        password = make_password(options["password"])
+
         self.stdout.write(f"Создаём {num_users} пользователей...")
         users = [
-            accounts_models.User(username=f"user_{i}_{fake.user_name()}")
+            accounts_models.User(
+                username=f"user_{i}_{fake.user_name()}", password=password
+            )
             for i in range(num_users)
         ]
         accounts_models.User.objects.bulk_create(users, batch_size=1000)
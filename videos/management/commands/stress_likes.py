@@ -0,0 +1,134 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import models as accounts_models
+from videos import models as videos_models
+from videos import stress as videos_stress
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагружает лайки/анлайки из нескольких процессов и потоков, "
+        "печатает пропускную способность, задержки и ожидания блокировок, "
+        "проверяет инварианты счётчиков и возвращает лайки как были"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=4,
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Потоков в каждом процессе, у каждого своё соединение",
+        )
+        parser.add_argument(
+            "--ops",
+            type=int,
+            default=500,
+            help="Операций на поток",
+        )
+        parser.add_argument(
+            "--videos",
+            type=int,
+            default=200,
+            help="Сколько опубликованных видео участвует, вместе с горячими",
+        )
+        parser.add_argument(
+            "--hot",
+            type=int,
+            default=3,
+            help="Сколько из них горячих",
+        )
+        parser.add_argument(
+            "--hot-share",
+            type=float,
+            default=0.8,
+            help="Доля операций над горячими видео",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=500,
+            help="Сколько пользователей участвует",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Не возвращать лайки, изменённые нагрузкой",
+        )
+
+    def handle(self, *args, **options):
+        video_ids = list(
+            videos_models.Video.objects.published()
+            .order_by("-total_likes", "id")
+            .values_list("id", flat=True)[:options["videos"]]
+        )
+        user_ids = list(
+            accounts_models.User.objects.filter(is_active=True)
+            .order_by("id").values_list("id", flat=True)[:options["users"]]
+        )
+        if not video_ids or not user_ids:
+            raise CommandError(
+                "Нет опубликованных видео или пользователей, "
+                "запустите seed_data"
+            )
+
+        storm = videos_stress.LikeStorm(
+            video_ids, user_ids, hot=options["hot"],
+            hot_share=options["hot_share"], ops=options["ops"],
+            threads=options["threads"], processes=options["processes"],
+            seed=options["seed"],
+        )
+        liked = storm.liked_pairs()
+        try:
+            result = storm.run()
+            self._report(storm, result)
+            violations = videos_stress.check_invariants(video_ids)
+        finally:
+            if not options["keep"]:
+                self.stdout.write(
+                    f"Возвращено пар: {storm.restore(liked)}"
+                )
+        if violations:
+            for violation in violations:
+                self.stderr.write(violation)
+            raise CommandError(f"Нарушений инвариантов: {len(violations)}")
+        self.stdout.write("Инварианты выполнены")
+
+    def _report(self, storm, result):
+        self.stdout.write(
+            f"Процессов: {storm.processes}, потоков: {storm.threads}, "
+            f"видео: {len(storm.video_ids)} (горячих {storm.hot}), "
+            f"пользователей: {len(storm.user_ids)}"
+        )
+        for outcome, count in sorted(result["outcomes"].items()):
+            self.stdout.write(f"  {outcome}: {count}")
+        for error, count in sorted(result["errors"].items()):
+            self.stdout.write(f"  ошибка {error}: {count}")
+        self.stdout.write(
+            f"Операций в секунду: {result['ops_per_second']:.0f} "
+            f"за {result['elapsed']:.1f} с"
+        )
+        for action, percentiles in result["latency_ms"].items():
+            self.stdout.write(
+                f"  {action}: " + ", ".join(
+                    f"{name} {value:.1f} мс"
+                    for name, value in percentiles.items()
+                )
+            )
+        locks = result["locks"]
+        if locks:
+            self.stdout.write(
+                f"Ожидания блокировок: в {locks['waiting_share']:.0%} "
+                f"замеров из {locks['samples']}, в среднем "
+                f"{locks['waiting_mean']:.2f}, максимум "
+                f"{locks['waiting_max']}; дедлоков: {locks['deadlocks']}"
+            )
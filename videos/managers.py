@@ -0,0 +1,46 @@
+from django.db import models
+from django.db.models import Q
+
+
+class VideoQuerySet(models.QuerySet):
+    """
+    QuerySet for the Video model with shortcuts for visibility filters.
+    """
+
+    def alive(self):
+        """
+        Exclude videos that are scheduled for deletion.
+
+        Returns:
+            VideoQuerySet: Videos without a deletion mark.
+        """
+        return self.filter(deleted_at__isnull=True)
+
+    def published(self):
+        """
+        Return published videos that are not scheduled for deletion.
+
+        Returns:
+            VideoQuerySet: Published videos without a deletion mark.
+        """
+        return self.alive().filter(is_published=True)
+
+    def visible_to(self, user):
+        """
+        Return videos the user may see.
+
+        Staff users see all videos, authenticated users see published
+        videos and their own, anonymous users see published videos only.
+
+        Args:
+            user: Authenticated or anonymous user.
+
+        Returns:
+            VideoQuerySet: Visible videos without a deletion mark.
+        """
+        videos = self.alive()
+        if user.is_staff:
+            return videos
+        if user.is_authenticated:
+            return videos.filter(Q(is_published=True) | Q(owner=user))
+        return videos.filter(is_published=True)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import migrations
+
+from videos import partitioning as videos_partitioning
+
+
+def partition_like_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    if not settings.LIKE_PARTITIONS:
+        return
+    videos_partitioning.LikePartitioning(
+        using=schema_editor.connection.alias
+    ).partition_empty()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0003_like_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_like_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:55
+
+import videos.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0004_like_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videofile',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='videofile',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='videofile',
+            name='file',
+            field=models.FileField(storage=videos.storage.get_video_storage, upload_to='videos/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0005_videofile_content_addressed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videofile',
+            name='segment_index',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0008_video_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['id'], include=('total_likes', 'is_published', 'owner'), name='video_like_counts_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0009_video_like_counts_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['updated_at'], name='video_updated_idx'),
+        ),
+    ]
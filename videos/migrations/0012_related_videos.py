@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0011_like_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedVideoRefresh',
+            fields=[
+                ('video_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedVideo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('co_likes', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='videos.video')),
+                ('video', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='related_videos', to='videos.video')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('video', 'rank'), name='related_video_rank_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:57
+
+import videos.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0013_like_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='videofile',
+            name='file',
+            field=models.FileField(db_index=True, storage=videos.storage.get_video_storage, upload_to='videos/'),
+        ),
+    ]
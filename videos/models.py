@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from videos import managers as videos_managers
+from videos import storage as videos_storage
 
 
 class BaseModel(models.Model):
@@ -34,6 +38,8 @@ class Video(BaseModel):
         is_published (BooleanField): Indicates if the video is published.
         name (CharField): Name/title of the video.
         total_likes: Total number of likes the video has received.
+        deleted_at (DateTimeField): Set when the video is scheduled for
+            deletion; dependent rows are purged in the background.
     """
     owner = models.ForeignKey(
         "accounts.User",
@@ -43,10 +49,77 @@ class Video(BaseModel):
     is_published = models.BooleanField(default=False)
     name = models.CharField(max_length=255)
     total_likes = models.PositiveIntegerField(default=0)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = videos_managers.VideoQuerySet.as_manager()
+
+    class Meta:
+        # Индексы под фильтры и сортировки списка видео (videos.filters)
+        indexes = [
+            models.Index(
+                fields=['-total_likes', '-id'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='video_likes_idx',
+            ),
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='video_created_idx',
+            ),
+            models.Index(
+                fields=['owner', '-total_likes', '-id'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='video_owner_likes_idx',
+            ),
+            models.Index(
+                fields=['owner', '-created_at', '-id'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='video_owner_created_idx',
+            ),
+            # Покрывающий индекс для опроса счётчиков лайков
+            models.Index(
+                fields=['id'],
+                include=['total_likes', 'is_published', 'owner'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='video_like_counts_idx',
+            ),
+            # Инкрементальное обновление снимка статистики (videos.analytics)
+            models.Index(fields=['updated_at'], name='video_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_is_published = instance.__dict__.get("is_published")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the video and append a publish or unpublish outbox event in
+        the same transaction when ``is_published`` changed.
+        """
+        stored = getattr(self, "_stored_is_published", False)
+        current = self.__dict__.get("is_published")
+        if current is None or stored is None or current == stored:
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            OutboxEvent.objects.create(
+                kind=(
+                    OutboxEvent.VIDEO_PUBLISHED if current
+                    else OutboxEvent.VIDEO_UNPUBLISHED
+                ),
+                video_id=self.id,
+                owner_id=self.owner_id,
+                occurred_at=self.updated_at,
+            )
+        self._stored_is_published = current
+
 
 class VideoFile(BaseModel):
     """
@@ -55,8 +128,15 @@ class VideoFile(BaseModel):
     Attributes:
         QUALITY_CHOICES (tuple): Available quality options for the video file.
         video (ForeignKey): Reference to the parent Video object.
-        file (FileField): Uploaded video file.
+        file (FileField): Uploaded video file, stored under the SHA-256 of
+            its content and shared by rows with identical content. Indexed,
+            so files are reference-counted by name.
         quality (CharField): Quality of the video file (HD, FHD, UHD).
+        size (PositiveBigIntegerField): File size in bytes.
+        sha256 (CharField): Hex SHA-256 of the file content.
+        segment_index (JSONField): Byte ranges and durations of the file's
+            fragments for streaming manifests, computed on first use and
+            reset when the file changes.
     """
     QUALITY_CHOICES = (
         ('HD', '720p'),
@@ -68,46 +148,90 @@ class VideoFile(BaseModel):
         on_delete=models.CASCADE,
         related_name='files'
     )
-    file = models.FileField(upload_to='videos/')
+    file = models.FileField(
+        upload_to='videos/',
+        storage=videos_storage.get_video_storage,
+        db_index=True,
+    )
     quality = models.CharField(max_length=3, choices=QUALITY_CHOICES)
+    size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    sha256 = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    segment_index = models.JSONField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.video.name} [{self.quality}]"
 
+    def save(self, *args, **kwargs):
+        """
+        Store a new file and record its size and checksum.
+
+        The checksum is computed while the file is written, and identical
+        content already in storage is reused instead of written again.
+        """
+        if self.file and not self.file._committed:
+            self.file.save(self.file.name, self.file.file, save=False)
+            self.sha256 = self.file.storage.digest(self.file.name)
+            self.size = self.file.size
+            self.segment_index = None
+        super().save(*args, **kwargs)
+
 
 class Like(BaseModel):
     """
     Model representing a like by a user on a video.
 
+    Rows are stored on the like shard of the video (``videos.sharding``),
+    so the foreign keys have no database constraint.
+
     Attributes:
         video (ForeignKey): Reference to the liked Video object.
         user (ForeignKey): Reference to the User who liked the video.
 
     Meta:
         unique_together: Ensures a user can like a video only once.
+        indexes: ``like_user_created_idx`` lists the likes of a user newest
+            first from the index alone.
     """
     video = models.ForeignKey(
         "videos.Video",
         on_delete=models.CASCADE,
-        related_name='likes'
+        related_name='likes',
+        db_constraint=False,
     )
     user = models.ForeignKey(
         "accounts.User",
         on_delete=models.CASCADE,
-        related_name='likes'
+        related_name='likes',
+        db_constraint=False,
+        # Ведущий столбец like_user_created_idx
+        db_index=False,
     )
 
     class Meta:
         unique_together = ('video', 'user')
+        indexes = [
+            # Лайки пользователя от новых к старым без обращения к таблице
+            models.Index(
+                fields=['user', '-created_at', '-video'],
+                name='like_user_created_idx',
+            ),
+        ]
 
     def clean(self):
         """
         Validate that likes can only be added to published videos.
 
         Raises:
-            ValidationError: If the video is not published.
+            ValidationError: If the video is not published or is scheduled
+                for deletion.
         """
-        if not self.video.is_published:
+        if not self.video.is_published or self.video.deleted_at:
             raise ValidationError(
                 "Cannot add or remove likes for unpublished videos."
             )
@@ -117,7 +241,207 @@ class Like(BaseModel):
         Validate and save the Like instance.
 
         Calls full_clean() before saving to enforce validation rules.
+        Uniqueness of ``(video, user)`` is left to the database: a query
+        checking it races with concurrent likes and raised ValidationError
+        where ``get_or_create`` expects IntegrityError.
         """
-        self.full_clean()
+        self.full_clean(validate_unique=False)
         super().save(*args, **kwargs)
 
+
+class VideoLikeCount(models.Model):
+    """
+    Like counter of a video whose likes are on a like shard other than the
+    default database; ``Video.total_likes`` follows it through the outbox.
+
+    Attributes:
+        video_id (BigIntegerField): Id of the video.
+        total_likes (BigIntegerField): Number of likes of the video.
+    """
+    video_id = models.BigIntegerField(primary_key=True)
+    total_likes = models.BigIntegerField(default=0)
+
+
+class LikeRollup(models.Model):
+    """
+    Abstract model for like counts aggregated into time buckets.
+
+    A bucket holds the number of likes created within it that still exist,
+    so unlikes are subtracted from the bucket of the removed like.
+
+    Attributes:
+        GRANULARITY_CHOICES (tuple): Available bucket sizes.
+        granularity (CharField): Bucket size, hour or day.
+        bucket (DateTimeField): Start of the bucket in UTC.
+        likes (IntegerField): Number of likes in the bucket.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = (
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    )
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    likes = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class VideoLikeRollup(LikeRollup):
+    """
+    Likes per video aggregated by hour and by day.
+
+    Attributes:
+        video (ForeignKey): Reference to the liked Video object.
+    """
+    video = models.ForeignKey(
+        "videos.Video",
+        on_delete=models.CASCADE,
+        related_name='like_rollups'
+    )
+
+    class Meta:
+        unique_together = ('video', 'granularity', 'bucket')
+
+
+class OwnerLikeRollup(LikeRollup):
+    """
+    Likes on all videos of an owner aggregated by hour and by day.
+
+    Attributes:
+        owner (ForeignKey): Reference to the User who owns the liked videos.
+    """
+    owner = models.ForeignKey(
+        "accounts.User",
+        on_delete=models.CASCADE,
+        related_name='like_rollups'
+    )
+
+    class Meta:
+        unique_together = ('owner', 'granularity', 'bucket')
+        indexes = [
+            models.Index(fields=['granularity', 'bucket']),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    Event appended in the transaction of the change it describes.
+
+    Rows are compact and have no foreign keys, so they outlive the rows
+    they describe and cost no index maintenance on those tables. The id
+    orders events for consumers.
+
+    Attributes:
+        KIND_CHOICES (tuple): Available event kinds.
+        kind (PositiveSmallIntegerField): Kind of the change.
+        video_id (BigIntegerField): Id of the affected video.
+        owner_id (BigIntegerField): Id of the video owner.
+        user_id (BigIntegerField): Id of the user who liked or unliked.
+        occurred_at (DateTimeField): Creation time of the like for like
+            events, time of the change for publish events.
+        created_at (DateTimeField): Time the event was appended.
+    """
+    LIKE_CREATED = 1
+    LIKE_DELETED = 2
+    VIDEO_PUBLISHED = 3
+    VIDEO_UNPUBLISHED = 4
+    KIND_CHOICES = (
+        (LIKE_CREATED, 'Like created'),
+        (LIKE_DELETED, 'Like deleted'),
+        (VIDEO_PUBLISHED, 'Video published'),
+        (VIDEO_UNPUBLISHED, 'Video unpublished'),
+    )
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    video_id = models.BigIntegerField()
+    owner_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True, blank=True)
+    occurred_at = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+
+class OutboxCheckpoint(models.Model):
+    """
+    Position of an outbox consumer.
+
+    Attributes:
+        consumer (CharField): Name of the consumer in OUTBOX_CONSUMERS.
+        position (BigIntegerField): Id of the last handled event.
+        updated_at (DateTimeField): Time the position last moved.
+    """
+    consumer = models.CharField(max_length=100, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class LikeShardBucket(models.Model):
+    """
+    Database alias holding the likes of the videos in a bucket.
+
+    Attributes:
+        bucket (PositiveIntegerField): ``video_id % LIKE_SHARD_BUCKETS``.
+        alias (CharField): Database alias of the bucket.
+        moving_from (CharField): Alias the bucket is being moved from, empty
+            when it is not being moved; likes of its videos are refused
+            meanwhile.
+    """
+    bucket = models.PositiveIntegerField(primary_key=True)
+    alias = models.CharField(max_length=100)
+    moving_from = models.CharField(max_length=100, blank=True, default="")
+
+
+class RelatedVideo(models.Model):
+    """
+    Video liked by the same users as another video, precomputed by
+    ``videos.recommendations``.
+
+    Attributes:
+        video (ForeignKey): Video the recommendation is shown for.
+        related (ForeignKey): Recommended video.
+        rank (PositiveSmallIntegerField): Position of the recommendation,
+            starting at 0 for the most similar video.
+        score (FloatField): Cosine similarity of the like vectors.
+        co_likes (PositiveIntegerField): Number of users who liked both.
+        computed_at (DateTimeField): Time the row was computed.
+
+    Meta:
+        constraints: One video per rank; the index of the constraint
+            serves the related videos of a video in rank order.
+    """
+    video = models.ForeignKey(
+        "videos.Video",
+        on_delete=models.CASCADE,
+        related_name='related_videos',
+        # Ведущий столбец related_video_rank_uniq
+        db_index=False,
+    )
+    related = models.ForeignKey(
+        "videos.Video",
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    co_likes = models.PositiveIntegerField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['video', 'rank'], name='related_video_rank_uniq'
+            ),
+        ]
+
+
+class RelatedVideoRefresh(models.Model):
+    """
+    Video whose likes changed since its related videos were computed.
+
+    Attributes:
+        video_id (BigIntegerField): Id of the video.
+        queued_at (DateTimeField): Time the latest change was queued.
+    """
+    video_id = models.BigIntegerField(primary_key=True)
+    queued_at = models.DateTimeField(default=timezone.now)
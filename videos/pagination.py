@@ -1,5 +1,13 @@
+import base64
+import binascii
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -28,3 +36,80 @@ class CustomPageNumberPagination(PageNumberPagination):
             'has_next': self.page.has_next(),
             'data': data
         })
+
+
+class LikeKeysetPagination:
+    """
+    Keyset pagination over ``(created_at, video_id)`` like keys.
+
+    The cursor is an opaque token holding the key of the last like of a
+    page, so every page costs one index range scan whatever its depth, and
+    likes added meanwhile never shift the following pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'per_page'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request: Request) -> tuple | None:
+        """
+        Return the like key of the cursor, or None without a cursor.
+
+        Raises:
+            NotFound: If the cursor is malformed.
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            created_at, video_id = base64.urlsafe_b64decode(
+                token.encode('ascii')
+            ).decode('ascii').split('|')
+            key = (datetime.fromisoformat(created_at), int(video_id))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if key[0].tzinfo is None:
+            raise NotFound(self.invalid_cursor_message)
+        return key
+
+    def encode_cursor(self, key: tuple) -> str:
+        created_at, video_id = key
+        return base64.urlsafe_b64encode(
+            f'{created_at.isoformat()}|{video_id}'.encode('ascii')
+        ).decode('ascii')
+
+    def get_paginated_response(
+        self, request: Request, data, next_key: tuple | None
+    ) -> Response:
+        """
+        Construct a page response with the link to the next page.
+
+        Args:
+            request (Request): DRF request of the page.
+            data: Serialized page data.
+            next_key (tuple | None): Like key to continue after, None on
+                the last page.
+
+        Returns:
+            Response: DRF Response with page metadata and data.
+        """
+        next_url = None
+        if next_key is not None:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param,
+                self.encode_cursor(next_key),
+            )
+        return Response({
+            'per_page': self.get_page_size(request),
+            'has_next': next_url is not None,
+            'next': next_url,
+            'data': data,
+        })
@@ -0,0 +1,269 @@
+from django.conf import settings
+from django.db import connections, transaction
+
+from videos import models as videos_models
+
+
+class LikePartitioning:
+    """
+    Converts the Like table into a PostgreSQL table hash-partitioned by
+    ``video_id``.
+
+    Every unique constraint of a partitioned table must include the
+    partition key. The ``(video_id, user_id)`` uniqueness already does, and
+    the primary key becomes ``(id, video_id)``. Django keeps treating ``id``
+    alone as the primary key, which stays safe because ids still come from
+    a single sequence.
+
+    An existing table is migrated online: a partitioned shadow table is
+    created, a trigger mirrors concurrent inserts and deletes into it, rows
+    are copied in id-ordered batches and the tables are swapped in one short
+    transaction.
+
+    Attributes:
+        partitions (int): Number of hash partitions.
+        using (str): Database alias to operate on.
+    """
+
+    def __init__(self, partitions: int | None = None, using: str = "default"):
+        self.partitions = partitions or settings.LIKE_PARTITIONS or 16
+        self.using = using
+        self.table = videos_models.Like._meta.db_table
+        self.shadow = f"{self.table}_partitioned"
+        self.old = f"{self.table}_unpartitioned"
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def quote(self, name: str) -> str:
+        return self.connection.ops.quote_name(name)
+
+    def is_partitioned(self) -> bool:
+        """
+        Check whether the Like table is already partitioned.
+
+        Returns:
+            bool: True if the table is a partitioned table.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relkind FROM pg_class "
+                "WHERE oid = to_regclass(%s)",
+                [self.table],
+            )
+            row = cursor.fetchone()
+        return bool(row) and row[0] == "p"
+
+    def partition_empty(self) -> bool:
+        """
+        Partition the Like table in place if it holds no rows yet.
+
+        Used by migrations on fresh databases; populated tables must be
+        converted online with the ``partition_likes`` command.
+
+        Returns:
+            bool: True if the table was converted.
+        """
+        if self.is_partitioned():
+            return False
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {self.quote(self.table)})"
+            )
+            if cursor.fetchone()[0]:
+                return False
+        with transaction.atomic(using=self.using):
+            self.prepare(mirror=False)
+            self.swap()
+            self.drop_old()
+        return True
+
+    def prepare(self, mirror: bool = True) -> None:
+        """
+        Create the partitioned shadow table and the mirroring trigger.
+
+        Columns, defaults, foreign keys and non-unique indexes are copied
+        from the current table, so later schema additions carry over.
+
+        Args:
+            mirror (bool): Install the trigger that mirrors concurrent
+                writes into the shadow table.
+        """
+        table, shadow = self.quote(self.table), self.quote(self.shadow)
+        sequence = self.quote(f"{self.shadow}_id_seq")
+        with transaction.atomic(using=self.using), \
+                self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS) "
+                "PARTITION BY HASH (video_id)"
+            )
+            cursor.execute(f"CREATE SEQUENCE {sequence} OWNED BY {shadow}.id")
+            cursor.execute(
+                f"ALTER TABLE {shadow} "
+                f"ALTER COLUMN id SET DEFAULT nextval('{sequence}')"
+            )
+            cursor.execute(
+                f"ALTER TABLE {shadow} ADD PRIMARY KEY (id, video_id), "
+                "ADD UNIQUE (video_id, user_id)"
+            )
+            for remainder in range(self.partitions):
+                partition = self.quote(f"{self.shadow}_{remainder}")
+                cursor.execute(
+                    f"CREATE TABLE {partition} PARTITION OF {shadow} "
+                    "FOR VALUES WITH "
+                    f"(MODULUS {self.partitions}, REMAINDER {remainder})"
+                )
+
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+                [self.table],
+            )
+            for name, definition in cursor.fetchall():
+                cursor.execute(
+                    f"ALTER TABLE {shadow} ADD CONSTRAINT "
+                    f"{self.quote(name + '_p')} {definition}"
+                )
+
+            cursor.execute(
+                "SELECT c.relname, pg_get_indexdef(i.indexrelid) "
+                "FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE i.indrelid = to_regclass(%s) "
+                "AND NOT i.indisprimary AND NOT i.indisunique",
+                [self.table],
+            )
+            for name, definition in cursor.fetchall():
+                definition = definition.replace(
+                    f"INDEX {name} ON", f"INDEX {name}_p ON", 1
+                ).replace(
+                    f" ON public.{self.table} ", f" ON {shadow} ", 1
+                ).replace(
+                    f" ON {self.table} ", f" ON {shadow} ", 1
+                )
+                cursor.execute(definition)
+
+            if mirror:
+                self._create_mirror(cursor)
+
+    def _create_mirror(self, cursor) -> None:
+        table, shadow = self.quote(self.table), self.quote(self.shadow)
+        function = self.quote(f"{self.shadow}_mirror")
+        cursor.execute(
+            f"CREATE FUNCTION {function}() RETURNS trigger AS $$ "
+            "BEGIN "
+            "IF TG_OP IN ('DELETE', 'UPDATE') THEN "
+            f"DELETE FROM {shadow} "
+            "WHERE id = OLD.id AND video_id = OLD.video_id; "
+            "END IF; "
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f"INSERT INTO {shadow} SELECT (NEW).* ON CONFLICT DO NOTHING; "
+            "END IF; "
+            "RETURN NULL; "
+            "END $$ LANGUAGE plpgsql"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {function} "
+            f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {function}()"
+        )
+
+    def _drop_mirror(self, cursor) -> None:
+        function = self.quote(f"{self.shadow}_mirror")
+        cursor.execute(
+            f"DROP TRIGGER IF EXISTS {function} ON {self.quote(self.table)}"
+        )
+        cursor.execute(f"DROP FUNCTION IF EXISTS {function}()")
+
+    def copy(self, batch_size: int = 10_000):
+        """
+        Copy existing rows into the shadow table in id-ordered batches.
+
+        Each batch locks its source rows ``FOR SHARE``, so a concurrent
+        unlike waits for the batch and is then mirrored by the trigger
+        instead of leaving a stale copy behind. Already mirrored rows are
+        skipped.
+
+        Args:
+            batch_size (int): Id range copied per transaction.
+
+        Yields:
+            tuple[int, int]: Last copied id and the max id to reach.
+        """
+        table, shadow = self.quote(self.table), self.quote(self.shadow)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) "
+                f"FROM {table}"
+            )
+            low, high = cursor.fetchone()
+        last_id = low - 1
+        while last_id < high:
+            upper = min(last_id + batch_size, high)
+            with transaction.atomic(using=self.using), \
+                    self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {shadow} SELECT * FROM ("
+                    f"SELECT * FROM {table} WHERE id > %s AND id <= %s "
+                    "FOR SHARE) AS batch ON CONFLICT DO NOTHING",
+                    [last_id, upper],
+                )
+            last_id = upper
+            yield last_id, high
+
+    def swap(self) -> None:
+        """
+        Replace the Like table with the partitioned shadow table.
+
+        Runs in one transaction holding an exclusive lock on the Like table,
+        so no write can slip between the last mirrored row and the rename.
+        The old table is kept as ``<table>_unpartitioned`` until dropped.
+        """
+        table, shadow = self.quote(self.table), self.quote(self.shadow)
+        sequence = f"{self.shadow}_id_seq"
+        with transaction.atomic(using=self.using), \
+                self.connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            self._drop_mirror(cursor)
+            cursor.execute(
+                "SELECT setval(%s, "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)",
+                [sequence],
+            )
+            cursor.execute(
+                f"ALTER TABLE {table} RENAME TO {self.quote(self.old)}"
+            )
+            cursor.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+
+    def drop_old(self) -> None:
+        """
+        Drop the unpartitioned table kept by :meth:`swap`.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.quote(self.old)}")
+
+    def abort(self) -> None:
+        """
+        Remove the mirroring trigger and the shadow table before a swap.
+        """
+        with transaction.atomic(using=self.using), \
+                self.connection.cursor() as cursor:
+            self._drop_mirror(cursor)
+            cursor.execute(f"DROP TABLE IF EXISTS {self.quote(self.shadow)}")
+
+    def row_counts(self) -> dict[str, int]:
+        """
+        Count rows in the Like, shadow and old tables that exist.
+
+        Returns:
+            dict[str, int]: Row count per existing table name.
+        """
+        counts = {}
+        with self.connection.cursor() as cursor:
+            for name in (self.table, self.shadow, self.old):
+                cursor.execute("SELECT to_regclass(%s)", [name])
+                if cursor.fetchone()[0] is None:
+                    continue
+                cursor.execute(f"SELECT COUNT(*) FROM {self.quote(name)}")
+                counts[name] = cursor.fetchone()[0]
+        return counts
@@ -0,0 +1,363 @@
+"""
+Related videos from co-likes.
+
+Optional: needs NumPy. Two published videos are related when the same
+users liked them, scored by the cosine similarity of their like vectors,
+``co_likes / sqrt(total_likes_a * total_likes_b)``. Every video keeps its
+``RELATED_VIDEOS_TOP_K`` best videos in
+:class:`~videos.models.RelatedVideo`, so the API reads them with one
+indexed query.
+
+Likes of every like shard are read into a sparse user × video matrix kept
+twice, ordered by user and by video (CSR and CSC). Co-likes are counted for
+a block of videos at a time by expanding the likes of the users who liked
+them; blocks are sized so that at most ``RELATED_VIDEOS_CHUNK_PAIRS`` pairs
+are in memory, whatever the number of videos. Users with more than
+``RELATED_VIDEOS_MAX_USER_LIKES`` likes are left out: they cost the square
+of their likes and say little about similarity.
+
+The ``related_videos`` outbox consumer queues videos whose likes or
+publication changed in :class:`~videos.models.RelatedVideoRefresh`. An
+incremental run reads only the likes of the users who liked the queued
+videos and recomputes those videos; other videos they were co-liked with
+are refreshed by the next full run.
+"""
+
+from array import array
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from videos import models as videos_models
+from videos import sharding as videos_sharding
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Сколько строк читается за раз и сколько видео сохраняется за транзакцию
+CHUNK_SIZE = 1000
+REFRESH_EVENTS = (
+    videos_models.OutboxEvent.LIKE_CREATED,
+    videos_models.OutboxEvent.LIKE_DELETED,
+    videos_models.OutboxEvent.VIDEO_PUBLISHED,
+    videos_models.OutboxEvent.VIDEO_UNPUBLISHED,
+)
+
+
+def _pointers(counts):
+    pointers = np.zeros(len(counts) + 1, np.int64)
+    np.cumsum(counts, out=pointers[1:])
+    return pointers
+
+
+def _ranges(starts, counts):
+    """
+    Concatenate ``arange(start, start + count)`` for every pair.
+    """
+    ends = np.cumsum(counts)
+    total = int(ends[-1]) if len(ends) else 0
+    return np.repeat(starts - ends + counts, counts) + np.arange(total)
+
+
+class LikeMatrix:
+    """
+    Sparse user × video matrix of likes on published videos.
+
+    Attributes:
+        video_ids: Video ids of the columns in ascending order.
+        video_likes: ``total_likes`` of every column, at least 1.
+        user_likes: Number of likes of every row, 0 for left out users.
+    """
+
+    def __init__(self, like_videos, like_users, video_ids, video_likes,
+                 max_user_likes: int):
+        columns = np.searchsorted(video_ids, like_videos)
+        known = columns < len(video_ids)
+        known[known] = video_ids[columns[known]] == like_videos[known]
+        columns = columns[known]
+        _, rows = np.unique(like_users[known], return_inverse=True)
+        user_likes = np.bincount(rows)
+        kept = user_likes[rows] <= max_user_likes
+        rows, columns = rows[kept], columns[kept]
+        user_likes[user_likes > max_user_likes] = 0
+
+        self.video_ids = video_ids
+        self.video_likes = np.maximum(video_likes, 1)
+        self.user_likes = user_likes
+        order = np.argsort(rows, kind="stable")
+        self.user_videos = columns[order]
+        self.user_pointers = _pointers(user_likes)
+        order = np.argsort(columns, kind="stable")
+        self.video_users = rows[order]
+        self.video_pointers = _pointers(
+            np.bincount(columns, minlength=len(video_ids))
+        )
+        # Сколько пар даёт каждое видео: сумма лайков его пользователей
+        expanded = _pointers(user_likes[self.video_users])
+        self.video_pairs = (
+            expanded[self.video_pointers[1:]]
+            - expanded[self.video_pointers[:-1]]
+        )
+
+    def columns_of(self, video_ids):
+        """
+        Return the columns of the videos that are in the matrix.
+        """
+        video_ids = np.asarray(video_ids, np.int64)
+        columns = np.searchsorted(self.video_ids, video_ids)
+        known = columns < len(self.video_ids)
+        known[known] = self.video_ids[columns[known]] == video_ids[known]
+        return columns[known]
+
+    def blocks(self, columns, max_pairs: int):
+        """
+        Split columns into blocks expanding at most ``max_pairs`` pairs, or
+        one column when it alone expands more.
+        """
+        pairs = np.cumsum(self.video_pairs[columns])
+        start = 0
+        while start < len(columns):
+            base = pairs[start - 1] if start else 0
+            end = int(np.searchsorted(pairs, base + max_pairs, side="right"))
+            end = min(max(end, start + 1), start + CHUNK_SIZE)
+            yield columns[start:end]
+            start = end
+
+    def top_related(self, columns, top_k: int, min_co_likes: int) -> tuple:
+        """
+        Rank the videos co-liked with a block of columns.
+
+        Returns:
+            tuple: Arrays of source columns, related columns, co-likes,
+            scores and ranks, ordered by source and rank.
+        """
+        starts = self.video_pointers[columns]
+        counts = self.video_pointers[columns + 1] - starts
+        sources = np.repeat(np.arange(len(columns)), counts)
+        users = self.video_users[_ranges(starts, counts)]
+        counts = self.user_likes[users]
+        sources = np.repeat(sources, counts)
+        targets = self.user_videos[_ranges(self.user_pointers[users], counts)]
+
+        other = targets != columns[sources]
+        keys, co_likes = np.unique(
+            sources[other] * len(self.video_ids) + targets[other],
+            return_counts=True,
+        )
+        enough = co_likes >= min_co_likes
+        sources, targets = np.divmod(keys[enough], len(self.video_ids))
+        co_likes = co_likes[enough]
+        scores = co_likes / np.sqrt(
+            self.video_likes[columns[sources]].astype(np.float64)
+            * self.video_likes[targets]
+        )
+
+        order = np.lexsort((targets, -scores, sources))
+        sources, targets = sources[order], targets[order]
+        co_likes, scores = co_likes[order], scores[order]
+        ranks = np.arange(len(sources)) - np.searchsorted(sources, sources)
+        top = ranks < top_k
+        return (
+            columns[sources[top]], targets[top], co_likes[top], scores[top],
+            ranks[top],
+        )
+
+
+class RelatedVideoBuilder:
+    """
+    Computes and stores the related videos of published videos.
+
+    Attributes:
+        top_k (int): Related videos kept per video.
+        min_co_likes (int): Users two videos need in common to be related.
+        max_user_likes (int): Likes above which a user is left out.
+        chunk_pairs (int): Pairs expanded in memory at most.
+    """
+
+    def __init__(self, top_k: int | None = None,
+                 min_co_likes: int | None = None,
+                 max_user_likes: int | None = None,
+                 chunk_pairs: int | None = None, log=None):
+        self.top_k = top_k or settings.RELATED_VIDEOS_TOP_K
+        self.min_co_likes = (
+            min_co_likes or settings.RELATED_VIDEOS_MIN_CO_LIKES
+        )
+        self.max_user_likes = (
+            max_user_likes or settings.RELATED_VIDEOS_MAX_USER_LIKES
+        )
+        self.chunk_pairs = chunk_pairs or settings.RELATED_VIDEOS_CHUNK_PAIRS
+        self.log = log or (lambda message: None)
+
+    @staticmethod
+    def _published() -> tuple:
+        videos = array("q")
+        likes = array("q")
+        for video_id, total_likes in (
+            videos_models.Video.objects.published().order_by("id")
+            .values_list("id", "total_likes").iterator(chunk_size=10_000)
+        ):
+            videos.append(video_id)
+            likes.append(total_likes)
+        return (
+            np.frombuffer(videos, np.int64), np.frombuffer(likes, np.int64)
+        )
+
+    @staticmethod
+    def _read_likes(querysets) -> tuple:
+        videos = array("q")
+        users = array("q")
+        for queryset in querysets:
+            for video_id, user_id in queryset.values_list(
+                "video_id", "user_id"
+            ).iterator(chunk_size=10_000):
+                videos.append(video_id)
+                users.append(user_id)
+        return (
+            np.frombuffer(videos, np.int64), np.frombuffer(users, np.int64)
+        )
+
+    @staticmethod
+    def _aliases() -> list[str]:
+        return [videos_sharding.DEFAULT, *videos_sharding.shard_aliases()]
+
+    def _matrix(self, likes: tuple) -> LikeMatrix:
+        video_ids, video_likes = self._published()
+        matrix = LikeMatrix(*likes, video_ids, video_likes,
+                            self.max_user_likes)
+        self.log(
+            f"Лайков: {len(likes[0])}, видео: {len(video_ids)}, "
+            f"пользователей: {len(matrix.user_likes)}"
+        )
+        return matrix
+
+    def _compute(self, matrix: LikeMatrix, columns) -> int:
+        written = 0
+        for block in matrix.blocks(columns, self.chunk_pairs):
+            sources, targets, co_likes, scores, ranks = matrix.top_related(
+                block, self.top_k, self.min_co_likes
+            )
+            computed_at = timezone.now()
+            rows = [
+                videos_models.RelatedVideo(
+                    video_id=video_id, related_id=related_id, rank=rank,
+                    score=score, co_likes=co_like, computed_at=computed_at,
+                )
+                for video_id, related_id, co_like, score, rank in zip(
+                    matrix.video_ids[sources].tolist(),
+                    matrix.video_ids[targets].tolist(),
+                    co_likes.tolist(), scores.tolist(), ranks.tolist(),
+                )
+            ]
+            with transaction.atomic():
+                videos_models.RelatedVideo.objects.filter(
+                    video_id__in=matrix.video_ids[block].tolist()
+                ).delete()
+                videos_models.RelatedVideo.objects.bulk_create(
+                    rows, batch_size=CHUNK_SIZE
+                )
+            written += len(rows)
+        return written
+
+    def compute_all(self) -> int:
+        """
+        Recompute the related videos of every published video and empty
+        the refresh queue.
+
+        Returns:
+            int: Number of stored related videos.
+        """
+        started = timezone.now()
+        matrix = self._matrix(self._read_likes(
+            videos_models.Like.objects.using(alias).order_by()
+            for alias in self._aliases()
+        ))
+        written = self._compute(matrix, np.arange(len(matrix.video_ids)))
+        videos_models.RelatedVideo.objects.exclude(
+            video__in=videos_models.Video.objects.published()
+        ).delete()
+        videos_models.RelatedVideoRefresh.objects.filter(
+            queued_at__lte=started
+        ).delete()
+        return written
+
+    def compute_queued(self) -> int:
+        """
+        Recompute the related videos of the videos in the refresh queue.
+
+        Returns:
+            int: Number of stored related videos.
+        """
+        started = timezone.now()
+        queued = list(
+            videos_models.RelatedVideoRefresh.objects
+            .order_by("video_id").values_list("video_id", flat=True)
+        )
+        if not queued:
+            return 0
+
+        users = set()
+        for using, video_ids in videos_sharding.group_by_shard(
+            queued
+        ).items():
+            for start in range(0, len(video_ids), CHUNK_SIZE):
+                users.update(
+                    videos_models.Like.objects.using(using)
+                    .filter(video_id__in=video_ids[start:start + CHUNK_SIZE])
+                    .values_list("user_id", flat=True)
+                )
+        users = sorted(users)
+        matrix = self._matrix(self._read_likes(
+            videos_models.Like.objects.using(alias)
+            .filter(user_id__in=users[start:start + CHUNK_SIZE]).order_by()
+            for alias in self._aliases()
+            for start in range(0, len(users), CHUNK_SIZE)
+        ))
+
+        columns = matrix.columns_of(queued)
+        written = self._compute(matrix, columns)
+        computed = set(matrix.video_ids[columns].tolist())
+        for start in range(0, len(queued), CHUNK_SIZE):
+            # Видео без лайков или снятые с публикации
+            videos_models.RelatedVideo.objects.filter(video_id__in=[
+                video_id for video_id in queued[start:start + CHUNK_SIZE]
+                if video_id not in computed
+            ]).delete()
+            videos_models.RelatedVideoRefresh.objects.filter(
+                video_id__in=queued[start:start + CHUNK_SIZE],
+                queued_at__lte=started,
+            ).delete()
+        return written
+
+
+def queue_refresh(events: list[videos_models.OutboxEvent]) -> None:
+    """
+    Outbox handler queueing videos whose likes or publication changed for
+    the next incremental run.
+
+    ``queued_at`` is moved to the latest change, so a run only dequeues
+    videos that did not change after it started.
+
+    Args:
+        events (list[videos_models.OutboxEvent]): Batch of events in id order.
+    """
+    video_ids = {
+        event.video_id for event in events if event.kind in REFRESH_EVENTS
+    }
+    if not video_ids:
+        return
+    queued_at = timezone.now()
+    videos_models.RelatedVideoRefresh.objects.bulk_create(
+        [
+            videos_models.RelatedVideoRefresh(
+                video_id=video_id, queued_at=queued_at
+            )
+            for video_id in sorted(video_ids)
+        ],
+        update_conflicts=True,
+        unique_fields=["video_id"],
+        update_fields=["queued_at"],
+    )
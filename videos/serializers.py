@@ -1,18 +1,24 @@
+from django.conf import settings
 from rest_framework import serializers
+from video_project import metrics
 from videos import models as videos_models
 
 
-class VideoFileSerializer(serializers.ModelSerializer):
+class VideoFileSerializer(
+    metrics.TimedSerializerMixin, serializers.ModelSerializer
+):
     """
     Serializer for VideoFile model, representing individual video files
     with different qualities.
     """
     class Meta:
         model = videos_models.VideoFile
-        fields = ['id', 'file', 'quality']
+        fields = ['id', 'file', 'quality', 'size', 'sha256']
 
 
-class VideoSerializer(serializers.ModelSerializer):
+class VideoSerializer(
+    metrics.TimedSerializerMixin, serializers.ModelSerializer
+):
     """
     Serializer for the Video model, including owner username and
     associated video files.
@@ -29,7 +35,22 @@ class VideoSerializer(serializers.ModelSerializer):
         fields = ['id', 'owner', 'name', 'total_likes', 'created_at', 'files']
 
 
-class LikeResultSerializer(serializers.Serializer):
+class LikedVideoSerializer(VideoSerializer):
+    """
+    Serializer for a video liked by the requesting user.
+
+    Attributes:
+        liked_at: Read-only time of the like.
+    """
+    liked_at = serializers.DateTimeField(read_only=True)
+
+    class Meta(VideoSerializer.Meta):
+        fields = VideoSerializer.Meta.fields + ['liked_at']
+
+
+class LikeResultSerializer(
+    metrics.TimedSerializerMixin, serializers.Serializer
+):
     """
     Serializer for the result of a like action.
 
@@ -44,7 +65,9 @@ class LikeResultSerializer(serializers.Serializer):
     created = serializers.BooleanField()
 
 
-class VideoIDSerializer(serializers.ModelSerializer):
+class VideoIDSerializer(
+    metrics.TimedSerializerMixin, serializers.ModelSerializer
+):
     """
     Serializer for Video model to return only the video ID and owner's username.
 
@@ -58,7 +81,35 @@ class VideoIDSerializer(serializers.ModelSerializer):
         fields = ['id', 'username']
 
 
-class StatisticsSerializer(serializers.Serializer):
+class RelatedVideoSerializer(
+    metrics.TimedSerializerMixin, serializers.ModelSerializer
+):
+    """
+    Serializer for a precomputed related video.
+
+    Attributes:
+        id: Id of the recommended video.
+        owner: Username of the owner of the recommended video.
+        name: Name of the recommended video.
+        total_likes: Likes of the recommended video.
+    """
+    id = serializers.IntegerField(source='related_id', read_only=True)
+    owner = serializers.CharField(
+        source='related.owner.username', read_only=True
+    )
+    name = serializers.CharField(source='related.name', read_only=True)
+    total_likes = serializers.IntegerField(
+        source='related.total_likes', read_only=True
+    )
+
+    class Meta:
+        model = videos_models.RelatedVideo
+        fields = ['id', 'owner', 'name', 'total_likes', 'score', 'co_likes']
+
+
+class StatisticsSerializer(
+    metrics.TimedSerializerMixin, serializers.Serializer
+):
     """
     Serializer for user statistics, including username and total likes.
 
@@ -68,3 +119,118 @@ class StatisticsSerializer(serializers.Serializer):
     """
     username = serializers.CharField()
     likes_sum = serializers.IntegerField()
+
+
+class StatisticsWindowSerializer(serializers.Serializer):
+    """
+    Serializer for the optional time window of statistics views.
+
+    Attributes:
+        from (DateTimeField): Inclusive start of the window.
+        to (DateTimeField): Exclusive end of the window.
+    """
+
+    def get_fields(self):
+        # "from" is a Python keyword, so the fields are declared here
+        return {
+            'from': serializers.DateTimeField(required=False),
+            'to': serializers.DateTimeField(required=False),
+        }
+
+    def validate(self, attrs):
+        date_from, date_to = attrs.get('from'), attrs.get('to')
+        if date_from and date_to and date_from >= date_to:
+            raise serializers.ValidationError(
+                "`from` must be earlier than `to`."
+            )
+        return attrs
+
+
+class OwnerStatisticsQuerySerializer(serializers.Serializer):
+    """
+    Serializer for the query of the owner statistics view.
+
+    Attributes:
+        top (IntegerField): Number of owners with most likes to return.
+        percentiles (CharField): Percentiles of per-owner likes sums such as
+            ``50,90,99``, validated into a list of numbers.
+        bins (IntegerField): Number of histogram bins.
+    """
+    top = serializers.IntegerField(min_value=0, max_value=1000, default=10)
+    percentiles = serializers.CharField(default='50,90,99')
+    bins = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate_percentiles(self, value):
+        try:
+            percentiles = [
+                float(item) for item in value.split(',') if item.strip()
+            ]
+        except ValueError:
+            raise serializers.ValidationError(
+                "Expected comma-separated numbers."
+            )
+        if len(percentiles) > 20:
+            raise serializers.ValidationError(
+                "At most 20 percentiles are allowed."
+            )
+        if not all(0 <= percentile <= 100 for percentile in percentiles):
+            raise serializers.ValidationError(
+                "Percentiles must be between 0 and 100."
+            )
+        return percentiles
+
+
+class VideoIdsSerializer(serializers.Serializer):
+    """
+    Serializer for a comma-separated list of video ids in a query string.
+
+    Attributes:
+        ids (CharField): Ids such as ``1,2,3``, validated into a list of
+            unique integers of at most ``VIDEO_MULTI_GET_MAX_IDS`` items.
+    """
+    ids = serializers.CharField()
+
+    def validate_ids(self, value):
+        try:
+            ids = list(dict.fromkeys(
+                int(item) for item in value.split(',') if item.strip()
+            ))
+        except ValueError:
+            raise serializers.ValidationError(
+                "Expected comma-separated integers."
+            )
+        if not ids:
+            raise serializers.ValidationError("At least one id is required.")
+        if len(ids) > settings.VIDEO_MULTI_GET_MAX_IDS:
+            raise serializers.ValidationError(
+                f"At most {settings.VIDEO_MULTI_GET_MAX_IDS} ids are allowed."
+            )
+        return ids
+
+
+class VideoPublicationSerializer(serializers.Serializer):
+    """
+    Serializer for a bulk publish or unpublish request.
+
+    Attributes:
+        ids (ListField): Videos to change, at most
+            ``VIDEO_PUBLICATION_MAX_IDS``.
+        owner (IntegerField): Owner whose videos are all changed, instead
+            of ``ids``.
+        is_published (BooleanField): New publication state.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.VIDEO_PUBLICATION_MAX_IDS,
+        required=False,
+    )
+    owner = serializers.IntegerField(min_value=1, required=False)
+    is_published = serializers.BooleanField()
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('owner' in attrs):
+            raise serializers.ValidationError(
+                "Exactly one of ids and owner is required."
+            )
+        return attrs
@@ -1,12 +1,25 @@
-from typing import TypedDict, Optional
-from django.db import transaction, IntegrityError
-from django.db.models import F, Value
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Iterable, Iterator, TypedDict, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F, Q, Value
 from django.db.models import QuerySet
-from django.db.models import Sum, Subquery, OuterRef
-from django.db.models.functions import Coalesce
+from django.db.models import Count, Exists, Sum, Subquery, OuterRef
+from django.db.models.functions import Coalesce, TruncHour
+from django.utils import timezone
 
 from accounts import models as accounts_models
+from videos import analytics as videos_analytics
+from videos import bitmap as videos_bitmap
+from videos import events as videos_events
 from videos import models as videos_models
+from videos import sharding as videos_sharding
+from videos import streaming as videos_streaming
 
 
 class LikeResult(TypedDict):
@@ -21,11 +34,397 @@ class UnlikeResult(TypedDict):
 
 UserQuerySet = QuerySet[accounts_models.User]
 
+# (video_id, owner_id, like created_at, delta)
+LikeChange = tuple[int, int, datetime, int]
+
+LIKE_EVENT_DELTAS = {
+    videos_models.OutboxEvent.LIKE_CREATED: 1,
+    videos_models.OutboxEvent.LIKE_DELETED: -1,
+}
+ROLLUP_CONSUMER = "like_rollups"
+
+
+class LikeRollups:
+    """
+    Maintains hourly and daily like rollups per video and per owner.
+
+    Changes are aggregated in memory first and written with one upsert per
+    affected bucket, so any batch of likes costs O(buckets) writes and any
+    time window is read in O(buckets).
+    """
+
+    GRANULARITIES = (
+        videos_models.LikeRollup.HOUR,
+        videos_models.LikeRollup.DAY,
+    )
+
+    @staticmethod
+    def bucket_start(moment: datetime, granularity: str) -> datetime:
+        """
+        Truncate a moment to the start of its UTC bucket.
+
+        Args:
+            moment (datetime): Aware datetime to truncate.
+            granularity (str): LikeRollup.HOUR or LikeRollup.DAY.
+
+        Returns:
+            datetime: Start of the bucket containing the moment.
+        """
+        moment = moment.astimezone(dt_timezone.utc)
+        if granularity == videos_models.LikeRollup.HOUR:
+            return moment.replace(minute=0, second=0, microsecond=0)
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def record(cls, changes: Iterable[LikeChange]) -> None:
+        """
+        Apply like/unlike changes to the video and owner rollups.
+
+        Called by the outbox consumer in the transaction that advances its
+        checkpoint, so every like event is applied exactly once.
+
+        Args:
+            changes (Iterable[LikeChange]): Changes as
+                (video_id, owner_id, created_at, delta) tuples.
+        """
+        video_deltas = Counter()
+        owner_deltas = Counter()
+        for video_id, owner_id, created_at, delta in changes:
+            for granularity in cls.GRANULARITIES:
+                bucket = cls.bucket_start(created_at, granularity)
+                video_deltas[(video_id, granularity, bucket)] += delta
+                owner_deltas[(owner_id, granularity, bucket)] += delta
+        cls._upsert(videos_models.VideoLikeRollup, "video_id", video_deltas)
+        cls._upsert(videos_models.OwnerLikeRollup, "owner_id", owner_deltas)
+
+    @staticmethod
+    def _upsert(model, key_column: str, deltas: Counter) -> None:
+        rows = [
+            (key, granularity,
+             connection.ops.adapt_datetimefield_value(bucket), delta)
+            for (key, granularity, bucket), delta in sorted(deltas.items())
+            if delta
+        ]
+        if not rows:
+            return
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} "
+                f"({key_column}, granularity, bucket, likes) "
+                "VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT ({key_column}, granularity, bucket) "
+                f"DO UPDATE SET likes = {table}.likes + EXCLUDED.likes",
+                rows,
+            )
+
+    @classmethod
+    def window(
+        cls,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+    ) -> Q:
+        """
+        Build a filter selecting the rollup buckets that cover a window.
+
+        Whole days inside the window are read from daily buckets and the
+        ragged edges from hourly buckets. Edges are rounded to whole hours.
+
+        Args:
+            date_from (datetime | None): Inclusive window start.
+            date_to (datetime | None): Exclusive window end.
+
+        Returns:
+            Q: Filter for LikeRollup querysets.
+        """
+        hour = videos_models.LikeRollup.HOUR
+        day = videos_models.LikeRollup.DAY
+        hour_from = date_from and cls.bucket_start(date_from, hour)
+
+        day_from = date_from and cls.bucket_start(date_from, day)
+        if day_from is not None and day_from < date_from:
+            day_from += timedelta(days=1)
+        day_to = date_to and cls.bucket_start(date_to, day)
+
+        if day_from is not None and day_to is not None and day_from >= day_to:
+            return Q(
+                granularity=hour, bucket__gte=hour_from, bucket__lt=date_to
+            )
+
+        days = Q(granularity=day)
+        if day_from is not None:
+            days &= Q(bucket__gte=day_from)
+        if day_to is not None:
+            days &= Q(bucket__lt=day_to)
+        window = days
+        if date_from is not None:
+            window |= Q(
+                granularity=hour, bucket__gte=hour_from, bucket__lt=day_from
+            )
+        if date_to is not None:
+            window |= Q(
+                granularity=hour, bucket__gte=day_to, bucket__lt=date_to
+            )
+        return window
+
+    @staticmethod
+    def hidden_likes(window: Q, owner_id: OuterRef) -> Coalesce:
+        """
+        Build the likes within a window on hidden videos of an owner.
+
+        Owner rollups count likes on all videos of the owner, so likes on
+        unpublished and soft-deleted videos are read from their video
+        rollups and subtracted. Such videos are few, so a window still
+        reads O(buckets) rows.
+
+        Args:
+            window (Q): Filter returned by :meth:`window`.
+            owner_id (OuterRef): Reference to the owner id of the outer
+                query.
+
+        Returns:
+            Coalesce: Likes on hidden videos, 0 when there are none.
+        """
+        return Coalesce(
+            Subquery(
+                videos_models.VideoLikeRollup.objects
+                .filter(window, video__owner_id=owner_id)
+                .filter(
+                    Q(video__is_published=False)
+                    | Q(video__deleted_at__isnull=False)
+                )
+                .values("video__owner_id")
+                .annotate(likes_sum=Sum("likes"))
+                .values("likes_sum")
+            ),
+            0,
+        )
+
+    @classmethod
+    def forget_videos(cls, video_ids: list[int]) -> None:
+        """
+        Subtract the video rollups of videos being deleted from the owner
+        rollups.
+
+        Must run in the transaction deleting the videos, after their rows
+        were locked: the rollup consumer skips events of removed videos,
+        so their likes would otherwise stay in the owner rollups.
+
+        Args:
+            video_ids (list[int]): Videos about to be deleted.
+        """
+        deltas = Counter()
+        for owner_id, granularity, bucket, likes in (
+            videos_models.VideoLikeRollup.objects
+            .filter(video_id__in=video_ids)
+            .values_list("video__owner_id", "granularity", "bucket", "likes")
+        ):
+            deltas[(owner_id, granularity, bucket)] -= likes
+        cls._upsert(videos_models.OwnerLikeRollup, "owner_id", deltas)
+
+    @classmethod
+    def backfill(cls, chunk_size: int = 10_000) -> int:
+        """
+        Rebuild all rollups from existing Like rows.
+
+        Video rollups are rebuilt per chunk of videos while the chunk's video
+        rows are locked, which serializes with concurrent likes on them.
+        Like events not yet handled by the rollup consumer are subtracted,
+        and its checkpoint is locked meanwhile, so they are not counted twice.
+        Likes on shards other than the default database are read together
+        with their pending events from one snapshot of the shard instead.
+        Owner rollups are then derived from the video rollups, so prefer
+        running this while like traffic is low.
+
+        Args:
+            chunk_size (int): Number of videos or owners per transaction.
+
+        Returns:
+            int: Number of likes aggregated.
+        """
+        total = 0
+        for video_ids in cls._chunks(videos_models.Video.objects, chunk_size):
+            with transaction.atomic():
+                list(
+                    videos_models.Video.objects.select_for_update()
+                    .filter(id__in=video_ids).values_list("id", flat=True)
+                )
+                videos_models.VideoLikeRollup.objects.filter(
+                    video_id__in=video_ids
+                ).delete()
+                deltas = Counter()
+                total += cls._count_likes(
+                    videos_models.Like.objects.filter(video_id__in=video_ids),
+                    cls._lock_pending_events().filter(video_id__in=video_ids),
+                    deltas,
+                )
+                for using in videos_sharding.shard_aliases():
+                    pending = cls._lock_pending_events(using)
+                    with transaction.atomic(using=using):
+                        videos_sharding.repeatable_read(using)
+                        total += cls._count_likes(
+                            videos_models.Like.objects.using(using)
+                            .filter(video_id__in=video_ids),
+                            pending.filter(video_id__in=video_ids),
+                            deltas,
+                        )
+                videos_models.VideoLikeRollup.objects.bulk_create(
+                    [
+                        videos_models.VideoLikeRollup(
+                            video_id=video_id, granularity=granularity,
+                            bucket=bucket, likes=likes,
+                        )
+                        for (video_id, granularity, bucket), likes
+                        in deltas.items()
+                        if likes
+                    ],
+                    batch_size=1000,
+                )
+
+        for owner_ids in cls._chunks(accounts_models.User.objects, chunk_size):
+            with transaction.atomic():
+                for using in videos_sharding.outbox_aliases():
+                    cls._lock_pending_events(using)
+                videos_models.OwnerLikeRollup.objects.filter(
+                    owner_id__in=owner_ids
+                ).delete()
+                rows = (
+                    videos_models.VideoLikeRollup.objects
+                    .filter(video__owner_id__in=owner_ids)
+                    .values("video__owner_id", "granularity", "bucket")
+                    .annotate(likes_sum=Sum("likes"))
+                )
+                videos_models.OwnerLikeRollup.objects.bulk_create(
+                    (
+                        videos_models.OwnerLikeRollup(
+                            owner_id=row["video__owner_id"],
+                            granularity=row["granularity"],
+                            bucket=row["bucket"],
+                            likes=row["likes_sum"],
+                        )
+                        for row in rows.iterator()
+                    ),
+                    batch_size=1000,
+                )
+        return total
+
+    @classmethod
+    def _count_likes(
+        cls, likes: QuerySet, pending: QuerySet, deltas: Counter
+    ) -> int:
+        """
+        Add hourly like counts to ``deltas`` and subtract pending events.
+
+        Returns:
+            int: Number of likes counted.
+        """
+        total = 0
+        hourly = (
+            likes
+            .annotate(bucket=TruncHour("created_at", tzinfo=dt_timezone.utc))
+            .values("video_id", "bucket")
+            .annotate(likes=Count("id"))
+        )
+        for row in hourly.iterator():
+            for granularity in cls.GRANULARITIES:
+                bucket = cls.bucket_start(row["bucket"], granularity)
+                deltas[(row["video_id"], granularity, bucket)] += row["likes"]
+            total += row["likes"]
+        for event in pending.iterator():
+            for granularity in cls.GRANULARITIES:
+                bucket = cls.bucket_start(event.occurred_at, granularity)
+                deltas[(event.video_id, granularity, bucket)] -= (
+                    LIKE_EVENT_DELTAS[event.kind]
+                )
+        return total
+
+    @staticmethod
+    def _lock_pending_events(using: str = "default") -> QuerySet:
+        """
+        Lock the rollup consumer's checkpoint of an outbox and return the
+        like events it has not handled yet.
+        """
+        events = videos_models.OutboxEvent.objects.using(using).filter(
+            kind__in=LIKE_EVENT_DELTAS
+        )
+        if ROLLUP_CONSUMER not in settings.OUTBOX_CONSUMERS:
+            return events.none()
+        name = videos_sharding.checkpoint_name(ROLLUP_CONSUMER, using)
+        videos_models.OutboxCheckpoint.objects.get_or_create(consumer=name)
+        position = (
+            videos_models.OutboxCheckpoint.objects.select_for_update()
+            .values_list("position", flat=True).get(consumer=name)
+        )
+        return events.filter(id__gt=position)
+
+    @staticmethod
+    def _chunks(queryset: QuerySet, chunk_size: int):
+        last_id = 0
+        while True:
+            ids = list(
+                queryset.filter(id__gt=last_id).order_by("id")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+
+def handle_like_rollup_events(
+    events: list[videos_models.OutboxEvent],
+) -> None:
+    """
+    Outbox handler applying like events to the like rollups.
+
+    Events of videos removed since are skipped, their rollups are gone.
+
+    Args:
+        events (list[videos_models.OutboxEvent]): Batch of events in id order.
+    """
+    events = [event for event in events if event.kind in LIKE_EVENT_DELTAS]
+    existing = set(
+        videos_models.Video.objects.filter(
+            id__in={event.video_id for event in events}
+        ).values_list("id", flat=True)
+    )
+    LikeRollups.record(
+        (event.video_id, event.owner_id, event.occurred_at,
+         LIKE_EVENT_DELTAS[event.kind])
+        for event in events
+        if event.video_id in existing
+    )
+
+
+def handle_like_count_events(
+    events: list[videos_models.OutboxEvent],
+) -> None:
+    """
+    Outbox handler applying like events of a like shard to
+    ``Video.total_likes``.
+
+    Likes on the default database update the counter themselves, so their
+    events are skipped.
+
+    Args:
+        events (list[videos_models.OutboxEvent]): Batch of events in id order.
+    """
+    if not events or events[0]._state.db == videos_sharding.DEFAULT:
+        return
+    deltas = Counter()
+    for event in events:
+        if event.kind in LIKE_EVENT_DELTAS:
+            deltas[event.video_id] += LIKE_EVENT_DELTAS[event.kind]
+    videos_sharding.LikeCounters.add_to_videos(deltas)
+
 
 class VideoLikeManager:
     """
     Class to handle like and unlike actions for a video by a specific user.
 
+    The like, its counter and its outbox event are written in one
+    transaction on the like shard of the video.
+
     Attributes:
         user (accounts_models.User): The user performing the action.
         video (videos_models.Video): The video on which the action is performed.
@@ -36,22 +435,43 @@ class VideoLikeManager:
 
     def like(self) -> LikeResult:
         """
-        Initialize the VideoLikeManager with a user and a video.
+        Like the video on behalf of the user.
 
-        Args:
-            accounts_models.User: The user performing the like/unlike action.
-            videos_models.Video: The video to be liked or unliked.
+        Creates a Like object if it does not exist and increments the
+        video's like counter on its shard in the same transaction.
+
+        Returns:
+            dict: {
+                "obj": Like object, None if the like could not be written,
+                "created": True if a new Like was created, False otherwise
+            }
+
+        Raises:
+            videos_sharding.ShardUnavailable: If the video's likes are being
+                moved to another shard.
         """
+        using = videos_sharding.shard_for(self.video.id, writing=True)
         try:
-            with transaction.atomic():
-                like, created = videos_models.Like.objects.get_or_create(
-                    video=self.video,
-                    user=self.user
+            with transaction.atomic(using=using), \
+                    videos_sharding.use_shard(using):
+                like, created = (
+                    videos_models.Like.objects.using(using).get_or_create(
+                        video=self.video,
+                        user=self.user
+                    )
                 )
                 if created:
-                    videos_models.Video.objects.filter(
-                        id=self.video.id
-                    ).update(total_likes=F('total_likes') + 1)
+                    videos_sharding.LikeCounters.add(
+                        using, {self.video.id: 1}
+                    )
+                    videos_events.Outbox.append(
+                        videos_models.OutboxEvent.LIKE_CREATED,
+                        self.video.id,
+                        self.video.owner_id,
+                        like.created_at,
+                        user_id=self.user.id,
+                        using=using,
+                    )
 
             return {"obj": like, "created": created}
 
@@ -60,32 +480,203 @@ class VideoLikeManager:
 
     def unlike(self) -> UnlikeResult:
         """
-        Like the video on behalf of the user.
+        Remove the user's like from the video.
 
-        Creates a Like object if it does not exist. Increments the video's
-        total_likes counter atomically to avoid race conditions.
+        Deletes the Like object if it exists and decrements the video's
+        like counter on its shard in the same transaction.
 
         Returns:
             dict: {
-                "obj": Like object if created, None otherwise,
-                "created": True if a new Like was created, False otherwise
+                "obj": Always None,
+                "deleted": Number of deleted likes, False on an integrity
+                    error
             }
+
+        Raises:
+            videos_sharding.ShardUnavailable: If the video's likes are being
+                moved to another shard.
         """
+        using = videos_sharding.shard_for(self.video.id, writing=True)
         try:
-            with transaction.atomic():
-                deleted, _ = videos_models.Like.objects.filter(
+            with transaction.atomic(using=using), \
+                    videos_sharding.use_shard(using):
+                likes = videos_models.Like.objects.using(using).filter(
                     video=self.video, user=self.user
-                ).delete()
+                )
+                created_at = (
+                    likes.select_for_update()
+                    .values_list('created_at', flat=True).first()
+                )
+                deleted, _ = likes.delete()
 
                 if deleted:
-                    videos_models.Video.objects.filter(
-                        id=self.video.id).update(
-                        total_likes=F('total_likes') - 1)
+                    videos_sharding.LikeCounters.add(
+                        using, {self.video.id: -1}
+                    )
+                    videos_events.Outbox.append(
+                        videos_models.OutboxEvent.LIKE_DELETED,
+                        self.video.id,
+                        self.video.owner_id,
+                        created_at,
+                        user_id=self.user.id,
+                        using=using,
+                    )
             return {"obj": None, "deleted": deleted}
         except IntegrityError:
             return {"obj": None, "deleted": False}
 
 
+class LikeCounts:
+    """
+    Like counts of several videos for cheap polling.
+
+    Counts are read from the covering ``video_like_counts_idx`` index and
+    kept in the cache for ``LIKE_COUNTS_CACHE_SECONDS``, together with the
+    columns needed to apply visibility rules, so cached entries are shared
+    by all users.
+    """
+
+    CACHE_KEY = "video-like-count:{}"
+
+    @classmethod
+    def for_user(
+        cls, ids: list[int], user, cached: bool = True
+    ) -> dict[int, int]:
+        """
+        Return like counts of the videos visible to the user.
+
+        Args:
+            ids (list[int]): Video ids.
+            user: Authenticated or anonymous user.
+            cached (bool): Whether cached counts may be returned.
+
+        Returns:
+            dict[int, int]: total_likes per visible video id; unknown,
+            deleted and invisible videos are left out.
+        """
+        if not user.is_authenticated:
+            ids = [
+                video_id for video_id in ids
+                if videos_bitmap.is_published(video_id) is not False
+            ]
+        timeout = settings.LIKE_COUNTS_CACHE_SECONDS if cached else 0
+        rows = cls._rows(ids, timeout)
+        return {
+            video_id: total_likes
+            for video_id, (total_likes, is_published, owner_id)
+            in rows.items()
+            if is_published or user.is_staff or owner_id == user.id
+        }
+
+    @classmethod
+    def _rows(
+        cls, ids: list[int], timeout: int
+    ) -> dict[int, tuple[int, bool, int]]:
+        keys = {cls.CACHE_KEY.format(video_id): video_id for video_id in ids}
+        rows = {}
+        if timeout:
+            rows = {
+                keys[key]: tuple(row)
+                for key, row in cache.get_many(list(keys)).items()
+            }
+        missing = [video_id for video_id in ids if video_id not in rows]
+        if not missing:
+            return rows
+
+        fetched = {
+            video_id: (total_likes, is_published, owner_id)
+            for video_id, total_likes, is_published, owner_id in (
+                videos_models.Video.objects.alive()
+                .filter(id__in=missing)
+                .values_list("id", "total_likes", "is_published", "owner_id")
+            )
+        }
+        if timeout:
+            cache.set_many(
+                {
+                    cls.CACHE_KEY.format(video_id): row
+                    for video_id, row in fetched.items()
+                },
+                timeout,
+            )
+        rows.update(fetched)
+        return rows
+
+
+class LikedVideos:
+    """
+    Published videos liked by a user, newest like first, in keyset pages.
+
+    Like keys come from the covering index of every like shard; the videos
+    of a batch are fetched with their owners and files in one query that
+    leaves out videos unpublished or deleted since they were liked. A page
+    short of such videos is topped up from the next likes, at most
+    ``MAX_ROUNDS`` times, so a user with many hidden likes may get a short
+    page with a cursor to continue from.
+
+    Attributes:
+        user (accounts_models.User): User whose likes are listed.
+    """
+
+    MAX_ROUNDS = 5
+
+    def __init__(self, user: accounts_models.User):
+        self.user = user
+
+    @staticmethod
+    def _published(video_ids: list[int]) -> dict[int, videos_models.Video]:
+        video_ids = [
+            video_id for video_id in video_ids
+            if videos_bitmap.is_published(video_id) is not False
+        ]
+        if not video_ids:
+            return {}
+        return {
+            video.id: video
+            for video in videos_models.Video.objects.published()
+            .filter(id__in=video_ids)
+            .select_related("owner")
+            .prefetch_related("files")
+        }
+
+    def page(
+        self, after: tuple | None, size: int
+    ) -> tuple[list[videos_models.Video], tuple | None]:
+        """
+        Return the next page of liked videos.
+
+        Args:
+            after (tuple | None): ``(created_at, video_id)`` key of the last
+                like of the previous page, None for the first page.
+            size (int): Number of videos per page.
+
+        Returns:
+            tuple: Videos with their ``liked_at`` and the key to pass as
+            ``after`` for the next page, None on the last page.
+        """
+        videos = []
+        for _ in range(self.MAX_ROUNDS):
+            needed = size - len(videos)
+            likes = videos_sharding.user_likes_before(
+                self.user.id, after, needed + 1
+            )
+            batch = likes[:needed]
+            published = self._published(
+                [video_id for _, video_id in batch]
+            )
+            for liked_at, video_id in batch:
+                video = published.get(video_id)
+                if video is not None:
+                    video.liked_at = liked_at
+                    videos.append(video)
+            if len(likes) <= needed:
+                return videos, None
+            after = batch[-1]
+            if len(videos) == size:
+                break
+        return videos, after
+
+
 class StatisticsGroupBy:
     """
     Computes aggregate statistics of videos grouped by their owners.
@@ -152,3 +743,728 @@ class StatisticsSubquery:
             .annotate(likes_sum=Coalesce(subquery, 0))
             .order_by('-likes_sum')
         )
+
+
+class RollupStatisticsGroupBy:
+    """
+    Computes owner statistics for a time window from owner like rollups.
+
+    Likes on unpublished and soft-deleted videos are not counted, as in
+    :class:`StatisticsGroupBy`.
+
+    Attributes:
+        window (Q): Filter selecting the rollup buckets covering the window.
+    """
+
+    def __init__(self, window: Q):
+        self.window = window
+
+    def get_stats(self) -> UserQuerySet:
+        """
+        Get likes within the window grouped by video owners.
+
+        Returns:
+            UserQuerySet: Values of usernames with their likes sum, ordered
+            by likes_sum descending.
+        """
+        return (
+            videos_models.OwnerLikeRollup.objects
+            .filter(self.window, owner__deleted_at__isnull=True)
+            .values("owner_id", username=F("owner__username"))
+            .annotate(
+                likes_sum=Coalesce(Sum("likes"), Value(0))
+                - LikeRollups.hidden_likes(self.window, OuterRef("owner_id"))
+            )
+            .order_by("-likes_sum")
+        )
+
+
+class RollupStatisticsSubquery:
+    """
+    Computes user statistics for a time window using a subquery over owner
+    like rollups.
+
+    Likes on unpublished and soft-deleted videos are not counted, as in
+    :class:`StatisticsSubquery`.
+
+    Attributes:
+        users (QuerySet[accounts_models.User]): QuerySet of users.
+        window (Q): Filter selecting the rollup buckets covering the window.
+    """
+
+    def __init__(self, users: QuerySet[accounts_models.User], window: Q):
+        self.users = users
+        self.window = window
+
+    def get_stats(self) -> UserQuerySet:
+        """
+        Annotate users with likes within the window using a subquery.
+
+        Returns:
+            UserQuerySet: Annotated queryset of users with likes_sum, ordered
+            descending.
+        """
+        subquery = Subquery(
+            videos_models.OwnerLikeRollup.objects
+            .filter(self.window, owner_id=OuterRef('pk'))
+            .values('owner_id')
+            .annotate(likes_sum=Sum('likes'))
+            .values('likes_sum')
+        )
+        return (
+            self.users
+            .annotate(
+                likes_sum=Coalesce(subquery, 0)
+                - LikeRollups.hidden_likes(self.window, OuterRef('pk'))
+            )
+            .order_by('-likes_sum')
+        )
+
+
+class CascadeDeletion:
+    """
+    Deletes users and videos without one huge cascading transaction.
+
+    Users and videos are first soft-marked with ``deleted_at`` so they
+    disappear from the API immediately. Dependent rows are then removed in
+    bounded batches, each in its own short transaction. Likes left by a
+    deleted user on other videos are removed with the matching
+    ``total_likes`` decrement, so counters stay correct. Likes on deleted
+    videos are left out of windowed statistics from the moment of marking
+    and are subtracted from the owner like rollups when the videos are
+    removed. Likes on shards other than the default database are found by
+    id, shard by shard.
+
+    Attributes:
+        batch_size (int): Maximum number of rows removed per transaction.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    @staticmethod
+    def mark_users(users: QuerySet[accounts_models.User]) -> int:
+        """
+        Soft-delete users and all of their videos.
+
+        Marked users are deactivated, so they can no longer obtain or use
+        tokens while their data is being purged.
+
+        Args:
+            users (QuerySet[accounts_models.User]): Users to delete.
+
+        Returns:
+            int: Number of users newly marked for deletion.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            user_ids = list(
+                users.filter(deleted_at__isnull=True)
+                .values_list("id", flat=True)
+            )
+            accounts_models.User.objects.filter(id__in=user_ids).update(
+                is_active=False, deleted_at=now
+            )
+            videos_models.Video.objects.alive().filter(
+                owner_id__in=user_ids
+            ).update(deleted_at=now, updated_at=now)
+        return len(user_ids)
+
+    @staticmethod
+    def mark_videos(videos: QuerySet[videos_models.Video]) -> int:
+        """
+        Soft-delete videos.
+
+        Args:
+            videos (QuerySet[videos_models.Video]): Videos to delete.
+
+        Returns:
+            int: Number of videos newly marked for deletion.
+        """
+        now = timezone.now()
+        return videos.alive().update(deleted_at=now, updated_at=now)
+
+    def purge_batch(self) -> int:
+        """
+        Remove one batch of rows belonging to soft-deleted users and videos.
+
+        Stages run in dependency order: likes of deleted users on live
+        videos, likes on deleted videos, the same on like shards, files of
+        deleted videos, the videos themselves and finally the users.
+
+        Returns:
+            int: Number of rows removed, 0 when nothing is left to purge.
+        """
+        stages = (
+            self._purge_user_likes,
+            self._purge_video_likes,
+            self._purge_shard_user_likes,
+            self._purge_shard_video_likes,
+            self._purge_video_files,
+            self._purge_videos,
+            self._purge_users,
+        )
+        for stage in stages:
+            removed = stage()
+            if removed:
+                return removed
+        return 0
+
+    def _purge_user_likes(self) -> int:
+        with transaction.atomic():
+            rows = list(
+                videos_models.Like.objects
+                .select_for_update(of=("self",))
+                .filter(
+                    user__deleted_at__isnull=False,
+                    video__deleted_at__isnull=True,
+                )
+                .order_by("id")
+                .values_list(
+                    "id", "video_id", "video__owner_id", "created_at",
+                    "user_id",
+                )[:self.batch_size]
+            )
+            if not rows:
+                return 0
+            videos_models.Like.objects.filter(
+                id__in=[row[0] for row in rows]
+            ).delete()
+
+            per_video = Counter(row[1] for row in rows)
+            videos_sharding.LikeCounters.add_to_videos(
+                {video_id: -count for video_id, count in per_video.items()}
+            )
+            videos_events.Outbox.append_many(
+                videos_models.OutboxEvent(
+                    kind=videos_models.OutboxEvent.LIKE_DELETED,
+                    video_id=video_id,
+                    owner_id=owner_id,
+                    user_id=user_id,
+                    occurred_at=created_at,
+                )
+                for _, video_id, owner_id, created_at, user_id in rows
+            )
+        return len(rows)
+
+    def _purge_video_likes(self) -> int:
+        with transaction.atomic():
+            like_ids = list(
+                videos_models.Like.objects
+                .filter(video__deleted_at__isnull=False)
+                .order_by("id")
+                .values_list("id", flat=True)[:self.batch_size]
+            )
+            if not like_ids:
+                return 0
+            videos_models.Like.objects.filter(id__in=like_ids).delete()
+        return len(like_ids)
+
+    def _purge_shard_user_likes(self) -> int:
+        for user_ids in LikeRollups._chunks(
+            accounts_models.User.objects.filter(deleted_at__isnull=False),
+            self.batch_size,
+        ):
+            for using in videos_sharding.shard_aliases():
+                with transaction.atomic(using=using):
+                    rows = list(
+                        videos_models.Like.objects.using(using)
+                        .select_for_update()
+                        .filter(user_id__in=user_ids)
+                        .order_by("id")
+                        .values_list(
+                            "id", "video_id", "created_at", "user_id"
+                        )[:self.batch_size]
+                    )
+                    if not rows:
+                        continue
+                    videos_models.Like.objects.using(using).filter(
+                        id__in=[row[0] for row in rows]
+                    ).delete()
+                    per_video = Counter(row[1] for row in rows)
+                    videos_sharding.LikeCounters.add(
+                        using,
+                        {
+                            video_id: -count
+                            for video_id, count in per_video.items()
+                        },
+                    )
+                    owners = dict(
+                        videos_models.Video.objects.filter(
+                            id__in=list(per_video)
+                        ).values_list("id", "owner_id")
+                    )
+                    videos_events.Outbox.append_many(
+                        (
+                            videos_models.OutboxEvent(
+                                kind=videos_models.OutboxEvent.LIKE_DELETED,
+                                video_id=video_id,
+                                owner_id=owners.get(video_id, 0),
+                                user_id=user_id,
+                                occurred_at=created_at,
+                            )
+                            for _, video_id, created_at, user_id in rows
+                        ),
+                        using=using,
+                    )
+                    return len(rows)
+        return 0
+
+    def _purge_shard_video_likes(self) -> int:
+        for video_ids in LikeRollups._chunks(
+            videos_models.Video.objects.filter(deleted_at__isnull=False),
+            self.batch_size,
+        ):
+            for using in videos_sharding.shard_aliases():
+                with transaction.atomic(using=using):
+                    likes = videos_models.Like.objects.using(using)
+                    like_ids = list(
+                        likes.filter(video_id__in=video_ids)
+                        .order_by("id")
+                        .values_list("id", flat=True)[:self.batch_size]
+                    )
+                    if not like_ids:
+                        continue
+                    likes.filter(id__in=like_ids).delete()
+                    return len(like_ids)
+        return 0
+
+    def _purge_video_files(self) -> int:
+        with transaction.atomic():
+            rows = list(
+                videos_models.VideoFile.objects
+                .filter(video__deleted_at__isnull=False)
+                .order_by("id")
+                .values_list("id", "file")[:self.batch_size]
+            )
+            if not rows:
+                return 0
+            videos_models.VideoFile.objects.filter(
+                id__in=[file_id for file_id, _ in rows]
+            ).delete()
+            names = [name for _, name in rows if name]
+            transaction.on_commit(
+                lambda: VideoFileMedia.delete_unreferenced(names)
+            )
+        return len(rows)
+
+    def _purge_videos(self) -> int:
+        with transaction.atomic():
+            video_ids = list(
+                videos_models.Video.objects
+                .filter(deleted_at__isnull=False)
+                .order_by("id")
+                .values_list("id", flat=True)[:self.batch_size]
+            )
+            if not video_ids:
+                return 0
+            # Блокировка ждёт потребителя свёрток, уже пишущего эти видео
+            list(
+                videos_models.Video.objects.select_for_update()
+                .filter(id__in=video_ids).values_list("id", flat=True)
+            )
+            LikeRollups.forget_videos(video_ids)
+            for using in videos_sharding.shard_aliases():
+                videos_models.VideoLikeCount.objects.using(using).filter(
+                    video_id__in=video_ids
+                ).delete()
+            videos_models.Video.objects.filter(id__in=video_ids).delete()
+        return len(video_ids)
+
+    def _purge_users(self) -> int:
+        with transaction.atomic():
+            user_ids = list(
+                accounts_models.User.objects
+                .filter(deleted_at__isnull=False)
+                .exclude(Exists(
+                    videos_models.Video.objects.filter(owner_id=OuterRef("pk"))
+                ))
+                .exclude(Exists(
+                    videos_models.Like.objects.filter(user_id=OuterRef("pk"))
+                ))
+                .order_by("id")
+                .values_list("id", flat=True)[:self.batch_size]
+            )
+            if videos_sharding.is_enabled():
+                user_ids = sorted(
+                    set(user_ids) - videos_sharding.users_with_likes(user_ids)
+                )
+            if not user_ids:
+                return 0
+            accounts_models.User.objects.filter(id__in=user_ids).delete()
+        return len(user_ids)
+
+
+class VideoPublication:
+    """
+    Publishes and unpublishes many videos with set-based writes.
+
+    Videos are changed in batches, each in one short transaction. It
+    updates ``is_published`` and ``updated_at`` of the batch with a single
+    statement and appends one publish or unpublish outbox event per changed
+    video, as :meth:`Video.save <videos.models.Video.save>` does for one.
+    Once a batch commits, the bits of its videos in the published bitmap are
+    set and their cached like counts are dropped. The owner statistics
+    engine of this process is refreshed at the end; other processes follow
+    ``updated_at``, and the ``related_videos`` consumer queues the videos
+    for the next incremental run.
+
+    Attributes:
+        batch_size (int): Maximum number of videos changed per transaction.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def set_published(
+        self, videos: QuerySet[videos_models.Video], published: bool
+    ) -> int:
+        """
+        Publish or unpublish videos; deleted videos are left alone.
+
+        Args:
+            videos (QuerySet[videos_models.Video]): Videos to change.
+            published (bool): New publication state.
+
+        Returns:
+            int: Number of videos whose state changed.
+        """
+        video_ids = list(
+            videos.alive().filter(is_published=not published)
+            .order_by("id").values_list("id", flat=True)
+        )
+        changed = 0
+        for start in range(0, len(video_ids), self.batch_size):
+            changed += self._apply(
+                video_ids[start:start + self.batch_size], published
+            )
+        engine = videos_analytics.get_engine()
+        if changed and engine is not None:
+            engine.refresh_now()
+        return changed
+
+    def _apply(self, video_ids: list[int], published: bool) -> int:
+        now = timezone.now()
+        with transaction.atomic():
+            # Строки блокируются по порядку id, их состояние могло
+            # измениться после выборки
+            rows = list(
+                videos_models.Video.objects.alive()
+                .filter(id__in=video_ids, is_published=not published)
+                .select_for_update().order_by("id")
+                .values_list("id", "owner_id")
+            )
+            changed = [video_id for video_id, _ in rows]
+            if not changed:
+                return 0
+            videos_models.Video.objects.filter(id__in=changed).update(
+                is_published=published, updated_at=now
+            )
+            kind = (
+                videos_models.OutboxEvent.VIDEO_PUBLISHED if published
+                else videos_models.OutboxEvent.VIDEO_UNPUBLISHED
+            )
+            videos_models.OutboxEvent.objects.bulk_create(
+                videos_models.OutboxEvent(
+                    kind=kind, video_id=video_id, owner_id=owner_id,
+                    occurred_at=now,
+                )
+                for video_id, owner_id in rows
+            )
+            transaction.on_commit(
+                lambda: self._after_commit(changed, published)
+            )
+        return len(changed)
+
+    @staticmethod
+    def _after_commit(video_ids: list[int], published: bool) -> None:
+        bitmap = videos_bitmap.get_bitmap()
+        if bitmap is not None:
+            bitmap.mark_many(video_ids, published)
+        cache.delete_many([
+            LikeCounts.CACHE_KEY.format(video_id) for video_id in video_ids
+        ])
+
+
+class VideoFileMedia:
+    """
+    Reference-counted operations on stored video files.
+
+    Files are content-addressed, so one stored file may back several
+    VideoFile rows; its reference count is the number of rows with its
+    name.
+    """
+
+    @staticmethod
+    def storage():
+        return videos_models.VideoFile._meta.get_field("file").storage
+
+    @classmethod
+    def references(cls, names: Iterable[str]) -> Counter:
+        """
+        Count the VideoFile rows referencing each stored file.
+
+        Content-addressed names are looked up through the ``sha256``
+        index, names of files that predate content addressing through the
+        index on ``file``.
+
+        Args:
+            names (Iterable[str]): Storage names of files.
+
+        Returns:
+            Counter: Number of rows per referenced name.
+        """
+        names = set(names)
+        storage = cls.storage()
+        digests = {storage.digest(name) for name in names} - {None}
+        legacy = [name for name in names if storage.digest(name) is None]
+        rows = (
+            videos_models.VideoFile.objects
+            .filter(Q(sha256__in=digests) | Q(file__in=legacy))
+            .values_list("file", flat=True)
+        )
+        return Counter(name for name in rows if name in names)
+
+    @classmethod
+    def delete_unreferenced(cls, names: Iterable[str]) -> list[str]:
+        """
+        Delete the files among ``names`` that no row references any more.
+
+        Files modified within ``MEDIA_GC_GRACE_SECONDS`` are kept: a
+        concurrent upload of identical content may be about to reference
+        them. They are removed later by :class:`OrphanedMediaCollector`.
+
+        Args:
+            names (Iterable[str]): Storage names of candidate files.
+
+        Returns:
+            list[str]: Names of the deleted files.
+        """
+        names = set(names)
+        referenced = cls.references(names)
+        storage = cls.storage()
+        cutoff = timezone.now() - timedelta(
+            seconds=settings.MEDIA_GC_GRACE_SECONDS
+        )
+        deleted = []
+        for name in sorted(names - set(referenced)):
+            try:
+                if storage.get_modified_time(name) > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            storage.delete(name)
+            deleted.append(name)
+        return deleted
+
+    @staticmethod
+    def segment_index(video_file: videos_models.VideoFile) -> dict:
+        """
+        Return the segment index of a file, reading it on first use.
+
+        The index is stored on the row, so the file is parsed once. Files
+        that are not fragmented MP4 get ``{"error": ...}`` stored instead
+        and are not parsed again.
+
+        Args:
+            video_file (VideoFile): File to index.
+
+        Returns:
+            dict: Segment index or an ``error`` entry.
+        """
+        if video_file.segment_index is not None:
+            return video_file.segment_index
+        try:
+            index = videos_streaming.read_segment_index(video_file.file.path)
+        except videos_streaming.SegmentIndexError as error:
+            index = {"error": str(error)}
+        except OSError as error:
+            # Файл может появиться позже, ошибка не сохраняется
+            return {"error": str(error)}
+        # Индекс не сохраняется, если файл заменили, пока он читался
+        videos_models.VideoFile.objects.filter(
+            id=video_file.id, file=video_file.file.name
+        ).update(segment_index=index)
+        video_file.segment_index = index
+        return index
+
+    @classmethod
+    def backfill(
+        cls, batch_size: int = 500, workers: int = 4
+    ) -> Iterator[tuple[int, list[str]]]:
+        """
+        Move files uploaded before content addressing, or stored under a
+        content-addressed name that still has the upload's extension, to
+        their content-addressed names and record size and checksum.
+
+        Files of a batch are hashed in parallel threads, hashlib and file
+        reads release the GIL. Rows are updated in one statement per batch
+        and the old names are deleted once nothing references them.
+
+        Args:
+            batch_size (int): Rows processed per batch.
+            workers (int): Number of hashing threads.
+
+        Yields:
+            tuple[int, list[str]]: Number of updated rows and names of
+                files that could not be read in each batch.
+        """
+        storage = cls.storage()
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                files = list(
+                    videos_models.VideoFile.objects
+                    .filter(
+                        Q(sha256__isnull=True) | Q(file__regex=r"\.[^/]*$"),
+                        id__gt=last_id,
+                    )
+                    .exclude(file="")
+                    .order_by("id")
+                    .only("id", "file")[:batch_size]
+                )
+                if not files:
+                    return
+                last_id = files[-1].id
+
+                names = {video_file.file.name for video_file in files}
+                results = dict(zip(names, pool.map(
+                    cls._adopt, [storage] * len(names), names
+                )))
+
+                updated, missing, old_names = [], [], set()
+                for video_file in files:
+                    old_name = video_file.file.name
+                    result = results[old_name]
+                    if result is None:
+                        missing.append(old_name)
+                        continue
+                    name, video_file.sha256, video_file.size = result
+                    video_file.file.name = name
+                    updated.append(video_file)
+                    if video_file.file.name != old_name:
+                        old_names.add(old_name)
+
+                with transaction.atomic():
+                    videos_models.VideoFile.objects.bulk_update(
+                        updated, ["file", "sha256", "size"]
+                    )
+                    transaction.on_commit(
+                        lambda: cls._delete_replaced(old_names)
+                    )
+                yield len(updated), missing
+
+    @staticmethod
+    def _adopt(storage, name: str) -> tuple[str, str, int] | None:
+        try:
+            return storage.adopt(name)
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def _delete_replaced(cls, names: set[str]) -> None:
+        # Содержимое уже доступно под новым именем, период ожидания не нужен
+        storage = cls.storage()
+        for name in names - set(cls.references(names)):
+            storage.delete(name)
+
+
+class OrphanedMediaCollector:
+    """
+    Deletes media files that no VideoFile row references.
+
+    The media directory is walked lazily with ``os.scandir`` and names are
+    checked against the database in batches, so memory use does not depend
+    on the number of files.
+
+    Attributes:
+        directory (str): Directory to scan, relative to the storage root.
+        batch_size (int): Names checked per query.
+        grace_seconds (int): Files modified more recently are kept.
+        rate (float): Maximum deletions per second, 0 for no limit.
+        dry_run (bool): Report orphans without deleting them.
+        scanned (int): Number of files seen so far.
+    """
+
+    def __init__(
+        self,
+        directory: str = "videos",
+        batch_size: int = 1000,
+        grace_seconds: int | None = None,
+        rate: float = 0.0,
+        dry_run: bool = False,
+    ):
+        self.directory = directory
+        self.batch_size = batch_size
+        if grace_seconds is None:
+            grace_seconds = settings.MEDIA_GC_GRACE_SECONDS
+        self.grace_seconds = grace_seconds
+        self.rate = rate
+        self.dry_run = dry_run
+        self.scanned = 0
+        self.storage = VideoFileMedia.storage()
+
+    def scan(self) -> Iterator[tuple[str, float, int]]:
+        """
+        Walk the directory depth-first without listing it in memory.
+
+        Yields:
+            tuple[str, float, int]: Storage name, modification time and
+                size of every file.
+        """
+        root = self.storage.path(self.directory)
+        if not os.path.isdir(root):
+            return
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    name = os.path.relpath(
+                        entry.path, self.storage.location
+                    ).replace(os.sep, "/")
+                    yield name, stat.st_mtime, stat.st_size
+
+    def run(self) -> Iterator[tuple[str, int]]:
+        """
+        Delete orphaned files, or only find them in dry-run mode.
+
+        Yields:
+            tuple[str, int]: Storage name and size of every orphaned file.
+        """
+        cutoff = time.time() - self.grace_seconds
+        batch = []
+        for name, modified, size in self.scan():
+            self.scanned += 1
+            if modified <= cutoff:
+                batch.append((name, size))
+            if len(batch) >= self.batch_size:
+                yield from self._collect(batch, cutoff)
+                batch = []
+        if batch:
+            yield from self._collect(batch, cutoff)
+
+    def _collect(self, batch, cutoff: float) -> Iterator[tuple[str, int]]:
+        referenced = VideoFileMedia.references(name for name, _ in batch)
+        for name, size in batch:
+            if name in referenced:
+                continue
+            if self.dry_run:
+                yield name, size
+                continue
+            path = self.storage.path(name)
+            try:
+                # Файл могли переиспользовать после обхода каталога
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            yield name, size
+            if self.rate:
+                time.sleep(1 / self.rate)
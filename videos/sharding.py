@@ -0,0 +1,613 @@
+"""
+Horizontal sharding of like storage by ``video_id``.
+
+``Like`` rows live on the database alias of their video's bucket,
+``video_id % LIKE_SHARD_BUCKETS``. The bucket map is a table on the default
+database (:class:`~videos.models.LikeShardBucket`), pinned to ``default``
+on first use, so changing ``LIKE_SHARDS`` never moves data by itself; the
+``rebalance_likes`` command moves buckets between aliases. Videos, users,
+rollups and outbox checkpoints stay on the default database.
+
+Buckets on ``default`` behave exactly as without sharding: the like updates
+``Video.total_likes`` in its own transaction. Buckets on another alias keep
+their per-video counters in :class:`~videos.models.VideoLikeCount` on that
+alias, and the ``like_counts`` outbox consumer applies the like events of
+the shard to ``Video.total_likes``, so lists, ordering and statistics keep
+reading one table on the default database and lag shard writes by the
+consumer interval.
+
+Without ``LIKE_SHARDS`` every bucket is on ``default`` and nothing is
+queried to find it.
+"""
+
+import contextlib
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Iterable
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from videos import models as videos_models
+
+
+DEFAULT = "default"
+# Модели, строки которых лежат на шардах лайков
+SHARDED_MODELS = {
+    "videos.like",
+    "videos.videolikecount",
+    "videos.outboxevent",
+}
+COUNTS_CONSUMER = "like_counts"
+# Сколько id передаётся в одном запросе к шарду
+CHUNK_SIZE = 1000
+
+_current_shard = ContextVar("like_shard", default=DEFAULT)
+
+
+class ShardUnavailable(Exception):
+    """
+    Raised when likes of a video are written while its bucket is being
+    moved to another database.
+    """
+
+
+def is_enabled() -> bool:
+    return bool(settings.LIKE_SHARDS)
+
+
+def bucket_of(video_id: int) -> int:
+    return video_id % settings.LIKE_SHARD_BUCKETS
+
+
+def shard_aliases() -> list[str]:
+    """
+    Return the aliases other than ``default`` that may hold likes.
+    """
+    aliases = dict.fromkeys(settings.LIKE_SHARDS)
+    aliases.update((alias, None) for alias, _ in _load_map().values())
+    aliases.pop(DEFAULT, None)
+    return list(aliases)
+
+
+def outbox_aliases() -> list[str]:
+    """
+    Return the aliases with an outbox: ``default`` and every shard.
+    """
+    return [DEFAULT, *shard_aliases()] if is_enabled() else [DEFAULT]
+
+
+def checkpoint_name(consumer: str, using: str) -> str:
+    """
+    Return the key of a consumer's checkpoint for the outbox of an alias.
+
+    Checkpoints of every outbox are stored on the default database.
+    """
+    return consumer if using == DEFAULT else f"{consumer}@{using}"
+
+
+_map = None
+_map_loaded_at = None
+_map_lock = threading.Lock()
+
+
+def _load_map() -> dict[int, tuple[str, str]]:
+    """
+    Return ``(alias, moving_from)`` per bucket, cached for
+    ``LIKE_SHARD_MAP_SECONDS``.
+    """
+    global _map, _map_loaded_at
+    if not is_enabled():
+        return {}
+    with _map_lock:
+        now = time.monotonic()
+        if (
+            _map is None
+            or now - _map_loaded_at >= settings.LIKE_SHARD_MAP_SECONDS
+        ):
+            _map = ShardMap.read()
+            _map_loaded_at = now
+        return _map
+
+
+def invalidate_map() -> None:
+    global _map
+    with _map_lock:
+        _map = None
+
+
+class ShardMap:
+    """
+    Reads and changes the bucket map on the default database.
+    """
+
+    @staticmethod
+    def read() -> dict[int, tuple[str, str]]:
+        buckets = videos_models.LikeShardBucket.objects.using(DEFAULT)
+        rows = {
+            bucket: (alias, moving_from)
+            for bucket, alias, moving_from
+            in buckets.values_list("bucket", "alias", "moving_from")
+        }
+        if len(rows) < settings.LIKE_SHARD_BUCKETS:
+            # Первое обращение закрепляет все корзины за default
+            buckets.bulk_create(
+                [
+                    videos_models.LikeShardBucket(bucket=bucket, alias=DEFAULT)
+                    for bucket in range(settings.LIKE_SHARD_BUCKETS)
+                    if bucket not in rows
+                ],
+                ignore_conflicts=True,
+            )
+            return ShardMap.read()
+        unknown = {alias for alias, _ in rows.values()} - set(
+            settings.DATABASES
+        )
+        if unknown:
+            raise ImproperlyConfigured(
+                f"Like buckets are mapped to unknown databases: "
+                f"{', '.join(sorted(unknown))}"
+            )
+        return rows
+
+    @staticmethod
+    def update(bucket: int, **fields) -> None:
+        videos_models.LikeShardBucket.objects.using(DEFAULT).filter(
+            bucket=bucket
+        ).update(**fields)
+        invalidate_map()
+
+
+def shard_for(video_id: int, writing: bool = False) -> str:
+    """
+    Return the alias holding the likes of a video.
+
+    Raises:
+        ShardUnavailable: If ``writing`` and the bucket is being moved.
+    """
+    if not is_enabled():
+        return DEFAULT
+    alias, moving_from = _load_map()[bucket_of(video_id)]
+    if writing and moving_from:
+        raise ShardUnavailable(video_id)
+    return alias
+
+
+def group_by_shard(video_ids: Iterable[int]) -> dict[str, list[int]]:
+    groups = defaultdict(list)
+    for video_id in video_ids:
+        groups[shard_for(video_id)].append(video_id)
+    return groups
+
+
+@contextlib.contextmanager
+def use_shard(alias: str):
+    """
+    Route queries of sharded models made without ``using()``, such as
+    Django's uniqueness checks in ``full_clean()``, to ``alias``.
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def repeatable_read(using: str) -> None:
+    """
+    Make the current transaction on ``using`` read one snapshot.
+
+    Must be the first statement of the transaction; nested blocks keep the
+    isolation of the outer transaction. SQLite transactions already read a
+    single snapshot.
+    """
+    connection = connections[using]
+    if connection.vendor == "postgresql" and not connection.savepoint_ids:
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+
+def _chunks(items: list, size: int = CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class LikeCounters:
+    """
+    Per-video like counters: ``Video.total_likes`` for buckets on
+    ``default``, :class:`~videos.models.VideoLikeCount` on shards.
+    """
+
+    @classmethod
+    def add(cls, using: str, deltas: dict[int, int]) -> None:
+        """
+        Add deltas to the counters of videos on ``using``, in the
+        transaction of the like change.
+        """
+        if using == DEFAULT:
+            cls.add_to_videos(deltas)
+            return
+        rows = [
+            (video_id, delta)
+            for video_id, delta in sorted(deltas.items()) if delta
+        ]
+        if not rows:
+            return
+        connection = connections[using]
+        table = connection.ops.quote_name(
+            videos_models.VideoLikeCount._meta.db_table
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (video_id, total_likes) "
+                "VALUES (%s, %s) "
+                "ON CONFLICT (video_id) "
+                f"DO UPDATE SET total_likes = "
+                f"{table}.total_likes + EXCLUDED.total_likes",
+                rows,
+            )
+
+    @staticmethod
+    def add_to_videos(deltas: dict[int, int]) -> None:
+        """
+        Add deltas to ``Video.total_likes``, one update per distinct delta.
+        """
+        by_delta = defaultdict(list)
+        for video_id, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(video_id)
+        for delta, video_ids in by_delta.items():
+            videos_models.Video.objects.filter(
+                id__in=sorted(video_ids)
+            ).update(
+                total_likes=F("total_likes") + delta,
+                updated_at=timezone.now(),
+            )
+
+    @staticmethod
+    def get(video_ids: Iterable[int]) -> dict[int, int]:
+        """
+        Return the counters of videos, read where they are written.
+
+        Videos without a counter are left out.
+        """
+        counts = {}
+        for using, ids in group_by_shard(video_ids).items():
+            for chunk in _chunks(ids):
+                if using == DEFAULT:
+                    rows = videos_models.Video.objects.filter(
+                        id__in=chunk
+                    ).values_list("id", "total_likes")
+                else:
+                    rows = videos_models.VideoLikeCount.objects.using(
+                        using
+                    ).filter(video_id__in=chunk).values_list(
+                        "video_id", "total_likes"
+                    )
+                counts.update(rows)
+        return counts
+
+
+def count_likes(video_ids: Iterable[int]) -> dict[int, int]:
+    """
+    Count the Like rows of videos on their shards.
+    """
+    counts = Counter()
+    for using, ids in group_by_shard(video_ids).items():
+        for chunk in _chunks(ids):
+            counts.update(dict(
+                videos_models.Like.objects.using(using)
+                .filter(video_id__in=chunk)
+                .values("video_id")
+                .annotate(likes=Count("id"))
+                .values_list("video_id", "likes")
+            ))
+    return counts
+
+
+def user_liked(user_id: int, video_ids: Iterable[int]) -> set[int]:
+    """
+    Return which of the videos the user liked, asking only the shards of
+    those videos.
+    """
+    liked = set()
+    for using, ids in group_by_shard(video_ids).items():
+        for chunk in _chunks(ids):
+            liked.update(
+                videos_models.Like.objects.using(using)
+                .filter(user_id=user_id, video_id__in=chunk)
+                .values_list("video_id", flat=True)
+            )
+    return liked
+
+
+def users_with_likes(user_ids: Iterable[int]) -> set[int]:
+    """
+    Return which of the users have likes on any shard.
+
+    A user's likes may be on every shard, so all of them are asked.
+    """
+    user_ids = list(user_ids)
+    found = set()
+    for using in [DEFAULT, *shard_aliases()]:
+        for chunk in _chunks(user_ids):
+            found.update(
+                videos_models.Like.objects.using(using)
+                .filter(user_id__in=chunk)
+                .values_list("user_id", flat=True).distinct()
+            )
+    return found
+
+
+def user_likes_before(
+    user_id: int, before: tuple | None, limit: int
+) -> list[tuple]:
+    """
+    Return up to ``limit`` likes of a user older than the ``before`` key,
+    newest first, merged from every shard.
+
+    Keys are ``(created_at, video_id)``: a user likes a video once, so they
+    are unique on every shard, unlike row ids. Each shard reads them from
+    the ``like_user_created_idx`` covering index.
+
+    Args:
+        user_id (int): Id of the user.
+        before (tuple | None): Key of the last like already returned.
+        limit (int): Number of likes to return at most.
+
+    Returns:
+        list[tuple]: ``(created_at, video_id)`` pairs in key order.
+    """
+    likes = []
+    for using in [DEFAULT, *shard_aliases()]:
+        queryset = videos_models.Like.objects.using(using).filter(
+            user_id=user_id
+        )
+        if before is not None:
+            created_at, video_id = before
+            # created_at__lte ограничивает диапазон индекса, условие
+            # с OR только отсекает строки с тем же created_at
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, video_id__lt=video_id),
+                created_at__lte=created_at,
+            )
+        likes.extend(
+            queryset.order_by("-created_at", "-video_id")
+            .values_list("created_at", "video_id")[:limit]
+        )
+    likes.sort(reverse=True)
+    return likes[:limit]
+
+
+class LikeShardRouter:
+    """
+    Routes sharded models to the alias of the instance they are reached
+    from or of :func:`use_shard`, everything else to ``default``.
+
+    Every alias gets the full schema, so migrations run unchanged; only the
+    sharded tables hold rows outside ``default``. Relations across aliases
+    are allowed: the foreign keys of ``Like`` have no database constraint.
+    """
+
+    def _route(self, model, **hints):
+        if model._meta.label_lower not in SHARDED_MODELS:
+            return DEFAULT
+        instance = hints.get("instance")
+        if (
+            instance is not None
+            and instance._meta.label_lower in SHARDED_MODELS
+            and instance._state.db
+        ):
+            return instance._state.db
+        return _current_shard.get()
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class LikeShardRebalancer:
+    """
+    Moves like buckets between aliases without losing writes.
+
+    A move marks the bucket as moving, so likes of its videos answer 503
+    until it ends, and waits twice ``LIKE_SHARD_MAP_SECONDS`` for every
+    process to see the mark and finish likes already started. Like events
+    of the source shard are waited for until ``like_counts`` has applied
+    them. Likes are then copied to the target, whose counters are recounted
+    from the copied rows, the bucket is pointed at the target and the rows
+    are deleted from the source. An interrupted move is resumed by running
+    it again. Like ids are not preserved.
+
+    Attributes:
+        log (callable): Receives progress messages.
+    """
+
+    def __init__(self, log=lambda message: None):
+        self.log = log
+
+    @staticmethod
+    def plan() -> list[tuple[int, str]]:
+        """
+        Return the moves spreading buckets evenly over ``LIKE_SHARDS``, as
+        ``(bucket, target)`` pairs. Buckets stay where they are when their
+        alias is below its share.
+        """
+        aliases = list(settings.LIKE_SHARDS)
+        buckets = settings.LIKE_SHARD_BUCKETS
+        quota = {
+            alias: buckets // len(aliases) + (i < buckets % len(aliases))
+            for i, alias in enumerate(aliases)
+        }
+        spare = []
+        for bucket, (alias, _) in sorted(ShardMap.read().items()):
+            if quota.get(alias, 0) > 0:
+                quota[alias] -= 1
+            else:
+                spare.append(bucket)
+        targets = [alias for alias, left in quota.items() for _ in range(left)]
+        return list(zip(spare, targets))
+
+    def move(self, moves: list[tuple[int, str]], group: int = 16) -> int:
+        """
+        Move buckets to their targets, or recount the counters of buckets
+        already there.
+
+        Buckets are moved in groups that share one wait, so a bucket
+        refuses likes while its group is being copied.
+
+        Args:
+            moves (list[tuple[int, str]]): ``(bucket, target)`` pairs.
+            group (int): Buckets marked as moving at once.
+
+        Returns:
+            int: Number of likes in the buckets.
+        """
+        unknown = {target for _, target in moves} - set(settings.DATABASES)
+        if unknown:
+            raise ImproperlyConfigured(
+                f"Unknown databases: {', '.join(sorted(unknown))}"
+            )
+        total = 0
+        for chunk in _chunks(moves, group):
+            current = ShardMap.read()
+            sources, marked = {}, False
+            for bucket, target in chunk:
+                alias, moving_from = current[bucket]
+                if moving_from and alias not in (moving_from, target):
+                    raise ShardUnavailable(
+                        f"Bucket {bucket} is being moved "
+                        f"from {moving_from} to {alias}"
+                    )
+                if moving_from and alias == target:
+                    # Перенос прервался после переключения: остаётся
+                    # удалить строки из источника
+                    sources[bucket] = moving_from
+                    continue
+                sources[bucket] = alias
+                ShardMap.update(bucket, moving_from=alias)
+                marked = True
+            if marked:
+                time.sleep(2 * settings.LIKE_SHARD_MAP_SECONDS)
+                for source in set(sources.values()):
+                    self._wait_for_counts(source)
+            for bucket, target in chunk:
+                total += self._transfer(
+                    bucket, sources[bucket], current[bucket][0], target
+                )
+        return total
+
+    def _transfer(
+        self, bucket: int, source: str, alias: str, target: str
+    ) -> int:
+        video_ids = list(
+            videos_models.Video.objects.annotate(
+                bucket=Mod("id", settings.LIKE_SHARD_BUCKETS)
+            ).filter(bucket=bucket).order_by("id")
+            .values_list("id", flat=True)
+        )
+        total = 0
+        if alias != target or source == target:
+            for chunk in _chunks(video_ids):
+                total += self._copy(chunk, source, target)
+            ShardMap.update(bucket, alias=target)
+        if source != target:
+            for chunk in _chunks(video_ids):
+                self._delete(chunk, source)
+        ShardMap.update(bucket, moving_from="")
+        self.log(f"Корзина {bucket}: {source} -> {target}, лайков: {total}")
+        return total
+
+    def _wait_for_counts(self, source: str) -> None:
+        if source == DEFAULT or COUNTS_CONSUMER not in (
+            settings.OUTBOX_CONSUMERS
+        ):
+            return
+        last_id = videos_models.OutboxEvent.objects.using(source).aggregate(
+            last_id=Max("id")
+        )["last_id"] or 0
+        name = checkpoint_name(COUNTS_CONSUMER, source)
+        while (
+            videos_models.OutboxCheckpoint.objects.filter(
+                consumer=name
+            ).values_list("position", flat=True).first() or 0
+        ) < last_id:
+            self.log(f"Ждём, пока {name} обработает события до {last_id}")
+            time.sleep(1)
+
+    @staticmethod
+    def _copy(video_ids: list[int], source: str, target: str) -> int:
+        with transaction.atomic(using=target):
+            if source != target:
+                rows = list(
+                    videos_models.Like.objects.using(source)
+                    .filter(video_id__in=video_ids)
+                    .values_list("video_id", "user_id", "created_at",
+                                 "updated_at")
+                )
+                videos_models.Like.objects.using(target).filter(
+                    video_id__in=video_ids
+                ).delete()
+                LikeShardRebalancer._insert_likes(target, rows)
+            if target == DEFAULT:
+                # Счётчики default уже верны: их ведут лайки и like_counts
+                return videos_models.Like.objects.filter(
+                    video_id__in=video_ids
+                ).count()
+            counts = dict(
+                videos_models.Like.objects.using(target)
+                .filter(video_id__in=video_ids)
+                .values("video_id")
+                .annotate(likes=Count("id"))
+                .values_list("video_id", "likes")
+            )
+            counters = videos_models.VideoLikeCount.objects.using(target)
+            counters.filter(video_id__in=video_ids).delete()
+            counters.bulk_create(
+                videos_models.VideoLikeCount(
+                    video_id=video_id, total_likes=likes
+                )
+                for video_id, likes in counts.items()
+            )
+        return sum(counts.values())
+
+    @staticmethod
+    def _insert_likes(using: str, rows: list[tuple]) -> None:
+        # bulk_create перезаписал бы created_at, по которому считаются
+        # корзины свёрток
+        connection = connections[using]
+        table = connection.ops.quote_name(videos_models.Like._meta.db_table)
+        rows = [
+            (video_id, user_id,
+             connection.ops.adapt_datetimefield_value(created_at),
+             connection.ops.adapt_datetimefield_value(updated_at))
+            for video_id, user_id, created_at, updated_at in rows
+        ]
+        with connection.cursor() as cursor:
+            for chunk in _chunks(rows):
+                cursor.executemany(
+                    f"INSERT INTO {table} "
+                    "(video_id, user_id, created_at, updated_at) "
+                    "VALUES (%s, %s, %s, %s)",
+                    chunk,
+                )
+
+    @staticmethod
+    def _delete(video_ids: list[int], source: str) -> None:
+        with transaction.atomic(using=source):
+            videos_models.Like.objects.using(source).filter(
+                video_id__in=video_ids
+            ).delete()
+            if source != DEFAULT:
+                videos_models.VideoLikeCount.objects.using(source).filter(
+                    video_id__in=video_ids
+                ).delete()
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from videos import bitmap as videos_bitmap
+from videos import models as videos_models
+
+
+@receiver(post_save, sender=videos_models.Video)
+def mark_published_bitmap(sender, instance, using, **kwargs):
+    """
+    Set or clear the bit of a saved video once its transaction commits.
+
+    Queryset updates send no signal; the periodic sync of the bitmap picks
+    them up by ``updated_at``.
+    """
+    bitmap = videos_bitmap.get_bitmap()
+    if bitmap is None:
+        return
+    published = instance.is_published and instance.deleted_at is None
+    transaction.on_commit(
+        lambda: bitmap.mark(instance.id, published), using=using
+    )
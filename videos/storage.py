@@ -0,0 +1,172 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+CHUNK_SIZE = 1024 * 1024
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Temporary file upload handler that computes the SHA-256 of the upload
+    while it is being written to disk.
+
+    The digest is attached to the uploaded file as ``sha256`` so the
+    storage does not have to read the file again.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names files by the SHA-256 of their content.
+
+    A file uploaded to ``videos/clip.mp4`` is stored as
+    ``videos/ab/cd/abcd...ef``, without the extension of the upload.
+    Identical content is therefore stored once, whatever it was named, and
+    shared by every row that references it; a file is removed only when no
+    row references it any more.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым, совпадение означает тот же файл
+        return name
+
+    def content_name(self, name: str, digest: str) -> str:
+        """
+        Build the content-addressed name for a file.
+
+        Args:
+            name (str): Original name, only its directory is kept.
+            digest (str): Hex SHA-256 of the content.
+
+        Returns:
+            str: Storage name of the content.
+        """
+        return os.path.join(
+            os.path.dirname(name), digest[:2], digest[2:4], digest
+        )
+
+    @staticmethod
+    def digest(name: str) -> str | None:
+        """
+        Return the SHA-256 encoded in a content-addressed name, if any.
+        """
+        stem = os.path.splitext(os.path.basename(name))[0]
+        return stem if DIGEST_RE.match(stem) else None
+
+    def _save(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+
+        digest = getattr(content, "sha256", None)
+        if digest and hasattr(content, "temporary_file_path"):
+            temporary = content.temporary_file_path()
+            return self._commit(name, digest, temporary, move=True)
+
+        # Хеш считается в том же проходе, в котором файл пишется на диск
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(
+            dir=directory, prefix=".upload-", delete=False
+        ) as temporary:
+            for chunk in content.chunks(CHUNK_SIZE):
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                hasher.update(chunk)
+                temporary.write(chunk)
+        try:
+            return self._commit(name, hasher.hexdigest(), temporary.name)
+        finally:
+            if os.path.exists(temporary.name):
+                os.remove(temporary.name)
+
+    def _commit(
+        self, name: str, digest: str, source: str, move: bool = False
+    ) -> str:
+        stored_name = self.content_name(name, digest)
+        path = self.path(stored_name)
+        if os.path.exists(path):
+            # Обновлённое время изменения защищает файл от удаления сборщиком
+            # мусора, пока строка со ссылкой на него ещё не записана
+            os.utime(path)
+            return stored_name
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if move:
+            file_move_safe(source, path, allow_overwrite=True)
+        else:
+            os.replace(source, path)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return stored_name
+
+    def adopt(self, name: str) -> tuple[str, str, int]:
+        """
+        Hash an existing file and link it under its content-addressed name.
+
+        The original file is left in place, so rows that still reference it
+        stay valid until they are updated.
+
+        Args:
+            name (str): Storage name of the existing file.
+
+        Returns:
+            tuple[str, str, int]: Content-addressed name, SHA-256 and size.
+        """
+        source = self.path(name)
+        hasher = hashlib.sha256()
+        size = 0
+        with open(source, "rb") as source_file:
+            while chunk := source_file.read(CHUNK_SIZE):
+                hasher.update(chunk)
+                size += len(chunk)
+        digest = hasher.hexdigest()
+
+        upload_name = name
+        if self.digest(name) == digest:
+            if not os.path.splitext(name)[1]:
+                return name, digest, size
+            # Прежнее имя с расширением лежит на два каталога ниже загрузки
+            directory = os.path.dirname(os.path.dirname(os.path.dirname(name)))
+            upload_name = os.path.join(directory, os.path.basename(name))
+        stored_name = self.content_name(upload_name, digest)
+        path = self.path(stored_name)
+        if os.path.exists(path):
+            os.utime(path)
+            return stored_name, digest, size
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(source, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copyfile(source, path)
+        return stored_name, digest, size
+
+
+def get_video_storage():
+    """
+    Storage of video files, referenced by the model field as a callable so
+    migrations do not depend on storage settings.
+    """
+    return ContentAddressedStorage()
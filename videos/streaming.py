@@ -0,0 +1,414 @@
+"""
+Segment indexes and adaptive streaming manifests for fragmented MP4 files.
+
+A fragmented MP4 (for example produced by ``ffmpeg -movflags
++frag_keyframe+empty_moov+default_base_moof``) starts with an
+initialization segment (``ftyp`` and ``moov``) followed by ``moof``/``mdat``
+fragments. Players fetch the fragments with byte-range requests against the
+original file, so no segment files are written.
+"""
+
+import io
+import struct
+from xml.sax.saxutils import escape, quoteattr
+
+
+QUALITY_RESOLUTIONS = {
+    "HD": (1280, 720),
+    "FHD": (1920, 1080),
+    "UHD": (3840, 2160),
+}
+
+
+class SegmentIndexError(Exception):
+    """
+    Raised when a file cannot be split into segments.
+    """
+
+
+def _boxes(stream, start: int, end: int):
+    """
+    Iterate over the ISO BMFF boxes between two offsets without reading
+    their payload.
+
+    Yields:
+        tuple[str, int, int, int]: Box type, offset, header size and size.
+    """
+    offset = start
+    while offset + 8 <= end:
+        stream.seek(offset)
+        size, kind = struct.unpack(">I4s", stream.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", stream.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise SegmentIndexError(f"Повреждённый бокс {kind!r} на {offset}")
+        yield kind.decode("latin-1"), offset, header, size
+        offset += size
+
+
+def _children(data: bytes, start: int = 0, end: int | None = None) -> dict:
+    """
+    Payloads of the direct child boxes of an in-memory container.
+
+    Returns:
+        dict[str, list[bytes]]: Payloads per box type.
+    """
+    stream = io.BytesIO(data)
+    children = {}
+    for kind, offset, header, size in _boxes(
+        stream, start, len(data) if end is None else end
+    ):
+        children.setdefault(kind, []).append(
+            data[offset + header:offset + size]
+        )
+    return children
+
+
+def _video_track(moov: bytes) -> dict:
+    """
+    Find the first video track of a ``moov`` box.
+
+    Returns:
+        dict: ``track_id``, ``timescale``, ``width``, ``height``,
+            ``codecs`` and ``default_duration`` of the track.
+    """
+    boxes = _children(moov)
+    trex = {}
+    for mvex in boxes.get("mvex", []):
+        for payload in _children(mvex).get("trex", []):
+            track_id, _, duration = struct.unpack(">III", payload[4:16])
+            trex[track_id] = duration
+
+    for trak in boxes.get("trak", []):
+        trak_boxes = _children(trak)
+        mdia = _children(trak_boxes["mdia"][0])
+        if mdia["hdlr"][0][8:12] != b"vide":
+            continue
+
+        tkhd = trak_boxes["tkhd"][0]
+        track_id = struct.unpack(
+            ">I", tkhd[20:24] if tkhd[0] == 1 else tkhd[12:16]
+        )[0]
+        mdhd = mdia["mdhd"][0]
+        timescale = struct.unpack(
+            ">I", mdhd[20:24] if mdhd[0] == 1 else mdhd[12:16]
+        )[0]
+
+        width = height = codecs = None
+        stbl = _children(_children(mdia["minf"][0])["stbl"][0])
+        stsd = stbl["stsd"][0]
+        entries = _children(stsd, 8)
+        for kind, (payload, *_) in entries.items():
+            width, height = struct.unpack(">HH", payload[24:28])
+            avcc = _children(payload, 78).get("avcC")
+            if kind in ("avc1", "avc3") and avcc:
+                codecs = f"{kind}.{avcc[0][1:4].hex().upper()}"
+            else:
+                codecs = kind
+            break
+
+        return {
+            "track_id": track_id,
+            "timescale": timescale,
+            "width": width,
+            "height": height,
+            "codecs": codecs,
+            "default_duration": trex.get(track_id, 0),
+        }
+    raise SegmentIndexError("В файле нет видеодорожки")
+
+
+def _fragment_duration(moof: bytes, track: dict) -> int:
+    """
+    Sum the sample durations of the video track in a ``moof`` box.
+    """
+    for traf in _children(moof).get("traf", []):
+        traf_boxes = _children(traf)
+        tfhd = traf_boxes["tfhd"][0]
+        flags = int.from_bytes(tfhd[1:4], "big")
+        if struct.unpack(">I", tfhd[4:8])[0] != track["track_id"]:
+            continue
+        position = 8
+        position += 8 if flags & 0x01 else 0
+        position += 4 if flags & 0x02 else 0
+        default = track["default_duration"]
+        if flags & 0x08:
+            default = struct.unpack(">I", tfhd[position:position + 4])[0]
+
+        duration = 0
+        for trun in traf_boxes.get("trun", []):
+            flags = int.from_bytes(trun[1:4], "big")
+            count = struct.unpack(">I", trun[4:8])[0]
+            position = 8
+            position += 4 if flags & 0x01 else 0
+            position += 4 if flags & 0x04 else 0
+            if not flags & 0x100:
+                duration += count * default
+                continue
+            stride = 4 * bin(flags & 0xF00).count("1")
+            for _ in range(count):
+                duration += struct.unpack(
+                    ">I", trun[position:position + 4]
+                )[0]
+                position += stride
+        return duration
+    return 0
+
+
+def _sidx_segments(sidx: bytes, anchor: int) -> tuple[int, list]:
+    """
+    Read the segments referenced by a ``sidx`` box.
+
+    Args:
+        sidx (bytes): Payload of the box.
+        anchor (int): File offset of the first byte after the box.
+
+    Returns:
+        tuple[int, list]: Timescale and ``[offset, length, duration]``
+            lists.
+    """
+    version = sidx[0]
+    timescale = struct.unpack(">I", sidx[8:12])[0]
+    if version == 0:
+        first_offset = struct.unpack(">I", sidx[16:20])[0]
+        position = 20
+    else:
+        first_offset = struct.unpack(">Q", sidx[20:28])[0]
+        position = 28
+    count = struct.unpack(">H", sidx[position + 2:position + 4])[0]
+    position += 4
+
+    segments = []
+    offset = anchor + first_offset
+    for _ in range(count):
+        reference, duration, _ = struct.unpack(
+            ">III", sidx[position:position + 12]
+        )
+        if reference >> 31:
+            raise SegmentIndexError("Иерархический sidx не поддерживается")
+        size = reference & 0x7FFFFFFF
+        segments.append([offset, size, duration])
+        offset += size
+        position += 12
+    return timescale, segments
+
+
+def read_segment_index(path: str) -> dict:
+    """
+    Build the segment index of a fragmented MP4 file.
+
+    Only box headers, ``moov``, ``sidx`` and ``moof`` boxes are read, the
+    media data is skipped.
+
+    Args:
+        path (str): Path of the file.
+
+    Raises:
+        SegmentIndexError: If the file is not a fragmented MP4, or its
+            timescale or all of its segment durations are zero.
+
+    Returns:
+        dict: ``timescale``, ``init`` byte range, ``segments`` as
+            ``[offset, length, duration]`` lists, ``width``, ``height``
+            and ``codecs``.
+    """
+    with open(path, "rb") as stream:
+        stream.seek(0, io.SEEK_END)
+        end = stream.tell()
+
+        track = None
+        init_end = None
+        segments = []
+        try:
+            for kind, offset, header, size in _boxes(stream, 0, end):
+                if kind in ("moov", "sidx", "moof"):
+                    stream.seek(offset + header)
+                    payload = stream.read(size - header)
+                if kind == "moov":
+                    track = _video_track(payload)
+                elif track is None:
+                    continue
+                elif kind == "sidx":
+                    init_end = init_end or offset
+                    track["timescale"], segments = _sidx_segments(
+                        payload, offset + size
+                    )
+                    break
+                elif kind == "moof":
+                    init_end = init_end or offset
+                    segments.append(
+                        [offset, size, _fragment_duration(payload, track)]
+                    )
+                elif kind == "mdat" and segments:
+                    segments[-1][1] = offset + size - segments[-1][0]
+        except (KeyError, IndexError, struct.error) as error:
+            raise SegmentIndexError(f"Некорректный MP4: {error!r}")
+
+    if track is None:
+        raise SegmentIndexError("В файле нет бокса moov")
+    if not segments:
+        raise SegmentIndexError("Файл не фрагментирован")
+    # Без длительностей нельзя вычислить ни битрейт, ни длину ролика
+    if not track["timescale"]:
+        raise SegmentIndexError("Нулевой timescale")
+    if not any(duration for _, _, duration in segments):
+        raise SegmentIndexError("У всех сегментов нулевая длительность")
+    return {
+        "timescale": track["timescale"],
+        "init": [0, init_end],
+        "segments": segments,
+        "width": track["width"],
+        "height": track["height"],
+        "codecs": track["codecs"],
+    }
+
+
+class Rendition:
+    """
+    One quality of a video with its segment index.
+
+    Attributes:
+        name (str): Quality name, used as representation id.
+        url (str): Absolute URL of the file.
+        index (dict): Segment index from :func:`read_segment_index`.
+    """
+
+    def __init__(self, name: str, url: str, index: dict):
+        self.name = name
+        self.url = url
+        self.index = index
+
+    @property
+    def duration(self) -> float:
+        return sum(
+            segment[2] for segment in self.index["segments"]
+        ) / self.index["timescale"]
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        if self.index["width"] and self.index["height"]:
+            return self.index["width"], self.index["height"]
+        return QUALITY_RESOLUTIONS.get(self.name, (0, 0))
+
+    @property
+    def bandwidth(self) -> int:
+        """
+        Peak bit rate of a single segment.
+        """
+        timescale = self.index["timescale"]
+        return max(
+            int(length * 8 * timescale / duration)
+            for _, length, duration in self.index["segments"]
+            if duration
+        )
+
+    @property
+    def average_bandwidth(self) -> int:
+        size = sum(segment[1] for segment in self.index["segments"])
+        return int(size * 8 / self.duration) if self.duration else 0
+
+
+def hls_master_playlist(variants: list[tuple[Rendition, str]]) -> str:
+    """
+    Render an HLS master playlist.
+
+    Args:
+        variants (list[tuple[Rendition, str]]): Renditions with the URIs of
+            their media playlists.
+
+    Returns:
+        str: Playlist text.
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for rendition, uri in sorted(variants, key=lambda v: v[0].bandwidth):
+        width, height = rendition.resolution
+        attributes = [
+            f"BANDWIDTH={rendition.bandwidth}",
+            f"AVERAGE-BANDWIDTH={rendition.average_bandwidth}",
+            f"RESOLUTION={width}x{height}",
+        ]
+        if rendition.index["codecs"]:
+            attributes.append(f'CODECS="{rendition.index["codecs"]}"')
+        lines.append(f"#EXT-X-STREAM-INF:{','.join(attributes)}")
+        lines.append(uri)
+    return "\n".join(lines) + "\n"
+
+
+def hls_media_playlist(rendition: Rendition) -> str:
+    """
+    Render an HLS media playlist addressing segments by byte range.
+
+    Returns:
+        str: Playlist text.
+    """
+    index = rendition.index
+    timescale = index["timescale"]
+    durations = [segment[2] / timescale for segment in index["segments"]]
+    init_offset, init_end = index["init"]
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{max(round(max(durations)), 1)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        f'#EXT-X-MAP:URI="{rendition.url}",'
+        f'BYTERANGE="{init_end - init_offset}@{init_offset}"',
+    ]
+    for (offset, length, _), duration in zip(index["segments"], durations):
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"#EXT-X-BYTERANGE:{length}@{offset}")
+        lines.append(rendition.url)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def dash_manifest(renditions: list[Rendition]) -> str:
+    """
+    Render a static MPEG-DASH manifest with one representation per rendition.
+
+    Returns:
+        str: MPD document.
+    """
+    duration = max(rendition.duration for rendition in renditions)
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+        'profiles="urn:mpeg:dash:profile:isoff-main:2011" '
+        f'minBufferTime="PT2S" mediaPresentationDuration="PT{duration:.3f}S">',
+        "  <Period>",
+        '    <AdaptationSet mimeType="video/mp4" segmentAlignment="true">',
+    ]
+    for rendition in sorted(renditions, key=lambda r: r.bandwidth):
+        index = rendition.index
+        width, height = rendition.resolution
+        codecs = (
+            f" codecs={quoteattr(index['codecs'])}" if index["codecs"] else ""
+        )
+        init_offset, init_end = index["init"]
+        lines += [
+            f"      <Representation id={quoteattr(rendition.name)} "
+            f'bandwidth="{rendition.bandwidth}" width="{width}" '
+            f'height="{height}"{codecs}>',
+            f"        <BaseURL>{escape(rendition.url)}</BaseURL>",
+            f'        <SegmentList timescale="{index["timescale"]}">',
+            "          <Initialization "
+            f'range="{init_offset}-{init_end - 1}"/>',
+            "          <SegmentTimeline>",
+        ]
+        lines += [
+            f'            <S d="{ticks}"/>'
+            for _, _, ticks in index["segments"]
+        ]
+        lines.append("          </SegmentTimeline>")
+        lines += [
+            "          <SegmentURL "
+            f'mediaRange="{offset}-{offset + length - 1}"/>'
+            for offset, length, _ in index["segments"]
+        ]
+        lines += ["        </SegmentList>", "      </Representation>"]
+    lines += ["    </AdaptationSet>", "  </Period>", "</MPD>"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,373 @@
+"""
+Concurrency stress of the like path.
+
+:class:`LikeStorm` runs like/unlike storms through
+:class:`~videos.services.VideoLikeManager` from several processes with
+several threads each; every thread has its own database connection. Most
+operations go to a few hot videos, so workers contend for the same counter
+rows, and the rest are spread over cold videos. While the storm runs a
+separate connection samples backends waiting for a lock.
+
+:func:`check_invariants` then verifies, for the videos of the storm:
+
+- the counter of every video equals its Like rows, read where the counter
+  is written, and ``Video.total_likes`` equals them once the
+  ``like_counts`` consumer has applied shard events;
+- no counter is negative;
+- no ``(video, user)`` pair is stored twice, on one shard or across
+  shards.
+
+Lock sampling and process workers need PostgreSQL. The test suite runs a
+small storm; the ``stress_likes`` command runs a large one against the
+configured database and restores the likes it changed.
+"""
+
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Count, Max
+
+from accounts import models as accounts_models
+from videos import events as videos_events
+from videos import models as videos_models
+from videos import services as videos_services
+from videos import sharding as videos_sharding
+
+
+# Интервал опроса ожидающих блокировку backend'ов
+LOCK_SAMPLE_SECONDS = 0.01
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Samples the backends of the current database that wait for a lock.
+
+    Attributes:
+        samples (list[int]): Number of waiting backends per sample.
+        deadlocks (int): Deadlocks detected while sampling.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.samples = []
+        self.deadlocks = 0
+        self._stop_event = threading.Event()
+
+    def _deadlocks(self) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT deadlocks FROM pg_stat_database "
+                "WHERE datname = current_database()"
+            )
+            return cursor.fetchone()[0]
+
+    def run(self):
+        try:
+            before = self._deadlocks()
+            with connection.cursor() as cursor:
+                while not self._stop_event.wait(LOCK_SAMPLE_SECONDS):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() "
+                        "AND wait_event_type = 'Lock'"
+                    )
+                    self.samples.append(cursor.fetchone()[0])
+            # Статистика обновляется с задержкой, поэтому читаем её новой
+            # транзакцией после остановки
+            self.deadlocks = self._deadlocks() - before
+        finally:
+            connection.close()
+
+    def stop(self) -> dict:
+        """
+        Stop sampling.
+
+        Returns:
+            dict: Sample count, share of samples with a waiting backend,
+            mean and maximum waiting backends and deadlocks.
+        """
+        self._stop_event.set()
+        self.join()
+        samples = self.samples or [0]
+        return {
+            "samples": len(self.samples),
+            "waiting_share": sum(1 for n in samples if n) / len(samples),
+            "waiting_mean": statistics.fmean(samples),
+            "waiting_max": max(samples),
+            "deadlocks": self.deadlocks,
+        }
+
+
+class LikeStorm:
+    """
+    Like/unlike storm over a set of videos and users.
+
+    Attributes:
+        video_ids (list[int]): Published videos of the storm; the first
+            ``hot`` of them are hot.
+        user_ids (list[int]): Users liking and unliking.
+        hot (int): Number of hot videos.
+        hot_share (float): Share of operations on hot videos.
+        ops (int): Operations per thread.
+        threads (int): Threads per process.
+        processes (int): Worker processes, forked; 1 runs the threads in
+            this process.
+        seed (int): Seed of the operation sequence.
+    """
+
+    def __init__(self, video_ids: list[int], user_ids: list[int],
+                 hot: int = 3, hot_share: float = 0.8, ops: int = 200,
+                 threads: int = 8, processes: int = 1, seed: int = 0):
+        self.video_ids = list(video_ids)
+        self.user_ids = list(user_ids)
+        self.hot = min(hot, len(self.video_ids))
+        self.hot_share = hot_share if self.hot < len(self.video_ids) else 1
+        self.ops = ops
+        self.threads = threads
+        self.processes = processes
+        self.seed = seed
+
+    def liked_pairs(self) -> set[tuple[int, int]]:
+        """
+        Return the ``(video_id, user_id)`` pairs of the storm that are
+        liked.
+        """
+        users = set(self.user_ids)
+        pairs = set()
+        for using, video_ids in videos_sharding.group_by_shard(
+            self.video_ids
+        ).items():
+            pairs.update(
+                pair for pair in
+                videos_models.Like.objects.using(using)
+                .filter(video_id__in=video_ids)
+                .values_list("video_id", "user_id")
+                if pair[1] in users
+            )
+        return pairs
+
+    def restore(self, pairs: set[tuple[int, int]]) -> int:
+        """
+        Like and unlike through the like path until exactly ``pairs`` are
+        liked among the pairs of the storm.
+
+        Returns:
+            int: Number of changed pairs.
+        """
+        current = self.liked_pairs()
+        videos = self._videos()
+        changed = 0
+        for video_id, user_id in sorted(current ^ pairs):
+            manager = videos_services.VideoLikeManager(
+                accounts_models.User(id=user_id), videos[video_id]
+            )
+            if (video_id, user_id) in pairs:
+                changed += manager.like()["created"]
+            else:
+                changed += bool(manager.unlike()["deleted"])
+        return changed
+
+    def _videos(self) -> dict[int, videos_models.Video]:
+        return videos_models.Video.objects.only(
+            "id", "owner_id", "is_published", "deleted_at"
+        ).in_bulk(self.video_ids)
+
+    def _run_thread(self, seed: int) -> dict:
+        rng = random.Random(seed)
+        videos = self._videos()
+        hot, cold = self.video_ids[:self.hot], self.video_ids[self.hot:]
+        outcomes = Counter()
+        errors = Counter()
+        latencies = {"like": [], "unlike": []}
+        try:
+            for _ in range(self.ops):
+                video_id = rng.choice(
+                    hot if rng.random() < self.hot_share else cold
+                )
+                manager = videos_services.VideoLikeManager(
+                    accounts_models.User(id=rng.choice(self.user_ids)),
+                    videos[video_id],
+                )
+                action = "like" if rng.random() < 0.5 else "unlike"
+                started = time.perf_counter()
+                try:
+                    if action == "like":
+                        changed = manager.like()["created"]
+                    else:
+                        changed = bool(manager.unlike()["deleted"])
+                except videos_sharding.ShardUnavailable:
+                    outcomes["shard_unavailable"] += 1
+                    continue
+                except Exception as error:
+                    # Ошибки базы называем по исключению драйвера
+                    errors[type(error.__cause__ or error).__name__] += 1
+                    continue
+                latencies[action].append(time.perf_counter() - started)
+                outcomes[f"{action}d" if changed else f"{action}_noop"] += 1
+        finally:
+            connections.close_all()
+        return {
+            "outcomes": outcomes, "errors": errors, "latencies": latencies,
+        }
+
+    def _run_process(self, index: int) -> dict:
+        results = [None] * self.threads
+
+        def work(number):
+            results[number] = self._run_thread(
+                self.seed * 1_000_003 + index * 1000 + number
+            )
+
+        workers = [
+            threading.Thread(target=work, args=(number,))
+            for number in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return _merge(results)
+
+    def run(self) -> dict:
+        """
+        Run the storm.
+
+        Returns:
+            dict: Operation outcomes, errors, elapsed seconds, throughput,
+            latency percentiles per action and lock wait statistics (None
+            on databases other than PostgreSQL).
+        """
+        # Соединения не должны переходить в дочерние процессы
+        connections.close_all()
+        sampler = None
+        if connection.vendor == "postgresql":
+            sampler = LockWaitSampler()
+            sampler.start()
+        started = time.perf_counter()
+        if self.processes > 1:
+            with multiprocessing.get_context("fork").Pool(
+                self.processes
+            ) as pool:
+                result = _merge(
+                    pool.map(self._run_process, range(self.processes))
+                )
+        else:
+            result = self._run_process(0)
+        elapsed = time.perf_counter() - started
+        locks = sampler.stop() if sampler else None
+
+        done = sum(len(samples) for samples in result["latencies"].values())
+        return {
+            "outcomes": dict(result["outcomes"]),
+            "errors": dict(result["errors"]),
+            "elapsed": elapsed,
+            "ops_per_second": done / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                action: _percentiles(samples)
+                for action, samples in result["latencies"].items()
+            },
+            "locks": locks,
+        }
+
+
+def _merge(results: list[dict]) -> dict:
+    merged = {
+        "outcomes": Counter(), "errors": Counter(),
+        "latencies": {"like": [], "unlike": []},
+    }
+    for result in results:
+        merged["outcomes"].update(result["outcomes"])
+        merged["errors"].update(result["errors"])
+        for action, samples in result["latencies"].items():
+            merged["latencies"][action].extend(samples)
+    return merged
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    if len(samples) < 2:
+        return {}
+    quantiles = statistics.quantiles(samples, n=100)
+    return {
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+    }
+
+
+def drain_like_counts(timeout: float = 30.0) -> None:
+    """
+    Let the ``like_counts`` consumers apply every shard event appended so
+    far to ``Video.total_likes``.
+    """
+    deadline = time.monotonic() + settings.OUTBOX_SETTLE_SECONDS + timeout
+    for consumer in videos_events.Consumer.configured():
+        if consumer.name != videos_sharding.COUNTS_CONSUMER:
+            continue
+        last = videos_models.OutboxEvent.objects.using(
+            consumer.using
+        ).aggregate(last=Max("id"))["last"] or 0
+        while time.monotonic() < deadline:
+            if consumer.process_batch():
+                continue
+            position = videos_models.OutboxCheckpoint.objects.filter(
+                consumer=consumer.checkpoint
+            ).values_list("position", flat=True).first() or 0
+            if position >= last:
+                break
+            # Пропуск в id ждёт OUTBOX_SETTLE_SECONDS
+            time.sleep(0.1)
+
+
+def check_invariants(video_ids: list[int]) -> list[str]:
+    """
+    Check the like invariants of videos, draining the ``like_counts``
+    consumers first.
+
+    Returns:
+        list[str]: Descriptions of the violations, empty when all hold.
+    """
+    drain_like_counts()
+    video_ids = list(video_ids)
+    violations = []
+    likes = videos_sharding.count_likes(video_ids)
+    counters = videos_sharding.LikeCounters.get(video_ids)
+    totals = dict(
+        videos_models.Video.objects.filter(id__in=video_ids)
+        .values_list("id", "total_likes")
+    )
+    for video_id in video_ids:
+        count = likes.get(video_id, 0)
+        counter = counters.get(video_id, 0)
+        if counter < 0:
+            violations.append(f"video {video_id}: counter {counter} < 0")
+        if counter != count:
+            violations.append(
+                f"video {video_id}: counter {counter} != {count} likes"
+            )
+        if totals.get(video_id) != count:
+            violations.append(
+                f"video {video_id}: total_likes {totals.get(video_id)} "
+                f"!= {count} likes"
+            )
+
+    seen = Counter()
+    for using in [videos_sharding.DEFAULT, *videos_sharding.shard_aliases()]:
+        rows = (
+            videos_models.Like.objects.using(using)
+            .filter(video_id__in=video_ids)
+            .values_list("video_id", "user_id")
+            .annotate(rows=Count("id"))
+        )
+        for video_id, user_id, rows in rows:
+            seen[video_id, user_id] += rows
+    violations.extend(
+        f"video {video_id}: user {user_id} liked {rows} times"
+        for (video_id, user_id), rows in sorted(seen.items()) if rows > 1
+    )
+    return violations
@@ -1,3 +1,2013 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import marshal
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts import models as accounts_models
+from video_project import metrics as project_metrics
+from video_project import profiling as project_profiling
+from video_project import renderers as project_renderers
+from video_project import warmup as project_warmup
+from videos import analytics as videos_analytics
+from videos import bitmap as videos_bitmap
+from videos import events as videos_events
+from videos import live as videos_live
+from videos import models as videos_models
+from videos import partitioning as videos_partitioning
+from videos import recommendations as videos_recommendations
+from videos import services as videos_services
+from videos import sharding as videos_sharding
+from videos import storage as videos_storage
+from videos import streaming as videos_streaming
+from videos import stress as videos_stress
+
+
+class VideoListTestCase(TestCase):
+    """
+    Published videos of three owners with distinct like counts and
+    creation times.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = [
+            accounts_models.User.objects.create_user(f"owner{i}", "pass")
+            for i in range(3)
+        ]
+        now = timezone.now()
+        videos = videos_models.Video.objects.bulk_create(
+            videos_models.Video(
+                owner=cls.owners[i % 3],
+                name=f"video{i}",
+                is_published=True,
+                total_likes=i % 7,
+            )
+            for i in range(60)
+        )
+        for i, video in enumerate(videos):
+            videos_models.Video.objects.filter(id=video.id).update(
+                created_at=now - timedelta(hours=i)
+            )
+        cls.now = now
+
+    def setUp(self):
+        self.client = APIClient()
+
+
+class LikeFixtureMixin:
+    """
+    An owner and fans who like videos, with outbox delivery on demand.
+    """
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner = accounts_models.User.objects.create(username="owner")
+        cls.fans = accounts_models.User.objects.bulk_create(
+            accounts_models.User(username=f"fan{i}") for i in range(4)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def like(self, user, video) -> bool:
+        return videos_services.VideoLikeManager(user, video).like()["created"]
+
+    def unlike(self, user, video) -> bool:
+        return bool(
+            videos_services.VideoLikeManager(user, video).unlike()["deleted"]
+        )
+
+    def consume(self):
+        for consumer in videos_events.Consumer.configured():
+            while consumer.process_batch():
+                pass
+
+
+class VideoListFilterTests(VideoListTestCase):
+    """
+    Filters and orderings of the video list.
+    """
+
+    def get_ids(self, query: str) -> list[int]:
+        response = self.client.get(f"/v1/videos/?per_page=100&{query}")
+        self.assertEqual(response.status_code, 200)
+        return [video["id"] for video in response.json()["data"]]
+
+    def test_ordering(self):
+        videos = videos_models.Video.objects.all()
+        self.assertEqual(
+            self.get_ids("ordering=-total_likes"),
+            list(videos.order_by("-total_likes", "-id")
+                 .values_list("id", flat=True)),
+        )
+        self.assertEqual(
+            self.get_ids(""),
+            list(videos.order_by("-created_at", "-id")
+                 .values_list("id", flat=True)),
+        )
+
+    def test_filters(self):
+        owner = self.owners[1]
+        cutoff = self.now - timedelta(hours=30)
+        ids = self.get_ids(
+            f"owner={owner.id}&min_likes=3"
+            f"&created_after={cutoff.isoformat().replace('+00:00', 'Z')}"
+        )
+        expected = videos_models.Video.objects.filter(
+            owner=owner, total_likes__gte=3, created_at__gte=cutoff
+        ).order_by("-created_at", "-id").values_list("id", flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_unknown_ordering_falls_back_to_default(self):
+        self.assertEqual(self.get_ids("ordering=name"), self.get_ids(""))
+
+
+@override_settings(LIKE_COUNTS_CACHE_SECONDS=0)
+class VideoMultiGetTests(VideoListTestCase):
+    """
+    Multi-get and like-count polling respect video visibility.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.hidden = videos_models.Video.objects.create(
+            owner=self.owners[0], name="hidden", total_likes=5
+        )
+        self.published = list(
+            videos_models.Video.objects.filter(is_published=True)
+            .order_by("id").values_list("id", "total_likes")[:3]
+        )
+
+    def test_multi_get(self):
+        ids = [video_id for video_id, _ in self.published] + [self.hidden.id]
+        query = ",".join(map(str, ids))
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/v1/videos/?ids={query}")
+        self.assertEqual(
+            sorted(video["id"] for video in response.json()), ids[:3]
+        )
+
+        self.client.force_authenticate(self.owners[0])
+        response = self.client.get(f"/v1/videos/?ids={query}")
+        self.assertEqual(sorted(video["id"] for video in response.json()), ids)
+
+    def test_like_counts(self):
+        ids = [video_id for video_id, _ in self.published] + [self.hidden.id]
+        query = ",".join(map(str, ids + [0]))
+        response = self.client.get(f"/v1/videos/like-counts/?ids={query}")
+        self.assertEqual(
+            response.json(),
+            {str(video_id): likes for video_id, likes in self.published},
+        )
+
+        self.client.force_authenticate(self.owners[0])
+        response = self.client.get(f"/v1/videos/like-counts/?ids={query}")
+        self.assertEqual(response.json()[str(self.hidden.id)], 5)
+
+    def test_invalid_ids(self):
+        too_many = ",".join(map(str, range(1, 200)))
+        for query in ("ids=a", "ids=", f"ids={too_many}"):
+            with self.subTest(query=query):
+                response = self.client.get(f"/v1/videos/like-counts/?{query}")
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get("/v1/videos/?ids=a")
+        self.assertEqual(response.status_code, 400)
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "Query plans are checked on PostgreSQL"
+)
+class VideoListQueryPlanTests(VideoListTestCase):
+    """
+    Every filter and ordering of the video list is served by an index.
+
+    Sequential scans and sorts are disabled for the plans, so the planner
+    falls back to one only when no index can serve the query; small test
+    tables would otherwise make them the cheaper choice.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Со связью с владельцем планы на маленьких таблицах без статистики
+        # неустойчивы: таблицы побольше и ANALYZE
+        cls.owners = accounts_models.User.objects.bulk_create(
+            accounts_models.User(username=f"owner{i}") for i in range(20)
+        )
+        now = timezone.now()
+        videos = videos_models.Video.objects.bulk_create(
+            videos_models.Video(
+                owner=cls.owners[i % 20],
+                name=f"video{i}",
+                is_published=True,
+                total_likes=i % 7,
+            )
+            for i in range(400)
+        )
+        for i, video in enumerate(videos):
+            video.created_at = now - timedelta(hours=i)
+        videos_models.Video.objects.bulk_update(videos, ["created_at"])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE accounts_user")
+            cursor.execute("ANALYZE videos_video")
+
+    # Запрос списка и индекс, который должен его обслуживать
+    QUERIES = [
+        ("", "video_created_idx"),
+        ("ordering=-total_likes", "video_likes_idx"),
+        ("ordering=created_at", "video_created_idx"),
+        ("min_likes=3&ordering=-total_likes", "video_likes_idx"),
+        ("created_after=2020-01-01T00:00:00Z"
+         "&created_before=2100-01-01T00:00:00Z", "video_created_idx"),
+        ("owner={owner}", "video_owner_created_idx"),
+        ("owner={owner}&ordering=-total_likes", "video_owner_likes_idx"),
+        ("owner={owner}&min_likes=2&created_after=2020-01-01T00:00:00Z",
+         "video_owner_created_idx"),
+        ("ordering=-total_likes&page=2&per_page=10", "video_likes_idx"),
+    ]
+
+    def test_no_sequential_scans_or_sorts(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+
+        for query, index in self.QUERIES:
+            query = query.format(owner=self.owners[0].id)
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(f"/v1/videos/?{query}")
+            statements = [
+                item["sql"] for item in captured.captured_queries
+                if 'FROM "videos_video"' in item["sql"]
+            ]
+            self.assertTrue(statements, query)
+            for sql in statements:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"EXPLAIN {sql}")
+                    plan = "\n".join(row[0] for row in cursor.fetchall())
+                with self.subTest(query=query, sql=sql):
+                    self.assertNotIn("Seq Scan", plan)
+                    self.assertNotIn("Sort", plan)
+                    if "COUNT(*)" not in sql:
+                        self.assertIn(f"using {index} ", plan)
+
+
+@unittest.skipIf(videos_analytics.np is None, "NumPy is not installed")
+@override_settings(
+    OWNER_STATS_ENGINE=True,
+    OWNER_STATS_REFRESH_SECONDS=0,
+    OWNER_STATS_OVERLAP_SECONDS=0,
+)
+class OwnerStatsEngineTests(VideoListTestCase):
+    """
+    The NumPy snapshot agrees with SQL aggregation after incremental
+    refreshes.
+    """
+
+    def sql_stats(self) -> dict[str, int]:
+        videos = videos_models.Video.objects.published()
+        return {
+            row["username"]: row["likes_sum"]
+            for row in videos_services.StatisticsGroupBy(videos).get_stats()
+        }
+
+    def test_incremental_refresh_matches_sql(self):
+        engine = videos_analytics.OwnerStatsEngine()
+        stats = videos_analytics.EngineStatisticsGroupBy(engine)
+        self.assertEqual(
+            {row["username"]: row["likes_sum"] for row in stats.get_stats()},
+            self.sql_stats(),
+        )
+
+        videos = list(videos_models.Video.objects.order_by("id")[:3])
+        videos_services.VideoLikeManager(self.owners[1], videos[0]).like()
+        videos_services.CascadeDeletion.mark_videos(
+            videos_models.Video.objects.filter(id=videos[1].id)
+        )
+        videos[2].is_published = False
+        videos[2].save()
+        videos_models.Video.objects.create(
+            owner=self.owners[-1], name="new", is_published=True,
+            total_likes=1000,
+        )
+
+        rows = stats.get_stats()
+        self.assertEqual(
+            {row["username"]: row["likes_sum"] for row in rows},
+            self.sql_stats(),
+        )
+        self.assertEqual(rows[0]["username"], self.owners[-1].username)
+        self.assertLess(engine.refresh_now(), 10)
+
+    def test_owner_statistics_view(self):
+        staff = accounts_models.User.objects.create(
+            username="staff", is_staff=True
+        )
+        self.client.force_authenticate(staff)
+        response = self.client.get(
+            "/v1/videos/statistics-owners/?top=2&percentiles=0,100&bins=4"
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        sums = sorted(self.sql_stats().values())
+        self.assertEqual(data["owners"], len(self.owners))
+        self.assertEqual(
+            [row["likes_sum"] for row in data["top"]], sums[::-1][:2]
+        )
+        self.assertEqual(data["top"][0]["percentile_rank"], 100.0)
+        self.assertEqual(
+            data["percentiles"], {"0.0": sums[0], "100.0": sums[-1]}
+        )
+        self.assertEqual(
+            sum(data["histogram"]["counts"]), len(self.owners)
+        )
+
+        response = self.client.get("/v1/videos/statistics-owners/?bins=0")
+        self.assertEqual(response.status_code, 400)
+        with override_settings(OWNER_STATS_ENGINE=False):
+            response = self.client.get("/v1/videos/statistics-owners/")
+        self.assertEqual(response.status_code, 404)
+
+
+class PublishedBitmapTests(VideoListTestCase):
+    """
+    The published bitmap rejects unpublished ids without queries and
+    follows publish changes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            PUBLISHED_BITMAP_PATH=os.path.join(directory.name, "bitmap")
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.hidden = videos_models.Video.objects.create(
+            owner=self.owners[0], name="hidden"
+        )
+        self.published = videos_models.Video.objects.filter(
+            is_published=True
+        ).first()
+
+    def test_requests_never_rebuild(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(videos_bitmap.is_published(self.hidden.id))
+
+        call_command("build_published_bitmap", stdout=io.StringIO())
+        with override_settings(PUBLISHED_BITMAP_REBUILD_SECONDS=0):
+            with self.assertNumQueries(0):
+                self.assertIs(
+                    videos_bitmap.is_published(self.hidden.id), False
+                )
+
+    def test_unpublished_ids_are_rejected_without_queries(self):
+        videos_bitmap.get_bitmap().rebuild()
+        self.assertTrue(videos_bitmap.is_published(self.published.id))
+        self.client.force_authenticate(self.owners[1])
+        with self.assertNumQueries(0):
+            response = self.client.post(f"/v1/videos/{self.hidden.id}/likes/")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(f"/v1/videos/{self.published.id}/likes/")
+        self.assertEqual(response.status_code, 201)
+
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/v1/videos/{self.hidden.id}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_publish_changes(self):
+        bitmap = videos_bitmap.get_bitmap()
+        bitmap.rebuild()
+        self.assertIs(bitmap.get(self.hidden.id), False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hidden.is_published = True
+            self.hidden.save()
+        self.assertIs(bitmap.get(self.hidden.id), True)
+
+        # Обновление queryset без сигналов подхватывает синхронизация
+        videos_services.CascadeDeletion.mark_videos(
+            videos_models.Video.objects.filter(id=self.hidden.id)
+        )
+        self.assertIs(bitmap.get(self.hidden.id), True)
+        with override_settings(PUBLISHED_BITMAP_SYNC_SECONDS=0):
+            bitmap.refresh()
+        self.assertIs(bitmap.get(self.hidden.id), False)
+
+        created = videos_models.Video.objects.create(
+            owner=self.owners[0], name="new", is_published=True
+        )
+        self.assertIsNone(bitmap.get(created.id))
+
+    def test_threads_of_one_process_exclude_each_other(self):
+        bitmap = videos_bitmap.get_bitmap()
+        results = []
+
+        def try_lock():
+            with bitmap._locked(blocking=False) as locked:
+                results.append(locked)
+
+        with bitmap._locked():
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+        try_lock()
+        self.assertEqual(results, [False, True])
+
+
+class VideoPublicationTests(VideoListTestCase):
+    """
+    Bulk publish changes videos in batches and keeps the bitmap, cached
+    like counts and outbox in step.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            PUBLISHED_BITMAP_PATH=os.path.join(directory.name, "bitmap")
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        videos_bitmap.get_bitmap().rebuild()
+        self.catalogue = list(
+            videos_models.Video.objects.filter(owner=self.owners[0])
+            .order_by("id").values_list("id", flat=True)
+        )
+        self.client.force_authenticate(
+            accounts_models.User.objects.create(
+                username="staff", is_staff=True
+            )
+        )
+
+    def test_owner_catalogue_is_unpublished_and_published(self):
+        videos_services.CascadeDeletion.mark_videos(
+            videos_models.Video.objects.filter(id=self.catalogue[0])
+        )
+        anonymous = AnonymousUser()
+        self.assertEqual(
+            len(
+                videos_services.LikeCounts.for_user(self.catalogue, anonymous)
+            ),
+            19,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # Выборка id и по пять запросов на каждую из четырёх пачек
+            with self.assertNumQueries(21):
+                updated = videos_services.VideoPublication(
+                    batch_size=5
+                ).set_published(
+                    videos_models.Video.objects.filter(owner=self.owners[0]),
+                    False,
+                )
+        self.assertEqual(updated, 19)
+        self.assertFalse(
+            videos_models.Video.objects.published()
+            .filter(owner=self.owners[0]).exists()
+        )
+        self.assertIs(videos_bitmap.is_published(self.catalogue[1]), False)
+        self.assertEqual(
+            videos_services.LikeCounts.for_user(self.catalogue, anonymous), {}
+        )
+        events = list(videos_models.OutboxEvent.objects.order_by("id"))
+        self.assertEqual(
+            [(event.kind, event.video_id) for event in events],
+            [
+                (videos_models.OutboxEvent.VIDEO_UNPUBLISHED, video_id)
+                for video_id in self.catalogue[1:]
+            ],
+        )
+        videos_recommendations.queue_refresh(events)
+        self.assertEqual(
+            videos_models.RelatedVideoRefresh.objects.count(), 19
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/v1/videos/publish/",
+                {"owner": self.owners[0].id, "is_published": True},
+                format="json",
+            )
+        self.assertEqual(response.json(), {"updated": 19})
+        self.assertIs(videos_bitmap.is_published(self.catalogue[1]), True)
+        response = self.client.post(
+            "/v1/videos/publish/",
+            {"ids": self.catalogue[:3], "is_published": True},
+            format="json",
+        )
+        self.assertEqual(response.json(), {"updated": 0})
+
+    @unittest.skipIf(videos_analytics.np is None, "NumPy is not installed")
+    @override_settings(
+        OWNER_STATS_ENGINE=True, OWNER_STATS_REFRESH_SECONDS=3600
+    )
+    def test_owner_stats_engine_is_refreshed(self):
+        self.enterContext(mock.patch.object(videos_analytics, "_engine", None))
+        stats = videos_analytics.EngineStatisticsGroupBy(
+            videos_analytics.get_engine()
+        )
+        usernames = {row["username"] for row in stats.get_stats()}
+        self.assertIn(self.owners[0].username, usernames)
+
+        videos_services.VideoPublication().set_published(
+            videos_models.Video.objects.filter(owner=self.owners[0]), False
+        )
+        usernames = {row["username"] for row in stats.get_stats()}
+        self.assertNotIn(self.owners[0].username, usernames)
+
+    def test_invalid_requests(self):
+        for data in (
+            {"is_published": True},
+            {"ids": [1], "owner": 1, "is_published": True},
+            {"ids": [], "is_published": False},
+        ):
+            response = self.client.post(
+                "/v1/videos/publish/", data, format="json"
+            )
+            self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(self.owners[0])
+        response = self.client.post(
+            "/v1/videos/publish/",
+            {"owner": self.owners[0].id, "is_published": False},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+# Запасные шарды лайков из video_project.test_settings
+TEST_LIKE_SHARDS = getattr(settings, "TEST_LIKE_SHARDS", [])
+
+
+@unittest.skipUnless(
+    len(settings.LIKE_SHARDS) >= 2 or TEST_LIKE_SHARDS,
+    "Set LIKE_SHARDS or run with video_project.test_settings",
+)
+@override_settings(
+    LIKE_SHARDS=(
+        settings.LIKE_SHARDS if len(settings.LIKE_SHARDS) >= 2
+        else [videos_sharding.DEFAULT, *TEST_LIKE_SHARDS[:1]]
+    ),
+    LIKE_SHARD_MAP_SECONDS=0,
+    OUTBOX_SETTLE_SECONDS=0,
+)
+class LikeShardingTests(LikeFixtureMixin, TestCase):
+    """
+    Likes follow their bucket to a shard and back, and the main database
+    catches up through the outbox.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.shard = next(
+            alias for alias in settings.LIKE_SHARDS
+            if alias != videos_sharding.DEFAULT
+        )
+        self.video = videos_models.Video.objects.create(
+            owner=self.owner, name="sharded", is_published=True
+        )
+        self.bucket = videos_sharding.bucket_of(self.video.id)
+        self.rebalancer = videos_sharding.LikeShardRebalancer()
+        # Карта из откаченной транзакции не должна пережить тест
+        self.addCleanup(videos_sharding.invalidate_map)
+
+    def rollup_likes(self) -> int:
+        return sum(
+            videos_models.VideoLikeRollup.objects.filter(
+                video=self.video,
+                granularity=videos_models.LikeRollup.DAY,
+            ).values_list("likes", flat=True)
+        )
+
+    def test_likes_move_between_shards(self):
+        self.rebalancer.move([(self.bucket, self.shard)])
+        for user in self.fans[:3]:
+            self.like(user, self.video)
+        self.unlike(self.fans[0], self.video)
+
+        shard_likes = videos_models.Like.objects.using(self.shard)
+        self.assertEqual(shard_likes.filter(video=self.video).count(), 2)
+        self.assertFalse(
+            videos_models.Like.objects.filter(video=self.video).exists()
+        )
+        self.assertEqual(
+            videos_sharding.LikeCounters.get([self.video.id]),
+            {self.video.id: 2},
+        )
+        self.assertEqual(
+            videos_sharding.user_liked(self.fans[1].id, [self.video.id]),
+            {self.video.id},
+        )
+
+        self.consume()
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.total_likes, 2)
+        self.assertEqual(self.rollup_likes(), 2)
+
+        self.rebalancer.move([(self.bucket, videos_sharding.DEFAULT)])
+        self.assertFalse(shard_likes.filter(video=self.video).exists())
+        self.like(self.fans[3], self.video)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.total_likes, 3)
+        self.assertEqual(
+            videos_sharding.count_likes([self.video.id]), {self.video.id: 3}
+        )
+
+    def test_backfill_counts_shard_likes_once(self):
+        self.rebalancer.move([(self.bucket, self.shard)])
+        for user in self.fans[:2]:
+            self.like(user, self.video)
+        self.consume()
+        self.like(self.fans[2], self.video)
+
+        videos_services.LikeRollups.backfill()
+        self.consume()
+        self.assertEqual(self.rollup_likes(), 3)
+
+    @unittest.skipUnless(
+        len(TEST_LIKE_SHARDS) >= 2, "Two spare like shards are needed"
+    )
+    def test_purge_empties_every_shard_before_the_video(self):
+        first, second = TEST_LIKE_SHARDS[:2]
+        self.enterContext(override_settings(
+            LIKE_SHARDS=[videos_sharding.DEFAULT, first, second]
+        ))
+        self.rebalancer.move([(self.bucket, first)])
+        for user in self.fans[:3]:
+            self.like(user, self.video)
+        videos_services.CascadeDeletion.mark_videos(
+            videos_models.Video.objects.filter(id=self.video.id)
+        )
+
+        # Второй шард пуст, но лайки первого ещё не удалены
+        deletion = videos_services.CascadeDeletion(batch_size=2)
+        self.assertEqual(deletion.purge_batch(), 2)
+        self.assertTrue(
+            videos_models.Video.objects.filter(id=self.video.id).exists()
+        )
+        while deletion.purge_batch():
+            pass
+        self.assertFalse(
+            videos_models.Like.objects.using(first)
+            .filter(video_id=self.video.id).exists()
+        )
+        self.assertFalse(
+            videos_models.Video.objects.filter(id=self.video.id).exists()
+        )
+
+    def test_moving_bucket_refuses_likes(self):
+        videos_sharding.ShardMap.read()
+        videos_sharding.ShardMap.update(
+            self.bucket, moving_from=videos_sharding.DEFAULT
+        )
+        self.client.force_authenticate(self.fans[0])
+        response = self.client.post(f"/v1/videos/{self.video.id}/likes/")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+
+@unittest.skipIf(
+    videos_recommendations.np is None, "NumPy is not installed"
+)
+@override_settings(OUTBOX_SETTLE_SECONDS=0)
+class RelatedVideosTests(LikeFixtureMixin, TestCase):
+    """
+    Related videos are ranked by co-likes, served with one query and
+    refreshed for videos whose likes changed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.videos = [
+            videos_models.Video.objects.create(
+                owner=self.owner, name=f"related{i}", is_published=True
+            )
+            for i in range(4)
+        ]
+        likes = {0: [0, 1, 2, 3], 1: [0, 1, 2], 2: [2, 3], 3: [0]}
+        for video, users in likes.items():
+            for user in users:
+                self.like(self.fans[user], self.videos[video])
+        self.consume()
+        self.builder = videos_recommendations.RelatedVideoBuilder(
+            min_co_likes=2
+        )
+
+    def related(self, video: int) -> list[tuple[int, int]]:
+        response = self.client.get(
+            f"/v1/videos/{self.videos[video].id}/related/"
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(row["id"], row["co_likes"]) for row in response.json()]
+
+    def test_full_and_incremental_refresh(self):
+        self.builder.compute_all()
+        ids = [video.id for video in self.videos]
+        with self.assertNumQueries(1):
+            self.assertEqual(self.related(0), [(ids[1], 3), (ids[2], 2)])
+        self.assertEqual(self.related(1), [(ids[0], 3)])
+        self.assertEqual(self.related(3), [])
+        self.assertFalse(videos_models.RelatedVideoRefresh.objects.exists())
+
+        self.like(self.fans[3], self.videos[1])
+        self.consume()
+        self.assertEqual(self.builder.compute_queued(), 2)
+        self.assertEqual(self.related(1), [(ids[0], 4), (ids[2], 2)])
+        self.assertFalse(videos_models.RelatedVideoRefresh.objects.exists())
+
+        self.videos[2].refresh_from_db()
+        self.videos[2].is_published = False
+        self.videos[2].save()
+        self.assertEqual(self.related(1), [(ids[0], 4)])
+        response = self.client.get(f"/v1/videos/{ids[2]}/related/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_blocks_do_not_change_results(self):
+        rows = videos_models.RelatedVideo.objects.order_by(
+            "video_id", "rank"
+        ).values_list("video_id", "related_id", "co_likes", "score")
+        self.builder.compute_all()
+        expected = list(rows)
+        self.builder.chunk_pairs = 1
+        self.builder.compute_all()
+        self.assertEqual(list(rows), expected)
+        self.assertTrue(expected)
+
+
+class PayloadCacheTests(VideoListTestCase):
+    """
+    Large staff responses are rendered once and served precompressed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_authenticate(
+            accounts_models.User.objects.create(
+                username="staff", is_staff=True
+            )
+        )
+
+    def test_repeated_requests_skip_queries_and_encoding(self):
+        response = self.client.get(
+            "/v1/videos/ids/", HTTP_ACCEPT_ENCODING="br;q=0, gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        ids = json.loads(gzip.decompress(response.content))
+        self.assertEqual(
+            len(ids), videos_models.Video.objects.published().count()
+        )
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/v1/videos/ids/")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.json(), ids)
+
+    def test_ordering_is_applied(self):
+        response = self.client.get("/v1/videos/ids/?ordering=-id")
+        self.assertEqual(
+            [video["id"] for video in response.json()],
+            list(
+                videos_models.Video.objects.published()
+                .order_by("-id").values_list("id", flat=True)
+            ),
+        )
+
+    @unittest.skipIf(project_renderers.orjson is None, "orjson is missing")
+    def test_fast_json_matches_standard_renderer(self):
+        data = {
+            "count": 3,
+            7: [1.5, None, True],
+            "name": "видео\u2028",
+            "created_at": timezone.now(),
+            "price": Decimal("2.50"),
+        }
+        self.assertEqual(
+            project_renderers.FastJSONRenderer().render(data),
+            JSONRenderer().render(data),
+        )
+
+
+class ProfilingTests(VideoListTestCase):
+    """
+    Requests carrying a staff token are profiled and their profiles are
+    downloadable by staff.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILING_DIR=directory.name))
+        self.staff = accounts_models.User.objects.create(
+            username="staff", is_staff=True
+        )
+        self.client.force_authenticate(self.staff)
+
+    def test_token_profiles_request(self):
+        response = self.client.post(
+            "/profiles/", {"mode": "cprofile"}, format="json"
+        )
+        token = response.json()["token"]
+
+        response = APIClient().get(
+            "/v1/videos/?ordering=-total_likes", HTTP_X_PROFILE=token
+        )
+        self.assertEqual(response.status_code, 200)
+        profile_id = response["X-Profile-Id"]
+
+        profile = self.client.get(f"/profiles/{profile_id}/").json()
+        self.assertEqual(profile["path"], "/v1/videos/?ordering=-total_likes")
+        self.assertEqual(profile["user"], self.staff.id)
+        self.assertGreater(profile["query_count"], 0)
+        self.assertEqual(len(profile["queries"]), profile["query_count"])
+        self.assertEqual(
+            [item["id"] for item in self.client.get("/profiles/").json()],
+            [profile_id],
+        )
+
+        response = self.client.get(f"/profiles/{profile_id}/download/")
+        stats = marshal.loads(b"".join(response.streaming_content))
+        self.assertTrue(any(
+            path.endswith(os.path.join("videos", "views.py"))
+            for path, _, _ in stats
+        ))
+
+    def test_busy_cprofile_falls_back_to_sampling(self):
+        token = project_profiling.make_token(self.staff.id, "cprofile")
+        with project_profiling._cprofile_lock:
+            response = APIClient().get("/v1/videos/", HTTP_X_PROFILE=token)
+        profile_id = response["X-Profile-Id"]
+        self.assertEqual(
+            self.client.get(f"/profiles/{profile_id}/").json()["mode"],
+            "sample",
+        )
+        response = self.client.get(f"/profiles/{profile_id}/download/")
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+
+    def test_query_token_is_not_stored(self):
+        token = project_profiling.make_token(self.staff.id)
+        response = APIClient().get(f"/v1/videos/?profile={token}&page=2")
+        profile = self.client.get(
+            f"/profiles/{response['X-Profile-Id']}/"
+        ).json()
+        self.assertEqual(profile["mode"], "sample")
+        self.assertEqual(profile["path"], "/v1/videos/?page=2")
+        response = self.client.get(
+            f"/profiles/{profile['id']}/download/"
+        )
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+
+    def test_invalid_tokens_are_ignored(self):
+        token = project_profiling.make_token(self.staff.id)
+        self.staff.is_staff = False
+        self.staff.save()
+        for value in (token, token[:-1], "1"):
+            response = APIClient().get(
+                "/v1/videos/", HTTP_X_PROFILE=value
+            )
+            self.assertFalse(response.has_header("X-Profile-Id"))
+        self.assertEqual(self.client.get("/profiles/").status_code, 403)
+
+
+class MyLikesTests(VideoListTestCase):
+    """
+    Liked videos are listed newest first in keyset pages that skip videos
+    unpublished since.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.owners[1]
+        videos = list(videos_models.Video.objects.order_by("id")[:30])
+        for i, video in enumerate(videos):
+            videos_services.VideoLikeManager(self.user, video).like()
+            # Два лайка с одним временем упорядочиваются по id видео
+            videos_models.Like.objects.using(
+                videos_sharding.shard_for(video.id)
+            ).filter(video=video).update(
+                created_at=self.now - timedelta(minutes=i // 2 * 2)
+            )
+        for video in videos[3:6]:
+            video.is_published = False
+            video.save()
+        pairs = [(i // 2, -video.id) for i, video in enumerate(videos)]
+        self.expected = [
+            video.id for _, video in sorted(zip(pairs, videos))
+            if video.is_published
+        ]
+        self.client.force_authenticate(self.user)
+
+    def test_pages_follow_like_order(self):
+        seen = []
+        url = "/v1/accounts/me/likes/?per_page=10"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            seen.extend(video["id"] for video in data["data"])
+            url = data["next"]
+        self.assertEqual(seen, self.expected)
+
+        with self.assertNumQueries(3):
+            response = self.client.get("/v1/accounts/me/likes/?per_page=2")
+        self.assertEqual(
+            [video["id"] for video in response.json()["data"]],
+            self.expected[:2],
+        )
+        response = self.client.get("/v1/accounts/me/likes/?cursor=bad")
+        self.assertEqual(response.status_code, 404)
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "Storms run on PostgreSQL"
+)
+@override_settings(LIKE_SHARD_MAP_SECONDS=0, OUTBOX_SETTLE_SECONDS=0)
+class LikeStressTests(TransactionTestCase):
+    """
+    Like/unlike storms from concurrent threads and processes keep counters
+    equal to the likes and pairs unique.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        owner = accounts_models.User.objects.create(username="stress")
+        videos = [
+            videos_models.Video.objects.create(
+                owner=owner, name=f"stress{i}", is_published=True
+            )
+            for i in range(12)
+        ]
+        users = accounts_models.User.objects.bulk_create(
+            accounts_models.User(username=f"stress{i}") for i in range(30)
+        )
+        self.storm = videos_stress.LikeStorm(
+            [video.id for video in videos], [user.id for user in users],
+            hot=2, ops=100, threads=6,
+        )
+        self.addCleanup(videos_sharding.invalidate_map)
+        shards = [
+            alias for alias in settings.LIKE_SHARDS
+            if alias != videos_sharding.DEFAULT
+        ]
+        if shards:
+            # Один горячий видеоролик живёт на шарде
+            videos_sharding.LikeShardRebalancer().move(
+                [(videos_sharding.bucket_of(videos[0].id), shards[0])]
+            )
+
+    def assert_storm_keeps_invariants(self):
+        report = self.storm.run()
+        self.assertEqual(report["errors"], {})
+        self.assertEqual(
+            sum(report["outcomes"].values()),
+            self.storm.ops * self.storm.threads * self.storm.processes,
+        )
+        self.assertGreater(report["outcomes"].get("liked", 0), 0)
+        self.assertGreater(report["locks"]["samples"], 0)
+        self.assertEqual(
+            videos_stress.check_invariants(self.storm.video_ids), []
+        )
+
+    def test_threads(self):
+        self.assert_storm_keeps_invariants()
+
+    def test_processes(self):
+        self.storm.processes = 2
+        self.storm.threads = 3
+        self.assert_storm_keeps_invariants()
+
+        liked = self.storm.liked_pairs()
+        self.assertTrue(liked)
+        self.assertEqual(self.storm.restore(set()), len(liked))
+        self.assertEqual(self.storm.liked_pairs(), set())
+
+
+class LikeCountHubTests(SimpleTestCase):
+    """
+    Fan-out of like-count changes through the in-memory broker.
+    """
+
+    async def test_changes_are_coalesced_per_window(self):
+        broker = videos_live.InMemoryBroker()
+        hub = videos_live.LikeCountHub(broker, window=0.05)
+        first = hub.subscribe([1, 2])
+        second = hub.subscribe([2, 3])
+        await asyncio.sleep(0)
+
+        broker.publish({1: 10, 2: 20})
+        broker.publish({2: 21, 4: 40})
+        self.assertEqual(await first.get(timeout=1), {1: 10, 2: 21})
+        self.assertEqual(await second.get(timeout=1), {2: 21})
+
+        hub.unsubscribe(first, [2])
+        broker.publish({1: 11, 2: 22})
+        self.assertEqual(await first.get(timeout=1), {1: 11})
+        self.assertEqual(await second.get(timeout=1), {2: 22})
+        self.assertIsNone(await second.get(timeout=0.1))
+
+        hub.unsubscribe(first)
+        hub.unsubscribe(second)
+        self.assertEqual(dict(hub.subscriptions), {})
+        for task in hub._tasks:
+            task.cancel()
+
+
+@override_settings(
+    LIVE_LIKES_BROKER="videos.live.InMemoryBroker",
+    LIVE_LIKES_WINDOW_SECONDS=0.05,
+)
+class LikeCountStreamAppTests(TransactionTestCase):
+    """
+    The like-count stream sends the visible counts, then coalesced changes
+    until the subscriber disconnects, and rejects invalid tokens like the
+    API does.
+    """
+
+    def setUp(self):
+        owner = accounts_models.User.objects.create(username="owner")
+        self.video = videos_models.Video.objects.create(
+            owner=owner, name="live", is_published=True, total_likes=3
+        )
+        self.hidden = videos_models.Video.objects.create(
+            owner=owner, name="hidden", total_likes=5
+        )
+        self.app = videos_live.LikeCountStreamApp(None)
+        self.disconnected = asyncio.Event()
+        self.messages = asyncio.Queue()
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        await self.messages.put(message)
+
+    def stream(self, ids: list[int], headers=()):
+        return self.app({
+            "type": "http",
+            "path": videos_live.LikeCountStreamApp.STREAM_PATH,
+            "method": "GET",
+            "query_string": f"ids={','.join(map(str, ids))}".encode(),
+            "headers": list(headers),
+        }, self.receive, self.send)
+
+    async def next_message(self) -> dict:
+        return await asyncio.wait_for(self.messages.get(), 5)
+
+    def stop_hub(self):
+        for task in videos_live.get_hub()._tasks:
+            task.cancel()
+
+    async def test_counts_then_coalesced_changes(self):
+        stream = asyncio.create_task(
+            self.stream([self.video.id, self.hidden.id])
+        )
+        start = await self.next_message()
+        self.assertEqual(start["status"], 200)
+        self.assertIn(
+            (b"content-type", b"text/event-stream"), start["headers"]
+        )
+        self.assertEqual(
+            (await self.next_message())["body"],
+            f'event: counts\ndata: {{"{self.video.id}": 3}}\n\n'.encode(),
+        )
+
+        # Два изменения за одно окно приходят одним событием
+        broker = videos_live.get_broker()
+        broker.publish({self.video.id: 4})
+        broker.publish({self.video.id: 5, self.hidden.id: 6})
+        self.assertEqual(
+            (await self.next_message())["body"],
+            f'event: likes\ndata: {{"{self.video.id}": 5}}\n\n'.encode(),
+        )
+
+        self.disconnected.set()
+        await asyncio.wait_for(stream, 5)
+        self.assertEqual((await self.next_message())["body"], b"")
+        self.assertEqual(dict(videos_live.get_hub().subscriptions), {})
+        self.stop_hub()
+
+    async def test_invalid_token_is_rejected(self):
+        await self.stream(
+            [self.video.id], [(b"authorization", b"Bearer invalid")]
+        )
+
+        start = await self.next_message()
+        self.assertEqual(start["status"], 401)
+        self.assertIn(
+            (b"www-authenticate", b'Bearer realm="api"'), start["headers"]
+        )
+        self.assertEqual(
+            json.loads((await self.next_message())["body"])["code"],
+            "token_not_valid",
+        )
+        self.assertEqual(dict(videos_live.get_hub().subscriptions), {})
+        self.stop_hub()
+
+    def test_like_events_are_published_as_totals(self):
+        fans = accounts_models.User.objects.bulk_create(
+            accounts_models.User(username=f"fan{i}") for i in range(2)
+        )
+        for fan in fans:
+            videos_services.VideoLikeManager(fan, self.video).like()
+        videos_services.VideoLikeManager(fans[0], self.video).unlike()
+        broker = mock.Mock()
+        with mock.patch.object(videos_live, "get_broker", return_value=broker):
+            videos_live.publish_like_events(
+                list(videos_models.OutboxEvent.objects.order_by("id"))
+            )
+        broker.publish.assert_called_once_with({self.video.id: 4})
+
+
+class ServerWarmUpTests(TransactionTestCase):
+    """
+    The gunicorn warm-up never queries the database, and the config
+    rejects unknown worker classes.
+    """
+
+    def test_warm_up_runs_no_queries(self):
+        with self.assertNumQueries(0):
+            project_warmup.warm_up()
+
+    def test_unknown_worker_class(self):
+        gunicorn_conf = importlib.import_module("video_project.gunicorn_conf")
+        # Конфиг проверяет окружение при импорте, вернём его исходным
+        self.addCleanup(importlib.reload, gunicorn_conf)
+        with mock.patch.dict(
+            os.environ,
+            {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": "8"},
+        ):
+            importlib.reload(gunicorn_conf)
+        self.assertEqual(gunicorn_conf.worker_class, "gthread")
+        self.assertEqual(gunicorn_conf.threads, 8)
+
+        with mock.patch.dict(os.environ, {"GUNICORN_WORKER_CLASS": "gevent"}):
+            with self.assertRaisesMessage(
+                RuntimeError, "GUNICORN_WORKER_CLASS must be one of"
+            ):
+                importlib.reload(gunicorn_conf)
+
+
+class CascadeDeletionTests(TestCase):
+    """
+    Deleted users and videos disappear at once and are purged in
+    dependency order, keeping like counters of live videos correct.
+    """
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.fan, cls.other = (
+            accounts_models.User.objects.bulk_create(
+                accounts_models.User(username=name)
+                for name in ("owner", "fan", "other")
+            )
+        )
+        cls.doomed = videos_models.Video.objects.create(
+            owner=cls.owner, name="doomed", is_published=True
+        )
+        cls.live = videos_models.Video.objects.create(
+            owner=cls.other, name="live", is_published=True
+        )
+        videos_models.VideoFile.objects.bulk_create([
+            videos_models.VideoFile(
+                video=cls.doomed, file="videos/doomed.mp4", quality="HD"
+            ),
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        for user, video in (
+            (self.fan, self.live),
+            (self.fan, self.doomed),
+            (self.other, self.doomed),
+        ):
+            videos_services.VideoLikeManager(user, video).like()
+
+    def test_marked_rows_are_hidden(self):
+        deletion = videos_services.CascadeDeletion()
+        owners = accounts_models.User.objects.filter(id=self.owner.id)
+        self.assertEqual(deletion.mark_users(owners), 1)
+        self.assertEqual(deletion.mark_users(owners), 0)
+
+        self.owner.refresh_from_db()
+        self.assertFalse(self.owner.is_active)
+        response = self.client.get("/v1/videos/?per_page=100")
+        self.assertEqual(
+            [video["id"] for video in response.json()["data"]],
+            [self.live.id],
+        )
+        response = self.client.get(f"/v1/videos/{self.doomed.id}/")
+        self.assertEqual(response.status_code, 404)
+
+        deletion.mark_videos(
+            videos_models.Video.objects.filter(id=self.live.id)
+        )
+        response = self.client.get("/v1/videos/?per_page=100")
+        self.assertEqual(response.json()["data"], [])
+
+    def test_purge_in_dependency_order(self):
+        deletion = videos_services.CascadeDeletion(batch_size=10)
+        deletion.mark_users(
+            accounts_models.User.objects.filter(id=self.fan.id)
+        )
+        deletion.mark_videos(
+            videos_models.Video.objects.filter(id=self.doomed.id)
+        )
+        likes = videos_models.Like.objects
+        stages = []
+        while removed := deletion.purge_batch():
+            stages.append((
+                removed,
+                likes.filter(video=self.live).exists(),
+                likes.filter(video=self.doomed).exists(),
+                videos_models.VideoFile.objects.exists(),
+                videos_models.Video.objects.filter(id=self.doomed.id)
+                .exists(),
+                accounts_models.User.objects.filter(id=self.fan.id)
+                .exists(),
+            ))
+
+        self.assertEqual(stages, [
+            (1, False, True, True, True, True),
+            (2, False, False, True, True, True),
+            (1, False, False, False, True, True),
+            (1, False, False, False, False, True),
+            (1, False, False, False, False, False),
+        ])
+        self.live.refresh_from_db()
+        self.assertEqual(self.live.total_likes, 0)
+        self.assertTrue(
+            accounts_models.User.objects.filter(id=self.owner.id).exists()
+        )
+
+
+@override_settings(OUTBOX_SETTLE_SECONDS=0, PAYLOAD_CACHE_SECONDS=0)
+class LikeRollupTests(TestCase):
+    """
+    Windowed statistics read whole days and ragged hours from rollups,
+    leave out hidden videos and survive a backfill.
+    """
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = accounts_models.User.objects.create(
+            username="staff", is_staff=True
+        )
+        cls.first, cls.second = accounts_models.User.objects.bulk_create(
+            accounts_models.User(username=name)
+            for name in ("first", "second")
+        )
+        cls.published, cls.hidden, cls.other = (
+            videos_models.Video.objects.bulk_create([
+                videos_models.Video(
+                    owner=cls.first, name="published", is_published=True
+                ),
+                videos_models.Video(owner=cls.first, name="hidden"),
+                videos_models.Video(
+                    owner=cls.second, name="other", is_published=True
+                ),
+            ])
+        )
+        cls.start = datetime(2025, 9, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def record(self, video, *hours):
+        videos_services.LikeRollups.record(
+            (video.id, video.owner_id, self.start + timedelta(hours=hour), 1)
+            for hour in hours
+        )
+
+    def statistics(self, view: str, query: str) -> dict[str, int]:
+        response = self.client.get(f"/v1/videos/statistics-{view}/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return {
+            row["username"]: row["likes_sum"] for row in response.json()
+            if row["likes_sum"]
+        }
+
+    def test_window_combines_days_and_hours(self):
+        hours = [0, 5, 23, 24, 30, 47, 48, 49, 60, 71, 72, 90]
+        self.record(self.published, *hours)
+        rollups = videos_models.VideoLikeRollup.objects.filter(
+            video=self.published
+        )
+        windows = [
+            (None, None),
+            (0, None),
+            (None, 48),
+            (5, 49),
+            (24, 72),
+            (23.5, 60.25),
+            (30, 47),
+            (49, 49.5),
+        ]
+        for date_from, date_to in windows:
+            with self.subTest(date_from=date_from, date_to=date_to):
+                bounds = [
+                    None if hour is None
+                    else self.start + timedelta(hours=hour)
+                    for hour in (date_from, date_to)
+                ]
+                window = videos_services.LikeRollups.window(*bounds)
+                # Края окна округляются до целых часов: начало вниз,
+                # конец вверх
+                expected = sum(
+                    1 for hour in hours
+                    if (date_from is None or hour >= int(date_from))
+                    and (date_to is None or hour < date_to)
+                )
+                likes = rollups.filter(window).values_list("likes", flat=True)
+                self.assertEqual(sum(likes), expected)
+
+    def test_hidden_videos_are_left_out(self):
+        self.record(self.published, 1, 2, 30)
+        self.record(self.hidden, 3, 4)
+        self.record(self.other, 5)
+        query = "from=2025-09-01T00:00:00Z&to=2025-09-03T00:00:00Z"
+        for view in ("group-by", "subquery"):
+            with self.subTest(view=view):
+                self.assertEqual(
+                    self.statistics(view, query), {"first": 3, "second": 1}
+                )
+
+        deletion = videos_services.CascadeDeletion()
+        deletion.mark_videos(
+            videos_models.Video.objects.filter(id=self.published.id)
+        )
+        for view in ("group-by", "subquery"):
+            with self.subTest(view=view):
+                self.assertEqual(self.statistics(view, query), {"second": 1})
+
+        while deletion.purge_batch():
+            pass
+        owner_likes = videos_models.OwnerLikeRollup.objects.filter(
+            owner=self.first, granularity=videos_models.LikeRollup.DAY
+        ).values_list("likes", flat=True)
+        self.assertEqual(sum(owner_likes), 2)
+        self.assertEqual(self.statistics("group-by", query), {"second": 1})
+
+        self.hidden.is_published = True
+        self.hidden.save()
+        self.assertEqual(
+            self.statistics("group-by", query), {"first": 2, "second": 1}
+        )
+
+    def test_backfill_rebuilds_rollups(self):
+        fans = accounts_models.User.objects.bulk_create(
+            accounts_models.User(username=f"fan{i}") for i in range(4)
+        )
+        for fan in fans:
+            videos_services.VideoLikeManager(fan, self.published).like()
+        videos_services.VideoLikeManager(fans[0], self.other).like()
+        for consumer in videos_events.Consumer.configured():
+            consumer.process_batch()
+        videos_services.VideoLikeManager(fans[1], self.published).unlike()
+        videos_models.OwnerLikeRollup.objects.update(likes=100)
+
+        self.assertEqual(videos_services.LikeRollups.backfill(), 4)
+        for consumer in videos_events.Consumer.configured():
+            while consumer.process_batch():
+                pass
+        for granularity in videos_services.LikeRollups.GRANULARITIES:
+            with self.subTest(granularity=granularity):
+                owner_likes = (
+                    videos_models.OwnerLikeRollup.objects
+                    .filter(granularity=granularity)
+                    .values("owner__username")
+                    .annotate(likes_sum=Sum("likes"))
+                    .values_list("owner__username", "likes_sum")
+                )
+                self.assertEqual(
+                    dict(owner_likes), {"first": 3, "second": 1}
+                )
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "Partitioning needs PostgreSQL"
+)
+class LikePartitioningTests(LikeFixtureMixin, TestCase):
+    """
+    The Like table is converted to hash partitions online without losing
+    likes written meanwhile, and keeps one like per user and video.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.videos = videos_models.Video.objects.bulk_create(
+            videos_models.Video(
+                owner=cls.owner, name=f"video{i}", is_published=True
+            )
+            for i in range(3)
+        )
+
+    def test_online_conversion(self):
+        for video in self.videos:
+            self.like(self.fans[0], video)
+        partitioning = videos_partitioning.LikePartitioning(partitions=4)
+        partitioning.prepare()
+
+        # Записи между prepare и swap переносит триггер
+        self.like(self.fans[1], self.videos[0])
+        self.unlike(self.fans[0], self.videos[1])
+        list(partitioning.copy(batch_size=1))
+        self.like(self.fans[2], self.videos[2])
+        counts = partitioning.row_counts()
+        self.assertEqual(counts[partitioning.shadow], 4)
+        self.assertEqual(counts[partitioning.table], 4)
+
+        partitioning.swap()
+        self.assertTrue(partitioning.is_partitioned())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM pg_inherits "
+                "WHERE inhparent = to_regclass(%s)",
+                [partitioning.table],
+            )
+            self.assertEqual(cursor.fetchone()[0], 4)
+        self.assertEqual(
+            sorted(
+                videos_models.Like.objects.values_list("video_id", "user_id")
+            ),
+            sorted([
+                (self.videos[0].id, self.fans[0].id),
+                (self.videos[0].id, self.fans[1].id),
+                (self.videos[2].id, self.fans[0].id),
+                (self.videos[2].id, self.fans[2].id),
+            ]),
+        )
+
+        self.assertFalse(self.like(self.fans[1], self.videos[0]))
+        self.assertTrue(self.like(self.fans[3], self.videos[1]))
+        partitioning.drop_old()
+        self.assertEqual(
+            partitioning.row_counts(), {partitioning.table: 5}
+        )
+
+
+class PerformanceMetricsTests(TestCase):
+    """
+    Requests are counted per view, staff see their own timings, and
+    snapshots of exited workers are dropped.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = accounts_models.User.objects.create(
+            username="staff", is_staff=True
+        )
+        videos_models.Video.objects.create(
+            owner=cls.staff, name="video", is_published=True
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_server_timing_for_staff_only(self):
+        response = self.client.get("/v1/videos/")
+        self.assertNotIn("Server-Timing", response)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get("/v1/videos/")
+        timing = response["Server-Timing"]
+        for name in ("db", "serialize", "render", "total"):
+            self.assertIn(f"{name};dur=", timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* queries"')
+
+    def test_registry_renders_cumulative_histograms(self):
+        registry = project_metrics.Registry()
+        for queries in (1, 4, 600):
+            stats = project_metrics.RequestStats()
+            stats.queries = queries
+            registry.record("video-list", stats, 0.01)
+
+        text = registry.render()
+        self.assertIn(
+            'http_request_queries_bucket{view="video-list",le="1"} 1', text
+        )
+        self.assertIn(
+            'http_request_queries_bucket{view="video-list",le="5"} 2', text
+        )
+        self.assertIn(
+            'http_request_queries_bucket{view="video-list",le="+Inf"} 3',
+            text,
+        )
+        self.assertIn('http_request_queries_sum{view="video-list"} 605', text)
+        self.assertIn('http_request_queries_count{view="video-list"} 3', text)
+
+    def test_snapshots_of_exited_workers_are_dropped(self):
+        worker = project_metrics.Registry()
+        worker.record("video-list", project_metrics.RequestStats(), 0.01)
+        snapshot = worker.snapshot()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS_DIR=directory))
+
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        for pid in (os.getppid(), exited.pid):
+            with open(os.path.join(directory, f"{pid}.json"), "w") as file:
+                json.dump(snapshot, file)
+
+        histograms = project_metrics.Registry().collect_all()
+        self.assertEqual(histograms[("video-list", "queries")].count, 1)
+        self.assertEqual(
+            sorted(os.listdir(directory)), [f"{os.getppid()}.json"]
+        )
+
+        project_metrics.remove_snapshot(directory, os.getppid())
+        self.assertEqual(os.listdir(directory), [])
+
+
+class OpenAPISchemaTests(SimpleTestCase):
+    """
+    The schema file generated at deploy time documents the API and is
+    served instead of generating the schema per request.
+    """
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    def generate(self, *args) -> str:
+        path = os.path.join(self.directory, "schema", "openapi")
+        call_command(
+            "generate_openapi", "--output", path, *args, stdout=io.StringIO()
+        )
+        return path
+
+    def test_generated_schema(self):
+        path = self.generate()
+        with open(path, "rb") as schema_file:
+            content = schema_file.read()
+        schema = json.loads(content)
+        self.assertEqual(schema["info"]["title"], "Barter API")
+        self.assertIn("/v1/videos/", schema["paths"])
+        self.assertIn("/v1/videos/{video_id}/likes/", schema["paths"])
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["openapi"])
+
+        with override_settings(OPENAPI_SCHEMA_PATH=path):
+            response = self.client.get("/docs/openapi.json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(b"".join(response.streaming_content), content)
+
+    def test_yaml_format(self):
+        with open(self.generate("--format", "yaml")) as schema_file:
+            self.assertIn("title: Barter API", schema_file.read())
+
+        path = os.path.join(self.directory, "openapi.json")
+        with override_settings(OPENAPI_SCHEMA_PATH=path):
+            with self.assertRaises(CommandError):
+                call_command(
+                    "generate_openapi", "--format", "yaml",
+                    stdout=io.StringIO(),
+                )
+        self.assertFalse(os.path.exists(path))
+
+
+class VideoFileTestCase(TestCase):
+    """
+    A video whose files are stored in a temporary media root.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = accounts_models.User.objects.create(username="owner")
+        cls.video = videos_models.Video.objects.create(
+            owner=cls.owner, name="video"
+        )
+
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        self.storage = videos_storage.ContentAddressedStorage()
+
+    def upload(self, content: bytes, name: str = "clip.MP4"):
+        return videos_models.VideoFile.objects.create(
+            video=self.video, file=ContentFile(content, name=name),
+            quality="HD",
+        )
+
+    def stored_files(self) -> list[str]:
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media)
+            for root, _, names in os.walk(self.media) for name in names
+        )
+
+
+class ContentAddressedStorageTests(VideoFileTestCase):
+    """
+    Video files are stored under the SHA-256 of their content, once per
+    distinct content.
+    """
+
+    def test_identical_content_is_stored_once(self):
+        digest = hashlib.sha256(b"frames").hexdigest()
+        first = self.upload(b"frames")
+        second = self.upload(b"frames", name="copy.mp4")
+        other = self.upload(b"other frames")
+
+        name = f"videos/{digest[:2]}/{digest[2:4]}/{digest}"
+        self.assertEqual(first.file.name, name)
+        self.assertEqual(second.file.name, name)
+        self.assertEqual((first.sha256, first.size), (digest, 6))
+        self.assertNotEqual(other.file.name, name)
+        self.assertEqual(
+            self.stored_files(), sorted([name, other.file.name])
+        )
+        with open(os.path.join(self.media, name), "rb") as stored:
+            self.assertEqual(stored.read(), b"frames")
+
+    def test_identical_content_with_other_extension_is_stored_once(self):
+        mp4 = self.upload(b"frames", name="clip.mp4")
+        mov = self.upload(b"frames", name="clip.MOV")
+
+        self.assertEqual(mp4.file.name, mov.file.name)
+        self.assertEqual(self.stored_files(), [mp4.file.name])
+
+    def test_adopt_links_legacy_file(self):
+        legacy = os.path.join(self.media, "videos", "legacy.mp4")
+        os.makedirs(os.path.dirname(legacy))
+        with open(legacy, "wb") as legacy_file:
+            legacy_file.write(b"frames")
+        uploaded = self.upload(b"frames")
+
+        name, digest, size = self.storage.adopt("videos/legacy.mp4")
+        self.assertEqual(name, uploaded.file.name)
+        self.assertEqual((digest, size), (uploaded.sha256, 6))
+        self.assertTrue(os.path.exists(legacy))
+        self.assertEqual(self.storage.adopt(name), (name, digest, size))
+        self.assertIsNone(self.storage.digest("videos/legacy.mp4"))
+
+    def test_adopt_drops_extension_of_content_name(self):
+        uploaded = self.upload(b"frames")
+        old_name = uploaded.file.name + ".mp4"
+        os.link(
+            os.path.join(self.media, uploaded.file.name),
+            os.path.join(self.media, old_name),
+        )
+
+        self.assertEqual(
+            self.storage.adopt(old_name),
+            (uploaded.file.name, uploaded.sha256, 6),
+        )
+
+
+class MediaGarbageCollectionTests(VideoFileTestCase):
+    """
+    gc_media deletes files no row references once they are older than the
+    grace period, and only lists them in dry-run mode.
+    """
+
+    def write(self, name: str, age: int) -> str:
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as media_file:
+            media_file.write(name.encode())
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+        return name
+
+    def gc_media(self, *args) -> str:
+        stdout = io.StringIO()
+        call_command(
+            "gc_media", "--grace-period", "3600", *args, stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def test_dry_run_and_grace_period(self):
+        referenced = self.upload(b"frames").file.name
+        os.utime(os.path.join(self.media, referenced), (0, 0))
+        legacy = self.write("videos/legacy.mp4", age=7200)
+        videos_models.VideoFile.objects.bulk_create([
+            videos_models.VideoFile(
+                video=self.video, file=legacy, quality="FHD"
+            ),
+        ])
+        orphans = [
+            self.write("videos/orphan.mp4", age=7200),
+            self.write("videos/ab/cd/" + "ab" * 32 + ".mp4", age=7200),
+        ]
+        young = self.write("videos/young.mp4", age=60)
+        kept = sorted([referenced, legacy, young])
+
+        output = self.gc_media("--dry-run")
+        for orphan in orphans:
+            self.assertIn(orphan, output)
+        for name in kept:
+            self.assertNotIn(name, output)
+        self.assertEqual(self.stored_files(), sorted(kept + orphans))
+
+        self.gc_media()
+        self.assertEqual(self.stored_files(), kept)
+
+    def test_references_use_indexes(self):
+        videos_models.VideoFile.objects.bulk_create(
+            videos_models.VideoFile(
+                video=self.video, file=f"videos/legacy{i}.mp4", quality="HD"
+            )
+            for i in range(3)
+        )
+        self.assertEqual(
+            videos_services.VideoFileMedia.references(
+                ["videos/legacy1.mp4", "videos/missing.mp4"]
+            ),
+            {"videos/legacy1.mp4": 1},
+        )
+        if connection.vendor != "postgresql":
+            return
+        with CaptureQueriesContext(connection) as queries:
+            videos_services.VideoFileMedia.references(["videos/legacy1.mp4"])
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + queries[0]["sql"])
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("videos_videofile_file_", plan)
+
+
+def box(kind: str, *payloads: bytes) -> bytes:
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), kind.encode()) + payload
+
+
+def fragmented_mp4(
+    timescale: int = 90_000,
+    sample_duration: int = 3000,
+    fragments: int = 3,
+    samples: int = 30,
+) -> bytes:
+    """
+    Build a minimal fragmented MP4 with one 1280x720 H.264 track whose
+    fragments hold ``samples`` samples of ``sample_duration`` ticks.
+    """
+    avc1 = box(
+        "avc1",
+        bytes(24) + struct.pack(">HH", 1280, 720) + bytes(50),
+        box("avcC", bytes.fromhex("0164001f")),
+    )
+    moov = box(
+        "moov",
+        box(
+            "trak",
+            box("tkhd", bytes(12) + struct.pack(">I", 1) + bytes(68)),
+            box(
+                "mdia",
+                box(
+                    "mdhd", bytes(12) + struct.pack(">I", timescale) + bytes(8)
+                ),
+                box("hdlr", bytes(8) + b"vide" + bytes(12)),
+                box("minf", box("stbl", box(
+                    "stsd", struct.pack(">II", 0, 1), avc1
+                ))),
+            ),
+        ),
+        box("mvex", box(
+            "trex",
+            struct.pack(">IIIIII", 0, 1, 1, sample_duration, 0, 0),
+        )),
+    )
+    fragment = box(
+        "moof",
+        box(
+            "traf",
+            box("tfhd", struct.pack(">II", 0, 1)),
+            box("trun", struct.pack(">II", 0, samples)),
+        ),
+    ) + box("mdat", bytes(1000))
+    return box("ftyp", b"isom" + bytes(4)) + moov + fragment * fragments
+
+
+class VideoManifestTests(VideoFileTestCase):
+    """
+    HLS and DASH manifests address the fragments of every file by byte
+    range and are revalidated with ETags.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.file = self.upload(fragmented_mp4())
+
+    def test_manifests(self):
+        response = self.client.get(f"/v1/videos/{self.video.id}/manifest.m3u8")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["Content-Type"], "application/vnd.apple.mpegurl"
+        )
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn(
+            "RESOLUTION=1280x720,CODECS=\"avc1.64001F\"",
+            response.content.decode(),
+        )
+
+        response = self.client.get(
+            f"/v1/videos/{self.video.id}/files/{self.file.id}/playlist.m3u8"
+        )
+        playlist = response.content.decode()
+        self.assertEqual(playlist.count("#EXTINF:1.000,"), 3)
+        self.assertIn("#EXT-X-TARGETDURATION:1", playlist)
+
+        response = self.client.get(f"/v1/videos/{self.video.id}/manifest.mpd")
+        self.assertEqual(response["Content-Type"], "application/dash+xml")
+        manifest = response.content.decode()
+        self.assertIn('mediaPresentationDuration="PT3.000S"', manifest)
+        self.assertEqual(manifest.count('<S d="90000"/>'), 3)
+
+    def test_etag_revalidation(self):
+        url = f"/v1/videos/{self.video.id}/manifest.mpd"
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        self.upload(fragmented_mp4(samples=60))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.content.decode().count("<Representation"), 2)
+
+    def test_files_without_durations_are_skipped(self):
+        for content in (
+            fragmented_mp4(timescale=0),
+            fragmented_mp4(sample_duration=0),
+        ):
+            path = os.path.join(self.media, "broken.mp4")
+            with open(path, "wb") as broken:
+                broken.write(content)
+            with self.assertRaises(videos_streaming.SegmentIndexError):
+                videos_streaming.read_segment_index(path)
+
+        self.file.delete()
+        broken = self.upload(fragmented_mp4(sample_duration=0))
+        for path in ("manifest.m3u8", "manifest.mpd"):
+            response = self.client.get(f"/v1/videos/{self.video.id}/{path}")
+            self.assertEqual(response.status_code, 404)
+        broken.refresh_from_db()
+        self.assertIn("error", broken.segment_index)
+
+
+class OutboxConsumerTestMixin:
+    """
+    Appends outbox events and delivers them to a recording consumer.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.delivered = []
+        self.consumer = videos_events.Consumer(
+            "test", self.delivered.extend, batch_size=2
+        )
+        # Последовательность id не сбрасывается между тестами
+        videos_models.OutboxCheckpoint.objects.create(
+            consumer=self.consumer.checkpoint, position=self.append(0).id
+        )
+
+    def append(self, video_id: int) -> videos_models.OutboxEvent:
+        return videos_models.OutboxEvent.objects.create(
+            kind=videos_models.OutboxEvent.LIKE_CREATED,
+            video_id=video_id, owner_id=1, occurred_at=timezone.now(),
+        )
+
+    def delivered_ids(self) -> list[int]:
+        return [event.video_id for event in self.delivered]
+
+    def position(self) -> int:
+        return videos_models.OutboxCheckpoint.objects.get(
+            consumer=self.consumer.checkpoint
+        ).position
+
+
+@override_settings(OUTBOX_SETTLE_SECONDS=60)
+class OutboxConsumerTests(OutboxConsumerTestMixin, TestCase):
+    """
+    Consumers deliver events in id order and in batches, advance their
+    checkpoint with the handler's transaction and wait for young gaps.
+    """
+
+    def test_checkpoint(self):
+        events = [self.append(video_id) for video_id in range(1, 6)]
+        self.assertEqual(self.consumer.process_batch(), 2)
+        self.assertEqual(self.position(), events[1].id)
+
+        def failing(batch):
+            raise RuntimeError("handler failed")
+
+        self.consumer.handler = failing
+        with self.assertRaises(RuntimeError):
+            self.consumer.process_batch()
+        self.assertEqual(self.position(), events[1].id)
+
+        self.consumer.handler = self.delivered.extend
+        while self.consumer.process_batch():
+            pass
+        self.assertEqual(self.delivered_ids(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.position(), events[-1].id)
+        self.assertEqual(self.consumer.process_batch(), 0)
+
+    def test_gaps(self):
+        self.append(1)
+        self.append(2).delete()
+        self.append(3).delete()
+        after_gap = self.append(4)
+
+        self.assertEqual(self.consumer.process_batch(), 1)
+        self.assertEqual(self.consumer.process_batch(), 0)
+        self.assertEqual(self.delivered_ids(), [1])
+
+        videos_models.OutboxEvent.objects.filter(id=after_gap.id).update(
+            created_at=timezone.now() - timedelta(minutes=2)
+        )
+        with self.assertLogs("videos.events", "WARNING") as logs:
+            self.assertEqual(self.consumer.process_batch(), 1)
+        self.assertIn(f"{after_gap.id - 2}-{after_gap.id - 1}", logs.output[0])
+        self.assertEqual(self.consumer.skipped, 2)
+        self.assertEqual(self.delivered_ids(), [1, 4])
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "Transaction ids are read on PostgreSQL"
+)
+@override_settings(OUTBOX_SETTLE_SECONDS=0)
+class OutboxGapVisibilityTests(OutboxConsumerTestMixin, TransactionTestCase):
+    """
+    A settled gap is not skipped while the transaction holding its id may
+    still commit.
+    """
+
+    def test_gap_of_running_transaction_is_waited_for(self):
+        appended, release = threading.Event(), threading.Event()
+
+        def slow_transaction():
+            try:
+                with transaction.atomic():
+                    self.append(2)
+                    appended.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        self.append(1)
+        thread = threading.Thread(target=slow_transaction)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        appended.wait(10)
+        self.append(3)
+
+        while self.consumer.process_batch():
+            pass
+        self.assertEqual(self.delivered_ids(), [1])
+
+        release.set()
+        thread.join()
+        while self.consumer.process_batch():
+            pass
+        self.assertEqual(self.delivered_ids(), [1, 2, 3])
+        self.assertEqual(self.consumer.skipped, 0)
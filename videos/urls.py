@@ -13,6 +13,16 @@ urlpatterns = [
         videos_views.VideoIDsView.as_view(),
         name="video-ids"
     ),
+    path(
+        "like-counts/",
+        videos_views.VideoLikeCountsView.as_view(),
+        name="video-like-counts"
+    ),
+    path(
+        "publish/",
+        videos_views.VideoPublicationView.as_view(),
+        name="video-publish"
+    ),
     path(
         "statistics-subquery/",
         videos_views.StatisticsSubqueryView.as_view(),
@@ -23,6 +33,11 @@ urlpatterns = [
         videos_views.StatisticsGroupByView.as_view(),
         name="video-statistics-group-by"
     ),
+    path(
+        "statistics-owners/",
+        videos_views.OwnerStatisticsView.as_view(),
+        name="video-statistics-owners"
+    ),
     path(
         "",
         include(router.urls)
@@ -32,5 +47,25 @@ urlpatterns = [
         videos_views.VideoLikeView.as_view(),
         name="video-likes"
     ),
+    path(
+        "<int:video_id>/related/",
+        videos_views.RelatedVideosView.as_view(),
+        name="video-related"
+    ),
+    path(
+        "<int:video_id>/manifest.m3u8",
+        videos_views.HLSMasterPlaylistView.as_view(),
+        name="video-hls-manifest"
+    ),
+    path(
+        "<int:video_id>/files/<int:file_id>/playlist.m3u8",
+        videos_views.HLSMediaPlaylistView.as_view(),
+        name="video-hls-playlist"
+    ),
+    path(
+        "<int:video_id>/manifest.mpd",
+        videos_views.DASHManifestView.as_view(),
+        name="video-dash-manifest"
+    ),
 ]
 
@@ -1,17 +1,34 @@
+import hashlib
+from abc import ABC, abstractmethod
+
 from rest_framework import generics, status, mixins, viewsets
+from rest_framework.exceptions import NotFound
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db.models import F, Q, Sum, Subquery, OuterRef
 from django.db import transaction, IntegrityError
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django_filters.rest_framework import DjangoFilterBackend
 
 from accounts import models as accounts_models
+from video_project import renderers as project_renderers
 from videos import (
+    analytics as videos_analytics,
+    bitmap as videos_bitmap,
+    filters as videos_filters,
     models as videos_models,
+    pagination as videos_pagination,
     permissions as videos_permissions,
     serializers as videos_serializers,
-    services as videos_services
+    services as videos_services,
+    sharding as videos_sharding,
+    streaming as videos_streaming,
 )
 
 
@@ -23,22 +40,71 @@ class VideoView(viewsets.ReadOnlyModelViewSet):
         - Staff users can see all videos.
         - Authenticated users can see published videos or their own videos.
         - Anonymous users can see only published videos.
+
+    Filtering and ordering are limited to fields backed by Video indexes,
+    see VideoFilter and VideoOrderingFilter. With ``ids`` the list is a
+    multi-get: an unpaginated list of the requested visible videos.
     """
 
-    queryset = videos_models.Video.objects.all()
+    queryset = videos_models.Video.objects.alive().select_related(
+        'owner'
+    ).prefetch_related('files')
     serializer_class = videos_serializers.VideoSerializer
     permission_classes = [videos_permissions.IsOwnerOrPublished]
+    filter_backends = [
+        DjangoFilterBackend, videos_filters.VideoOrderingFilter
+    ]
+    filterset_class = videos_filters.VideoFilter
+    ordering_fields = ['total_likes', 'created_at']
+    ordering = ['-created_at']
 
     def get_queryset(self):
-        user = self.request.user
-
-        if user.is_staff:
+        # Schema generation runs without a request
+        if getattr(self, 'swagger_fake_view', False):
             return self.queryset
 
-        if user.is_authenticated:
-            return self.queryset.filter(Q(is_published=True) | Q(owner=user))
+        return self.queryset.visible_to(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Анонимным пользователям видны только опубликованные видео
+        if (
+            not request.user.is_authenticated
+            and kwargs['pk'].isdigit()
+            and videos_bitmap.is_published(int(kwargs['pk'])) is False
+        ):
+            raise NotFound()
+        return super().retrieve(request, *args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        if self.request.query_params.get('ids'):
+            return None
+        return super().paginate_queryset(queryset)
+
+
+class VideoLikeCountsView(APIView):
+    """
+    API view returning only like counts of several videos, for polling.
+
+    Permissions:
+        - Same visibility rules as the video list; invisible or unknown
+          ids are left out of the response.
+    """
+
+    def get(self, request: Request) -> Response:
+        """
+        Handle GET request with ``ids=1,2,3``.
 
-        return self.queryset.filter(is_published=True)
+        Returns:
+            Response: ``{"<id>": total_likes}`` for visible videos.
+        """
+        serializer = videos_serializers.VideoIdsSerializer(
+            data=request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        counts = videos_services.LikeCounts.for_user(
+            serializer.validated_data['ids'], request.user
+        )
+        return Response(counts)
 
 
 class VideoLikeView(APIView):
@@ -47,9 +113,21 @@ class VideoLikeView(APIView):
 
     Permissions:
         - Only authenticated users can like or unlike videos.
+
+    Likes of a video whose like shard bucket is being moved are answered
+    with 503 and ``Retry-After``.
     """
     permission_classes = [IsAuthenticated]
 
+    def shard_unavailable(self) -> Response:
+        return Response(
+            {"detail": "Likes of this video are being moved, retry later."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(
+                max(1, round(settings.LIKE_SHARD_MAP_SECONDS))
+            )},
+        )
+
     def get_video(self, video_id: int) -> videos_models.Video | None:
         """
         Retrieve a published video by its ID.
@@ -61,8 +139,10 @@ class VideoLikeView(APIView):
             videos_models.Video | None: Video object if found and published,
             None otherwise.
         """
-        return videos_models.Video.objects.filter(
-            id=video_id, is_published=True
+        if videos_bitmap.is_published(video_id) is False:
+            return None
+        return videos_models.Video.objects.published().filter(
+            id=video_id
         ).first()
 
     def post(self, request: Request, video_id: int) -> Response:
@@ -85,7 +165,10 @@ class VideoLikeView(APIView):
         like_manager = videos_services.VideoLikeManager(
             user=request.user, video=video
         )
-        result = like_manager.like()
+        try:
+            result = like_manager.like()
+        except videos_sharding.ShardUnavailable:
+            return self.shard_unavailable()
 
         serializer = videos_serializers.LikeResultSerializer(result)
         status_code = (
@@ -115,17 +198,106 @@ class VideoLikeView(APIView):
         like_manager = videos_services.VideoLikeManager(
             user=request.user, video=video
         )
-        result = like_manager.unlike()
+        try:
+            result = like_manager.unlike()
+        except videos_sharding.ShardUnavailable:
+            return self.shard_unavailable()
 
         if result.get("deleted"):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
+class RelatedVideosView(APIView):
+    """
+    API view to list the videos liked by the same users as a published
+    video.
+
+    Related videos are precomputed by ``videos.recommendations`` and read
+    with one query over the rank index; only published related videos are
+    listed.
+    """
+
+    def get(self, request: Request, video_id: int) -> Response:
+        """
+        Handle GET request to return the related videos of a video.
+
+        Args:
+            request (Request): DRF request object.
+            video_id (int): ID of the video.
+
+        Returns:
+            Response: Related videos in rank order, 404 if the video is not
+            published.
+        """
+        if videos_bitmap.is_published(video_id) is False:
+            raise NotFound()
+        related = list(
+            videos_models.RelatedVideo.objects.filter(
+                video_id=video_id,
+                video__is_published=True,
+                video__deleted_at__isnull=True,
+                related__is_published=True,
+                related__deleted_at__isnull=True,
+            )
+            .select_related('related__owner')
+            .order_by('rank')
+        )
+        if not related and not videos_models.Video.objects.published(
+        ).filter(id=video_id).exists():
+            raise NotFound()
+        serializer = videos_serializers.RelatedVideoSerializer(
+            related, many=True
+        )
+        return Response(serializer.data)
+
+
+class MyLikesView(APIView):
+    """
+    API view to list the published videos liked by the requesting user,
+    newest like first.
+
+    Pages are keyset pages (``videos.pagination.LikeKeysetPagination``):
+    follow ``next`` to continue.
+
+    Permissions:
+        - Only authenticated users can list their likes.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = videos_pagination.LikeKeysetPagination
+
+    def get(self, request: Request) -> Response:
+        """
+        Handle GET request to return a page of liked videos.
+
+        Args:
+            request (Request): DRF request with optional ``cursor`` and
+                ``per_page`` query parameters.
+
+        Returns:
+            Response: Liked videos with the time of the like and the link
+            to the next page.
+        """
+        paginator = self.pagination_class()
+        videos, next_key = videos_services.LikedVideos(request.user).page(
+            paginator.decode_cursor(request),
+            paginator.get_page_size(request),
+        )
+        serializer = videos_serializers.LikedVideoSerializer(
+            videos, many=True
+        )
+        return paginator.get_paginated_response(
+            request, serializer.data, next_key
+        )
+
+
 class VideoIDsView(generics.ListAPIView):
     """
     API view to list the IDs of all published videos.
 
+    The rendered body is cached for ``PAYLOAD_CACHE_SECONDS`` together
+    with its compressed encodings (``video_project.renderers``).
+
     Permissions:
         - Only staff users can access this view.
 
@@ -136,14 +308,94 @@ class VideoIDsView(generics.ListAPIView):
     """
     permission_classes = [videos_permissions.IsStaff]
     serializer_class = videos_serializers.VideoIDSerializer
-    queryset = videos_models.Video.objects.filter(is_published=True)
+    queryset = videos_models.Video.objects.published().select_related(
+        'owner'
+    ).only('id', 'owner__username')
     pagination_class = None
 
+    def list(self, request: Request, *args, **kwargs):
+        """
+        List the IDs, serving the rendered list from the payload cache.
+        """
+        return project_renderers.cached_response(
+            self, request,
+            lambda: self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True
+            ).data,
+        )
+
+
+class VideoPublicationView(APIView):
+    """
+    API view to publish or unpublish many videos at once.
+
+    Permissions:
+        - Only staff users can access this view.
+    """
+    permission_classes = [videos_permissions.IsStaff]
+
+    def post(self, request: Request) -> Response:
+        """
+        Handle POST request with ``ids`` or ``owner`` and ``is_published``.
+
+        Deleted videos and videos already in the requested state are left
+        alone.
+
+        Args:
+            request (Request): DRF request object.
+
+        Returns:
+            Response: Number of videos whose state changed.
+        """
+        serializer = videos_serializers.VideoPublicationSerializer(
+            data=request.data
+        )
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if 'ids' in data:
+            videos = videos_models.Video.objects.filter(id__in=data['ids'])
+        else:
+            videos = videos_models.Video.objects.filter(owner_id=data['owner'])
+        updated = videos_services.VideoPublication().set_published(
+            videos, data['is_published']
+        )
+        return Response({'updated': updated})
+
+
+def get_statistics_window(request: Request) -> Q | None:
+    """
+    Build the rollup filter for the requested statistics window.
+
+    Args:
+        request (Request): DRF request with optional ``from``/``to`` query
+            parameters.
+
+    Raises:
+        ValidationError: If the parameters are invalid.
+
+    Returns:
+        Q | None: Filter selecting the rollup buckets covering the window,
+        or None when no window was requested.
+    """
+    serializer = videos_serializers.StatisticsWindowSerializer(
+        data=request.query_params
+    )
+    serializer.is_valid(raise_exception=True)
+    if not serializer.validated_data:
+        return None
+    return videos_services.LikeRollups.window(
+        serializer.validated_data.get('from'),
+        serializer.validated_data.get('to'),
+    )
+
 
 class StatisticsSubqueryView(APIView):
     """
     API view to retrieve user statistics using a subquery approach.
 
+    The rendered body is cached for ``PAYLOAD_CACHE_SECONDS`` together
+    with its compressed encodings (``video_project.renderers``).
+
     Permissions:
         - Only staff users can access this view.
     """
@@ -153,23 +405,44 @@ class StatisticsSubqueryView(APIView):
         """
         Handle GET request to return user statistics.
 
+        Lifetime sums are computed from Video.total_likes. When ``from``
+        and/or ``to`` query parameters are given, likes within the window
+        are read from like rollups; likes on hidden videos are not
+        counted in either case.
+
         Args:
             request (Request): DRF request object.
 
         Returns:
             Response: DRF Response containing serialized statistics data.
         """
-        videos = videos_models.Video.objects.filter(is_published=True)
-        users = accounts_models.User.objects.all()
-        qs = videos_services.StatisticsSubquery(users, videos).get_stats()
-        data = videos_serializers.StatisticsSerializer(qs, many=True).data
-        return Response(data)
+        window = get_statistics_window(request)
+
+        def build():
+            users = accounts_models.User.objects.filter(
+                deleted_at__isnull=True
+            )
+            if window is not None:
+                qs = videos_services.RollupStatisticsSubquery(
+                    users, window
+                ).get_stats()
+            else:
+                videos = videos_models.Video.objects.published()
+                qs = videos_services.StatisticsSubquery(
+                    users, videos
+                ).get_stats()
+            return videos_serializers.StatisticsSerializer(qs, many=True).data
+
+        return project_renderers.cached_response(self, request, build)
 
 
 class StatisticsGroupByView(APIView):
     """
     API view to retrieve user statistics grouped by video owners.
 
+    The rendered body is cached for ``PAYLOAD_CACHE_SECONDS`` together
+    with its compressed encodings (``video_project.renderers``).
+
     Permissions:
         - Only staff users can access this view.
     """
@@ -179,13 +452,212 @@ class StatisticsGroupByView(APIView):
         """
         Handle GET request to return user statistics grouped by video owners.
 
+        Lifetime sums are computed from Video.total_likes. When ``from``
+        and/or ``to`` query parameters are given, likes within the window
+        are read from like rollups; likes on hidden videos are not
+        counted in either case.
+
         Args:
             request (Request): DRF request object.
 
         Returns:
             Response: DRF Response containing serialized statistics data.
         """
-        videos = videos_models.Video.objects.filter(is_published=True)
-        qs = videos_services.StatisticsGroupBy(videos).get_stats()
-        data = videos_serializers.StatisticsSerializer(qs, many=True).data
-        return Response(data)
+        window = get_statistics_window(request)
+
+        def build():
+            engine = videos_analytics.get_engine()
+            if window is not None:
+                qs = videos_services.RollupStatisticsGroupBy(
+                    window
+                ).get_stats()
+            elif engine is not None:
+                qs = videos_analytics.EngineStatisticsGroupBy(
+                    engine
+                ).get_stats()
+            else:
+                videos = videos_models.Video.objects.published()
+                qs = videos_services.StatisticsGroupBy(videos).get_stats()
+            return videos_serializers.StatisticsSerializer(qs, many=True).data
+
+        return project_renderers.cached_response(self, request, build)
+
+
+class OwnerStatisticsView(APIView):
+    """
+    API view to retrieve the distribution of likes over video owners.
+
+    Served from the in-process snapshot of ``videos.analytics``; answers
+    404 when ``OWNER_STATS_ENGINE`` is disabled or NumPy is not installed.
+
+    Permissions:
+        - Only staff users can access this view.
+    """
+    permission_classes = [videos_permissions.IsStaff]
+
+    def get(self, request: Request) -> Response:
+        """
+        Handle GET request to return owner statistics.
+
+        Args:
+            request (Request): DRF request with optional ``top``,
+                ``percentiles`` and ``bins`` query parameters.
+
+        Returns:
+            Response: Top owners with the percentile rank of their likes
+            sum, percentiles and a histogram of per-owner likes sums.
+        """
+        engine = videos_analytics.get_engine()
+        if engine is None:
+            raise NotFound("Owner statistics engine is disabled.")
+        serializer = videos_serializers.OwnerStatisticsQuerySerializer(
+            data=request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+
+        snapshot = engine.snapshot()
+        owner_ids, sums, videos = snapshot.top(query['top'])
+        usernames = engine.usernames(owner_ids)
+        ranks = snapshot.percentile_ranks(sums)
+        counts, edges = snapshot.histogram(query['bins'])
+        return Response({
+            'owners': len(snapshot.sorted_sums),
+            'top': [
+                {
+                    'username': usernames.get(owner_id),
+                    'likes_sum': likes_sum,
+                    'videos': video_count,
+                    'percentile_rank': rank,
+                }
+                for owner_id, likes_sum, video_count, rank in zip(
+                    owner_ids.tolist(), sums.tolist(), videos.tolist(), ranks
+                )
+            ],
+            'percentiles': dict(zip(
+                map(str, query['percentiles']),
+                snapshot.percentiles(query['percentiles']),
+            )),
+            'histogram': {'counts': counts, 'edges': edges},
+        })
+
+
+class VideoManifestView(ABC, APIView):
+    """
+    Base view for adaptive streaming manifests of a video.
+
+    Every fragmented MP4 file of the video becomes one rendition whose
+    segments are addressed by byte ranges. Responses carry an ETag derived
+    from the files, so clients and proxies may cache them; adding, replacing
+    or removing a file changes the ETag.
+
+    Permissions:
+        - Same visibility rules as the video detail endpoint.
+    """
+    content_type = None
+
+    def get_files(self, request: Request, video_id: int, file_id=None):
+        video = get_object_or_404(
+            videos_models.Video.objects.visible_to(request.user),
+            id=video_id,
+        )
+        files = video.files.order_by("id")
+        if file_id is not None:
+            files = files.filter(id=file_id)
+        files = list(files)
+        if not files:
+            raise NotFound("Video has no files.")
+        return video, files
+
+    def get_renditions(
+        self, request: Request, files
+    ) -> list[tuple[videos_models.VideoFile, videos_streaming.Rendition]]:
+        renditions = []
+        for video_file in files:
+            index = videos_services.VideoFileMedia.segment_index(video_file)
+            if "error" in index:
+                continue
+            renditions.append((video_file, videos_streaming.Rendition(
+                video_file.quality,
+                request.build_absolute_uri(video_file.file.url),
+                index,
+            )))
+        if not renditions:
+            raise NotFound("Video has no fragmented MP4 files.")
+        return renditions
+
+    @abstractmethod
+    def render_manifest(self, request: Request, video_id: int, files) -> str:
+        """
+        Render the manifest body of the requested files.
+        """
+
+    def get(self, request: Request, video_id: int, file_id=None):
+        """
+        Return the manifest, or 304 when the client's copy is current.
+        """
+        video, files = self.get_files(request, video_id, file_id)
+        version = "|".join(
+            f"{video_file.id}:{video_file.file.name}:"
+            f"{video_file.updated_at.isoformat()}"
+            for video_file in files
+        )
+        etag = '"{}"'.format(hashlib.md5(
+            f"{request.path}|{version}".encode()
+        ).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                self.render_manifest(request, video_id, files),
+                content_type=self.content_type,
+            )
+        response["ETag"] = etag
+        visibility = {"public": True} if video.is_published else {
+            "private": True
+        }
+        patch_cache_control(
+            response, max_age=settings.MANIFEST_CACHE_SECONDS, **visibility
+        )
+        return response
+
+
+class HLSMasterPlaylistView(VideoManifestView):
+    """
+    HLS master playlist listing one variant per quality.
+    """
+    content_type = "application/vnd.apple.mpegurl"
+
+    def render_manifest(self, request: Request, video_id: int, files) -> str:
+        variants = [
+            (rendition, request.build_absolute_uri(reverse(
+                "video-hls-playlist",
+                kwargs={"video_id": video_id, "file_id": video_file.id},
+            )))
+            for video_file, rendition in self.get_renditions(request, files)
+        ]
+        return videos_streaming.hls_master_playlist(variants)
+
+
+class HLSMediaPlaylistView(VideoManifestView):
+    """
+    HLS media playlist of a single quality.
+    """
+    content_type = "application/vnd.apple.mpegurl"
+
+    def render_manifest(self, request: Request, video_id: int, files) -> str:
+        (_, rendition), = self.get_renditions(request, files)
+        return videos_streaming.hls_media_playlist(rendition)
+
+
+class DASHManifestView(VideoManifestView):
+    """
+    MPEG-DASH manifest with one representation per quality.
+    """
+    content_type = "application/dash+xml"
+
+    def render_manifest(self, request: Request, video_id: int, files) -> str:
+        return videos_streaming.dash_manifest([
+            rendition
+            for _, rendition in self.get_renditions(request, files)
+        ])